@@ -0,0 +1,68 @@
+"""Check that SAE activations computed from float16 / int8 cached embeddings match float32 ones,
+and report the cache size and lookup time of each storage dtype.
+
+Usage:
+    python benchmarks/benchmark_cache_quantization.py --embeddings embeddings.npy --m 256 --k 8
+    python benchmarks/benchmark_cache_quantization.py  # TF-IDF + SVD embeddings of the demo Reddit posts
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from hypothesaes.embedding_cache import EmbeddingCache
+from hypothesaes.quickstart import train_sae
+
+
+def demo_embeddings(dim):
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    texts = pd.read_csv("demo-data/reddit-depression-train.csv")["text"].tolist()
+    X = TruncatedSVD(dim, random_state=0).fit_transform(TfidfVectorizer(min_df=3).fit_transform(texts))
+    return (X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-8)).astype(np.float32)
+
+
+def cache_size(cache_dir):
+    return sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.is_file())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", default=None, help=".npy file of embeddings (default: demo TF-IDF + SVD)")
+    parser.add_argument("--dim", type=int, default=256, help="Dimension of the demo embeddings")
+    parser.add_argument("--m", type=int, default=256)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--n-epochs", type=int, default=20)
+    args = parser.parse_args()
+
+    X = np.load(args.embeddings).astype(np.float32) if args.embeddings else demo_embeddings(args.dim)
+    texts = [f"text {i}" for i in range(len(X))]
+    sae = train_sae(X, M=args.m, K=args.k, n_epochs=args.n_epochs, show_progress=False)
+    reference = sae.get_activations(X, show_progress=False)
+    reference_topk = np.argsort(-reference, axis=1)[:, :args.k]
+
+    for dtype in ["float32", "float16", "int8"]:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = EmbeddingCache(cache_dir, dtype=dtype)
+            cache.add(texts, X)
+            start_time = time.perf_counter()
+            X_cached, _ = EmbeddingCache(cache_dir).get(texts)
+            elapsed = time.perf_counter() - start_time
+            n_bytes = cache_size(cache_dir)
+
+        activations = sae.get_activations(X_cached, show_progress=False)
+        correlation = np.corrcoef(reference.ravel(), activations.ravel())[0, 1]
+        topk = np.argsort(-activations, axis=1)[:, :args.k]
+        recall = np.mean([len(np.intersect1d(a, b)) / args.k for a, b in zip(reference_topk, topk)])
+        print(
+            f"{dtype:>8}: {n_bytes / 2**20:8.1f} MiB, lookup {elapsed * 1000:7.1f} ms, "
+            f"activation correlation {correlation:.5f}, top-{args.k} neuron recall {recall:.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark local embedding throughput: input-order batches vs. length-sorted batches over worker processes,
+with the fp32 torch backend and the int8 ONNX backend (whose agreement with fp32 is also reported).
+
+Usage:
+    python benchmarks/benchmark_local_embedding.py --model sentence-transformers/all-MiniLM-L6-v2 --n-processes 1 4 16
+    python benchmarks/benchmark_local_embedding.py --model nomic-ai/modernbert-embed-base --backends torch onnx-int8
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+
+from hypothesaes.embedding import get_local_embedding_matrix, export_quantized_model
+
+DEMO_FILES = [
+    ("demo-data/reddit-depression-train.csv", "text"),
+    ("demo-data/reddit-depression-test.csv", "text"),
+]
+
+
+def run_input_order(texts, model, batch_size):
+    """The previous path: one process, batches of `batch_size` texts in input order."""
+    transformer_model = SentenceTransformer(model, device="cpu")
+    start_time = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        transformer_model.encode(texts[i:i + batch_size], batch_size=batch_size, show_progress_bar=False)
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--n-processes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--backends", nargs="+", default=["torch"], choices=["torch", "onnx-int8"])
+    parser.add_argument("--quantization-config", default="avx2")
+    parser.add_argument("--n-texts", type=int, default=None, help="Use only the first N texts")
+    args = parser.parse_args()
+
+    texts = [text for path, column in DEMO_FILES for text in pd.read_csv(path)[column].tolist()][:args.n_texts]
+    print(f"{len(texts)} texts from {', '.join(path for path, _ in DEMO_FILES)}; {os.cpu_count()} CPUs")
+    if "onnx-int8" in args.backends:
+        export_quantized_model(args.model, args.quantization_config)  # exclude the one-time export from the timings
+
+    elapsed = run_input_order(texts, args.model, args.batch_size)
+    print(f"{'input order, torch, 1 process':>40}: {len(texts) / elapsed:8.1f} texts/s")
+    embeddings = {}
+    for backend in args.backends:
+        for n_processes in args.n_processes:
+            # Includes loading the model in each worker process
+            start_time = time.perf_counter()
+            embeddings[backend], _ = get_local_embedding_matrix(
+                texts, model=args.model, batch_size=args.batch_size, show_progress=False,
+                n_processes=n_processes, backend=backend, quantization_config=args.quantization_config,
+            )
+            elapsed = time.perf_counter() - start_time
+            print(f"{f'length-sorted, {backend}, {n_processes} process(es)':>40}: {len(texts) / elapsed:8.1f} texts/s")
+
+    if "torch" in embeddings and "onnx-int8" in embeddings:
+        fp32, int8 = embeddings["torch"], embeddings["onnx-int8"]
+        cosine = np.sum(fp32 * int8, axis=1) / (np.linalg.norm(fp32, axis=1) * np.linalg.norm(int8, axis=1))
+        print(f"int8 vs fp32 cosine: mean {cosine.mean():.4f}, 1st percentile {np.percentile(cosine, 1):.4f}, min {cosine.min():.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,15 +8,34 @@ from .quickstart import (
     evaluate_hypotheses
 )
 
+from .sweep import train_sae_sweep
+
+from .distributed import fit_data_parallel
+
 from .sae import (
     SparseAutoencoder,
     load_model,
-    get_multiple_sae_activations
+    convert_checkpoint,
+    get_multiple_sae_activations,
+    FusedSAEEncoder
 )
 
+from .streaming import StreamingEmbeddingDataset
+
+from .activation_cache import ActivationCache, get_cached_sae_activations
+
+from .dedup import deduplicate_texts, TextDeduplication
+
 from .embedding import (
     get_openai_embeddings,
-    get_local_embeddings
+    get_local_embeddings,
+    get_openai_embedding_matrix,
+    get_local_embedding_matrix,
+    aget_openai_embeddings,
+    aget_openai_embedding_matrix,
+    export_quantized_model,
+    check_quantized_embeddings,
+    migrate_unnamespaced_embedding_cache
 )
 
 from .interpret_neurons import (
@@ -33,12 +52,16 @@ from .evaluation import score_hypotheses
 
 from .annotate import annotate_texts_with_concepts
 
+from .annotation_store import AnnotationStore, migrate_json_annotation_cache
+
 from .utils import get_text_for_printing
 
 # Define what gets imported with "from hypothesaes import *"
 __all__ = [
     # Main workflow functions
     "train_sae",
+    "train_sae_sweep",
+    "fit_data_parallel",
     "interpret_sae", 
     "generate_hypotheses", 
     "evaluate_hypotheses",
@@ -46,11 +69,25 @@ __all__ = [
     # Core classes
     "SparseAutoencoder",
     "load_model",
+    "convert_checkpoint",
     "get_multiple_sae_activations",
+    "FusedSAEEncoder",
+    "StreamingEmbeddingDataset",
+    "ActivationCache",
+    "get_cached_sae_activations",
+    "deduplicate_texts",
+    "TextDeduplication",
     
     # Embedding functions
     "get_openai_embeddings",
     "get_local_embeddings",
+    "get_openai_embedding_matrix",
+    "get_local_embedding_matrix",
+    "aget_openai_embeddings",
+    "aget_openai_embedding_matrix",
+    "export_quantized_model",
+    "check_quantized_embeddings",
+    "migrate_unnamespaced_embedding_cache",
     
     # Interpretation classes
     "NeuronInterpreter",
@@ -63,6 +100,8 @@ __all__ = [
     "select_neurons",
     "score_hypotheses",
     "annotate_texts_with_concepts",
+    "AnnotationStore",
+    "migrate_json_annotation_cache",
     
     # Utilities
     "get_text_for_printing"
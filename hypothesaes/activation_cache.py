@@ -0,0 +1,208 @@
+"""Disk-backed cache of SAE activations, keyed by the content of the SAEs and embeddings.
+
+Each entry is a directory named by a SHA-256 hash of the SAE configs and weights, the
+embedding matrix, and the output format. It holds `.npy` files (dense activations, or
+top-K indices and values) that are loaded with `mmap_mode="c"`, so a cache hit reads
+only the pages that are used and the returned arrays can be modified in memory without
+touching the cache. The cache is bounded in size: once it exceeds `max_bytes`, the
+least recently used entries are evicted.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .sae import ACTIVATION_OUTPUT_FORMATS, SparseAutoencoder, get_multiple_sae_activations, _to_float_tensor
+from .utils import TopKActivations, topk_to_sparse
+
+# Use environment variable for cache dir if set, otherwise use default
+ACTIVATION_CACHE_DIR = os.getenv("ACTIVATION_CACHE_DIR") or os.path.join(Path(__file__).parent.parent, "activation_cache")
+ACTIVATION_CACHE_MAX_BYTES = 8 * 2**30
+# Bump when the on-disk layout changes, so stale entries are never read
+_CACHE_FORMAT_VERSION = 1
+
+
+def _update_hash_with_array(hasher, array: np.ndarray) -> None:
+    array = np.ascontiguousarray(array)
+    hasher.update(f"{array.dtype.str}{array.shape}".encode())
+    hasher.update(memoryview(array).cast("B"))
+
+
+def hash_sae(sae: SparseAutoencoder, hasher=None) -> str:
+    """Return a SHA-256 hash of an SAE's config and weights."""
+    hasher = hasher if hasher is not None else hashlib.sha256()
+    hasher.update(json.dumps(sae.get_config(), sort_keys=True).encode())
+    for name, tensor in sorted(sae.state_dict().items()):
+        hasher.update(name.encode())
+        _update_hash_with_array(hasher, tensor.detach().cpu().numpy())
+    return hasher.hexdigest()
+
+
+def get_activation_cache_key(
+    sae_list: Union[SparseAutoencoder, List[SparseAutoencoder]],
+    X: Any,
+    output_format: str = "dense",
+) -> str:
+    """Return the cache key for the activations of `sae_list` on embeddings `X`."""
+    if not isinstance(sae_list, list):
+        sae_list = [sae_list]
+    hasher = hashlib.sha256(f"v{_CACHE_FORMAT_VERSION}|{output_format}|{len(sae_list)}".encode())
+    for sae in sae_list:
+        hash_sae(sae, hasher)
+    _update_hash_with_array(hasher, _to_float_tensor(X).numpy())
+    return hasher.hexdigest()
+
+
+class ActivationCache:
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = ACTIVATION_CACHE_MAX_BYTES) -> None:
+        """Content-addressed, size-bounded on-disk store of SAE activations.
+
+        Parameters
+        ----------
+        cache_dir : str | None, optional
+            Directory holding the cache entries (default: `ACTIVATION_CACHE_DIR`,
+            overridable with the `ACTIVATION_CACHE_DIR` environment variable).
+        max_bytes : int, optional
+            Total size above which least recently used entries are evicted.
+        """
+        self.cache_dir = cache_dir if cache_dir is not None else ACTIVATION_CACHE_DIR
+        self.max_bytes = max_bytes
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key: str) -> Optional[Tuple[Any, List[Tuple[int, int]]]]:
+        """Return (activations, neuron_source_sae_info) for `key`, or None on a miss."""
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if meta["output_format"] == "dense":
+                activations = np.load(os.path.join(entry_dir, "activations.npy"), mmap_mode="c")
+            else:
+                activations = TopKActivations(
+                    np.load(os.path.join(entry_dir, "topk_indices.npy"), mmap_mode="c"),
+                    np.load(os.path.join(entry_dir, "topk_values.npy"), mmap_mode="c"),
+                    sum(m for m, _ in meta["sae_sizes"]),
+                )
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: failed to read activation cache entry {entry_dir} ({e}); recomputing")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+        os.utime(meta_path)  # mark as recently used
+        neuron_source_sae_info = [
+            (m, k) for m, k in meta["sae_sizes"] for _ in range(m)
+        ]
+        return activations, neuron_source_sae_info
+
+    def put(self, key: str, activations: Any, sae_sizes: List[Tuple[int, int]], output_format: str) -> None:
+        """Store "dense" or "topk" activations under `key`, then evict down to `max_bytes`."""
+        if output_format == "dense":
+            arrays = {"activations.npy": activations}
+        else:
+            arrays = {"topk_indices.npy": activations[0], "topk_values.npy": activations[1]}
+        n_bytes = sum(array.nbytes for array in arrays.values())
+        if n_bytes > self.max_bytes:
+            print(f"Warning: activations ({n_bytes / 2**20:.0f} MiB) exceed the activation cache size limit; not caching")
+            return
+
+        # Write to a temporary directory and rename it into place, so readers never see partial entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, name), array)
+        meta = {
+            "output_format": output_format,
+            "sae_sizes": [list(size) for size in sae_sizes],
+            "created": time.time(),
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict_(keep=key)
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        """Return (last_used, n_bytes, path) of all complete entries."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, name)
+            meta_path = os.path.join(entry_dir, "meta.json")
+            if ".tmp-" in name or not os.path.exists(meta_path):
+                continue
+            n_bytes = sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+            entries.append((os.path.getmtime(meta_path), n_bytes, entry_dir))
+        return entries
+
+    def evict_(self, keep: Optional[str] = None) -> None:
+        """Delete least recently used entries until the cache fits in `max_bytes`."""
+        entries = sorted(self._entries())
+        total_bytes = sum(n_bytes for _, n_bytes, _ in entries)
+        keep_dir = self._entry_dir(keep) if keep is not None else None
+        for _, n_bytes, entry_dir in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if entry_dir == keep_dir:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_bytes -= n_bytes
+
+    def clear(self) -> None:
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+def get_cached_sae_activations(
+    sae_list: Union[SparseAutoencoder, List[SparseAutoencoder]],
+    X: Any,
+    *,
+    output_format: str = "dense",
+    cache: Optional[ActivationCache] = None,
+    **kwargs,
+) -> Tuple[Any, List[Tuple[int, int]]]:
+    """Return (activations, neuron_source_sae_info) like `get_multiple_sae_activations`, via the cache.
+
+    On a hit, activations are memory-mapped from disk instead of recomputed. Other keyword
+    arguments (e.g. `batch_size`, `show_progress`) are passed to `get_multiple_sae_activations`.
+    """
+    if output_format not in ACTIVATION_OUTPUT_FORMATS:
+        raise ValueError(f"output_format must be one of {ACTIVATION_OUTPUT_FORMATS}, got {output_format}")
+    if not isinstance(sae_list, list):
+        sae_list = [sae_list]
+    cache = cache if cache is not None else ActivationCache()
+    X = _to_float_tensor(X)
+
+    # csr/csc entries are stored as top-K, so they share entries with "topk"
+    stored_format = "dense" if output_format == "dense" else "topk"
+    key = get_activation_cache_key(sae_list, X, stored_format)
+    cached = cache.get(key)
+    if cached is not None:
+        activations, neuron_source_sae_info = cached
+        if output_format in ("csr", "csc"):
+            activations = topk_to_sparse(*activations, len(neuron_source_sae_info), format=output_format)
+        return activations, neuron_source_sae_info
+
+    activations, neuron_source_sae_info = get_multiple_sae_activations(
+        sae_list, X, return_neuron_source_info=True, output_format=stored_format, **kwargs
+    )
+    cache.put(key, activations, [(s.m_total_neurons, s.k_active_neurons) for s in sae_list], stored_format)
+    if output_format in ("csr", "csc"):
+        activations = topk_to_sparse(*activations, len(neuron_source_sae_info), format=output_format)
+    return activations, neuron_source_sae_info
@@ -5,41 +5,24 @@ from typing import List, Optional, Dict, Tuple
 import concurrent.futures
 from tqdm.auto import tqdm
 import os
-import json
 from pathlib import Path
 import time
 
 from .llm_api import get_completion
 from .utils import load_prompt, truncate_text
+from .dedup import TextDeduplication
+from .annotation_store import LEGACY_META_KEY, AnnotationStore, get_prompt_version, migrate_json_annotation_cache
 
 CACHE_DIR = os.path.join(Path(__file__).parent.parent, 'annotation_cache')
 DEFAULT_N_WORKERS = 30 
-
-def get_annotation_cache(cache_path: str) -> dict:
-    """Load cached annotations from JSON file."""
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print(f"Warning: Failed to parse cache file {cache_path}, starting fresh cache")
-            os.remove(cache_path)
-    return {}
-
-def save_annotation_cache(cache_path: str, cache: dict) -> None:
-    """Save annotations to JSON cache file."""
-    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
-    with open(cache_path, 'w') as f:
-        json.dump(cache, f)
-
-def generate_cache_key(concept: str, text: str) -> str:
-    """Generate a cache key for a given concept and text."""
-    return f"{concept}|||{text[:100]}...{text[-100:]}"
+DEFAULT_ANNOTATOR_MODEL = "gpt-4o-mini"
+# Number of new annotations written to the store per transaction
+STORE_WRITE_EVERY = 256
 
 def annotate_single_text(
     text: str,
     concept: str,
-    model: str = "gpt-4o-mini",
+    model: str = DEFAULT_ANNOTATOR_MODEL,
     max_words_per_example: Optional[int] = None,
     temperature: float = 0.0,
     max_retries: int = 3,
@@ -84,8 +67,8 @@ def annotate_single_text(
 def _parallel_annotate(
     tasks: List[Tuple[str, str]],
     n_workers: int,
-    cache: dict,
-    cache_path: Optional[str],
+    store: Optional[AnnotationStore],
+    store_namespace: Tuple[str, str],
     results: Dict[str, Dict[str, int]],
     progress_desc: str = "Annotating",
     show_progress: bool = True,
@@ -93,52 +76,73 @@ def _parallel_annotate(
 ) -> None:
     # Keep track of tasks that need to be retried
     retry_tasks = []
+    # Annotations not yet written to the store
+    pending = []
+
+    def record(text: str, concept: str, annotation: int) -> None:
+        results[concept][text] = annotation
+        if store is not None:
+            pending.append((text, concept, annotation))
+            if len(pending) >= STORE_WRITE_EVERY:
+                store.put_many(*store_namespace, pending)
+                pending.clear()
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
-        future_to_task = {
-            executor.submit(annotate_single_text, text=text, concept=concept, **kwargs): 
-            (text, concept)
-            for text, concept in tasks
-        }
-        
-        iterator = tqdm(concurrent.futures.as_completed(future_to_task), 
-                       total=len(tasks),
-                       desc=progress_desc,
-                       disable=not show_progress)
-        
-        for future in iterator:
-            text, concept = future_to_task[future]
-            try:
-                annotation, _ = future.result()
-                if concept not in results:
-                    results[concept] = {}
-                if annotation is not None:
-                    results[concept][text] = annotation
-                    if cache_path:
-                        cache[generate_cache_key(concept, text)] = annotation
-                else:
-                    # Failed annotation - retry this task
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+            future_to_task = {
+                executor.submit(annotate_single_text, text=text, concept=concept, **kwargs): 
+                (text, concept)
+                for text, concept in tasks
+            }
+            
+            iterator = tqdm(concurrent.futures.as_completed(future_to_task), 
+                           total=len(tasks),
+                           desc=progress_desc,
+                           disable=not show_progress)
+            
+            for future in iterator:
+                text, concept = future_to_task[future]
+                try:
+                    annotation, _ = future.result()
+                    if concept not in results:
+                        results[concept] = {}
+                    if annotation is not None:
+                        record(text, concept, annotation)
+                    else:
+                        # Failed annotation - retry this task
+                        retry_tasks.append((text, concept))
+                except Exception as e:
                     retry_tasks.append((text, concept))
-            except Exception as e:
-                retry_tasks.append((text, concept))
-                print(f"Failed to annotate text for concept '{concept}': {e}")
-    
-    # Retry failed tasks sequentially
-    if retry_tasks:
-        print(f"Retrying {len(retry_tasks)} failed tasks...")
-        for text, concept in retry_tasks:
-            try:
-                annotation, _ = annotate_single_text(text=text, concept=concept, **kwargs)
-                if concept not in results:
-                    results[concept] = {}
-                if annotation is not None:
-                    results[concept][text] = annotation
-                    if cache_path:
-                        cache[generate_cache_key(concept, text)] = annotation
-                else:
-                    print(f"Failed to annotate text for concept '{concept}' during retry - annotation is None")
-            except Exception as e:
-                print(f"Failed to annotate text for concept '{concept}' during retry: {e}")
+                    print(f"Failed to annotate text for concept '{concept}': {e}")
+        
+        # Retry failed tasks sequentially
+        if retry_tasks:
+            print(f"Retrying {len(retry_tasks)} failed tasks...")
+            for text, concept in retry_tasks:
+                try:
+                    annotation, _ = annotate_single_text(text=text, concept=concept, **kwargs)
+                    if concept not in results:
+                        results[concept] = {}
+                    if annotation is not None:
+                        record(text, concept, annotation)
+                    else:
+                        print(f"Failed to annotate text for concept '{concept}' during retry - annotation is None")
+                except Exception as e:
+                    print(f"Failed to annotate text for concept '{concept}' during retry: {e}")
+    finally:
+        # Keep finished annotations even if the run is interrupted
+        if store is not None:
+            store.put_many(*store_namespace, pending)
+
+def _migrate_legacy_cache(store: AnnotationStore, cache_path: str) -> None:
+    """Import the legacy JSON cache next to `cache_path` (if any) into the store, once."""
+    json_path = os.path.splitext(cache_path)[0] + ".json"
+    if json_path == cache_path or not os.path.exists(json_path):
+        return
+    meta_key = f"migrated:{os.path.abspath(json_path)}"
+    if store.get_meta(meta_key) is None:
+        migrate_json_annotation_cache(json_path, store)
+        store.set_meta(meta_key, str(os.path.getmtime(json_path)))
 
 def annotate(
     tasks: List[Tuple[str, str]],
@@ -150,9 +154,16 @@ def annotate(
     """
     Annotate a list of (text, concept) tasks.
     
+    Annotations are cached in an `AnnotationStore` (SQLite) keyed by the annotator model, the
+    prompt version, and hashes of the full concept and text; new annotations are written as
+    they arrive. A legacy JSON cache with the same path stem (e.g. `x.json` for `x.sqlite`) is
+    imported into the store the first time it is opened (see `migrate_json_annotation_cache`);
+    tasks not annotated under the current model and prompt are then looked up among the
+    legacy annotations, as the JSON cache did.
+    
     Args:
         tasks: List of (text, concept) tuples to annotate
-        cache_path: Path to cache file
+        cache_path: Path to the SQLite annotation store (a `.json` path is replaced by `.sqlite`)
         n_workers: Number of workers for parallel processing
         show_progress: Whether to show progress bar
         **kwargs: Additional arguments passed to annotate_single_text
@@ -160,18 +171,34 @@ def annotate(
     Returns:
         Dictionary mapping (text, concept) to annotation result
     """
-    # Load existing cache
-    cache = get_annotation_cache(cache_path) if cache_path else {}
     results = {}
-    uncached_tasks = []
+    tasks = list(dict.fromkeys(tasks))  # annotate repeated (text, concept) pairs once
+    for _, concept in tasks:
+        results.setdefault(concept, {})
+
+    store = None
+    store_namespace = (
+        kwargs.get("model", DEFAULT_ANNOTATOR_MODEL),
+        get_prompt_version("annotate", kwargs.get("max_words_per_example")),
+    )
+    cached = {}
+    if cache_path:
+        if cache_path.endswith(".json"):
+            cache_path = os.path.splitext(cache_path)[0] + ".sqlite"
+        store = AnnotationStore(cache_path)
+        _migrate_legacy_cache(store, cache_path)
+        cached = store.get_many(*store_namespace, tasks)
+        if store.get_meta(LEGACY_META_KEY) is not None:
+            legacy = store.get_many_legacy([task for task in tasks if task not in cached])
+            if legacy:
+                print(f"Using {len(legacy)} annotations from the legacy JSON cache")
+            cached.update(legacy)
 
     # Check cache and prepare uncached tasks
+    uncached_tasks = []
     for text, concept in tasks:
-        if concept not in results:
-            results[concept] = {}
-        cache_key = generate_cache_key(concept, text)
-        if cache_key in cache:
-            results[concept][text] = cache[cache_key]
+        if (text, concept) in cached:
+            results[concept][text] = cached[(text, concept)]
         else:
             uncached_tasks.append((text, concept))
 
@@ -179,20 +206,20 @@ def annotate(
     print(f"Found {len(tasks) - len(uncached_tasks)} cached items; annotating {len(uncached_tasks)} uncached items")
 
     # Annotate uncached tasks
-    if uncached_tasks:
-        _parallel_annotate(
-            tasks=uncached_tasks,
-            n_workers=n_workers,
-            cache=cache,
-            cache_path=cache_path,
-            results=results,
-            show_progress=show_progress,
-            **kwargs
-        )
-
-    # Save cache if path provided
-    if cache_path:
-        save_annotation_cache(cache_path, cache)
+    try:
+        if uncached_tasks:
+            _parallel_annotate(
+                tasks=uncached_tasks,
+                n_workers=n_workers,
+                store=store,
+                store_namespace=store_namespace,
+                results=results,
+                show_progress=show_progress,
+                **kwargs
+            )
+    finally:
+        if store is not None:
+            store.close()
 
     return results
 
@@ -202,20 +229,26 @@ def annotate_texts_with_concepts(
     cache_name: Optional[str] = None,
     progress_desc: str = "Annotating",
     show_progress: bool = True,
+    dedup: Optional[TextDeduplication] = None,
     **kwargs
 ) -> Dict[str, np.ndarray]:
     """
     Annotate all texts in a list with all concepts in a list.
+    If `dedup` (from `deduplicate_texts(texts)`) is given, only one representative text per
+    group of (near-)duplicates is annotated, and its annotations are copied to the group.
     Returns:
         Dictionary mapping each concept to an array of annotation results, with the texts in the order they were passed in.
     """
+    if dedup is not None:
+        texts = dedup.unique(texts)
+
     # Create tasks for each text-concept pair
     tasks = [(text, concept) for text in texts for concept in concepts]
     
     # Use the annotate function to process tasks
     results = annotate(
         tasks=tasks,
-        cache_path=os.path.join(CACHE_DIR, f"{cache_name}_hypothesis-eval.json") if cache_name else None,
+        cache_path=os.path.join(CACHE_DIR, f"{cache_name}_hypothesis-eval.sqlite") if cache_name else None,
         n_workers=kwargs.pop('n_workers', DEFAULT_N_WORKERS),
         show_progress=show_progress,
         progress_desc=progress_desc,
@@ -226,5 +259,7 @@ def annotate_texts_with_concepts(
     concept_arrays = {}
     for concept in concepts:
         concept_arrays[concept] = np.array([results[concept][text] for text in texts])
+        if dedup is not None:
+            concept_arrays[concept] = dedup.expand(concept_arrays[concept])
         
     return concept_arrays
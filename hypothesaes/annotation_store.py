@@ -0,0 +1,200 @@
+"""SQLite-backed store of LLM annotations.
+
+Each annotation is keyed by (annotator model, prompt version, concept hash, text hash),
+where the hashes are 128-bit BLAKE2b digests of the full concept and text, so long texts
+that share a head and tail no longer collide and keys stay small. The prompt version
+identifies the prompt template and text truncation, so editing the prompt invalidates
+old annotations instead of silently reusing them.
+
+The database runs in WAL mode: reads never block, and each batch of inserts is one
+`BEGIN IMMEDIATE` transaction, so several processes (and threads) can share a store and
+annotations are persisted as they arrive rather than when a run ends. Lookups hash the
+requested pairs and query them in batches.
+
+`migrate_json_annotation_cache` imports a legacy JSON cache, whose keys were
+`concept|||text[:100]...text[-100:]`. The legacy cache recorded neither the annotator
+model nor the prompt, and not the full text, so its entries are imported as they are:
+under the `LEGACY_NAMESPACE` model and prompt version, keyed by the stored head and tail
+of the text. `get_many_legacy` looks texts up there the way the JSON cache did.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .utils import load_prompt
+
+# Number of text hashes per SELECT (SQLite allows 999 bound parameters by default)
+ANNOTATION_STORE_LOOKUP_BATCH_SIZE = 500
+# Seconds to wait for another connection's write transaction before raising
+ANNOTATION_STORE_TIMEOUT = 60.0
+# (model, prompt version) under which legacy JSON annotations are imported
+LEGACY_NAMESPACE = ("legacy", "legacy")
+# Meta key set once a store holds imported legacy annotations
+LEGACY_META_KEY = "has_legacy_annotations"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    concept_hash BLOB NOT NULL,
+    text_hash BLOB NOT NULL,
+    annotation INTEGER NOT NULL,
+    PRIMARY KEY (model, prompt_version, concept_hash, text_hash)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def hash_annotation_key(value: str) -> bytes:
+    """Return the 128-bit BLAKE2b digest of a concept or text."""
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+
+
+def get_prompt_version(prompt_name: str = "annotate", max_words_per_example: Optional[int] = None) -> str:
+    """Identify a prompt template (by content hash) and the truncation applied to texts."""
+    template_hash = hashlib.sha256(load_prompt(prompt_name).encode("utf-8")).hexdigest()[:12]
+    truncation = f"-max{max_words_per_example}w" if max_words_per_example else ""
+    return f"{prompt_name}-{template_hash}{truncation}"
+
+
+def legacy_text_key(text: str) -> str:
+    """Text part of a legacy JSON annotation cache key: the first and last 100 characters."""
+    return f"{text[:100]}...{text[-100:]}"
+
+def legacy_annotation_cache_key(concept: str, text: str) -> str:
+    """Key of the legacy JSON annotation cache."""
+    return f"{concept}|||{legacy_text_key(text)}"
+
+
+class AnnotationStore:
+    def __init__(self, path: str, timeout: float = ANNOTATION_STORE_TIMEOUT) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        # Autocommit mode; writes open their own transactions
+        self._connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(_SCHEMA)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM annotations").fetchone()[0]
+
+    def __enter__(self) -> "AnnotationStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def get_many(self, model: str, prompt_version: str, tasks: Sequence[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+        """Look up (text, concept) tasks; returns the annotations of the tasks found in the store."""
+        by_concept: Dict[str, Dict[bytes, List[str]]] = {}
+        for text, concept in tasks:
+            by_concept.setdefault(concept, {}).setdefault(hash_annotation_key(text), []).append(text)
+
+        found = {}
+        with self._lock:
+            for concept, texts_by_hash in by_concept.items():
+                concept_hash = hash_annotation_key(concept)
+                text_hashes = list(texts_by_hash)
+                for start in range(0, len(text_hashes), ANNOTATION_STORE_LOOKUP_BATCH_SIZE):
+                    batch = text_hashes[start:start + ANNOTATION_STORE_LOOKUP_BATCH_SIZE]
+                    rows = self._connection.execute(
+                        "SELECT text_hash, annotation FROM annotations "
+                        "WHERE model = ? AND prompt_version = ? AND concept_hash = ? "
+                        f"AND text_hash IN ({','.join('?' * len(batch))})",
+                        [model, prompt_version, concept_hash, *batch],
+                    )
+                    for text_hash, annotation in rows:
+                        for text in texts_by_hash[text_hash]:
+                            found[(text, concept)] = annotation
+        return found
+
+    def get_many_legacy(self, tasks: Sequence[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+        """Look up (text, concept) tasks among imported legacy annotations, by the legacy text key."""
+        by_key: Dict[Tuple[str, str], List[Tuple[str, str]]] = {}
+        for text, concept in tasks:
+            by_key.setdefault((legacy_text_key(text), concept), []).append((text, concept))
+        found = {}
+        for key, annotation in self.get_many(*LEGACY_NAMESPACE, list(by_key)).items():
+            for task in by_key[key]:
+                found[task] = annotation
+        return found
+
+    def put_many(self, model: str, prompt_version: str, annotations: Iterable[Tuple[str, str, int]]) -> None:
+        """Insert (or overwrite) (text, concept, annotation) triples in one transaction."""
+        rows = [
+            (model, prompt_version, hash_annotation_key(concept), hash_annotation_key(text), int(annotation))
+            for text, concept, annotation in annotations
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.executemany("INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?)", rows)
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+
+def migrate_json_annotation_cache(json_path: str, store: AnnotationStore, verbose: bool = True) -> int:
+    """Import every entry of a legacy JSON annotation cache into `store`.
+
+    Entries are filed under `LEGACY_NAMESPACE` and keyed by the text key stored in the
+    JSON file (the first and last 100 characters of the text), since the legacy cache
+    recorded neither the annotator model, the prompt, nor the full text. Read them back
+    with `AnnotationStore.get_many_legacy`.
+
+    Args:
+        json_path: Path to the legacy JSON cache
+        store: Store to import into
+        verbose: Whether to print how many entries were imported
+
+    Returns:
+        Number of imported annotations
+    """
+    try:
+        with open(json_path, "r") as f:
+            cache = json.load(f)
+    except json.JSONDecodeError:
+        print(f"Warning: Failed to parse legacy annotation cache {json_path}; nothing was migrated")
+        return 0
+
+    annotations = []
+    for key, annotation in cache.items():
+        concept, separator, text_key = key.partition("|||")
+        if separator:
+            annotations.append((text_key, concept, annotation))
+    store.put_many(*LEGACY_NAMESPACE, annotations)
+    if annotations:
+        store.set_meta(LEGACY_META_KEY, "1")
+
+    if verbose:
+        print(f"Migrated {len(annotations)} legacy annotations from {json_path} to {store.path}")
+    return len(annotations)
@@ -0,0 +1,84 @@
+"""Pickle-free, memory-mappable tensor checkpoint files.
+
+File layout:
+    8 bytes   magic `HSAECKPT`
+    8 bytes   little-endian uint64 length of the JSON header
+    header    UTF-8 JSON: {"config": {...}, "tensors": {name: {"dtype", "shape", "offset"}}}
+    data      raw C-contiguous tensor bytes, each starting at a 64-byte aligned `offset`
+
+Reading maps each tensor straight from the file with `np.memmap` (copy-on-write),
+so loading is zero-copy, touches only the pages that are used, and never unpickles.
+"""
+
+import json
+import os
+import struct
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import torch
+
+CHECKPOINT_MAGIC = b"HSAECKPT"
+_ALIGNMENT = 64
+
+
+def is_tensor_checkpoint(path: str) -> bool:
+    """Return whether `path` is a file in this format (as opposed to e.g. a `torch.save` file)."""
+    with open(path, "rb") as f:
+        return f.read(len(CHECKPOINT_MAGIC)) == CHECKPOINT_MAGIC
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def save_tensor_checkpoint(path: str, config: Dict, tensors: Dict[str, torch.Tensor]) -> None:
+    """Atomically write `config` (JSON-serializable) and float/int `tensors` to `path`."""
+    arrays = {name: tensor.detach().cpu().contiguous().numpy() for name, tensor in tensors.items()}
+    tensor_meta = {}
+    offset = 0
+    for name, array in arrays.items():
+        tensor_meta[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({"config": config, "tensors": tensor_meta}).encode("utf-8")
+    # Pad the header so that the data section (and hence every tensor) is aligned
+    data_start = _align(len(CHECKPOINT_MAGIC) + 8 + len(header))
+    header += b" " * (data_start - len(CHECKPOINT_MAGIC) - 8 - len(header))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CHECKPOINT_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + tensor_meta[name]["offset"])
+            f.write(array.data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_tensor_checkpoint(
+    path: str,
+    names: Optional[Iterable[str]] = None,
+) -> Tuple[Dict, Dict[str, torch.Tensor]]:
+    """Return (config, tensors) from `path`, memory-mapping the tensors (all, or only `names`)."""
+    with open(path, "rb") as f:
+        if f.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+            raise ValueError(f"{path} is not a HypotheSAEs tensor checkpoint")
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    data_start = len(CHECKPOINT_MAGIC) + 8 + header_len
+
+    names = list(header["tensors"]) if names is None else list(names)
+    tensors = {}
+    for name in names:
+        meta = header["tensors"][name]
+        shape = tuple(meta["shape"])
+        if int(np.prod(shape)) == 0:
+            tensors[name] = torch.from_numpy(np.empty(shape, dtype=np.dtype(meta["dtype"])))
+            continue
+        array = np.memmap(path, dtype=np.dtype(meta["dtype"]), mode="c", offset=data_start + meta["offset"], shape=shape)
+        tensors[name] = torch.from_numpy(array)
+    return header["config"], tensors
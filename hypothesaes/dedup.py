@@ -0,0 +1,161 @@
+"""Collapse duplicate and near-duplicate texts, keeping a mapping back to the original rows.
+
+`deduplicate_texts` groups texts that are identical after normalization (Unicode NFKC,
+case folding, collapsed whitespace) and, optionally, near-duplicates: texts whose word
+shingles have an estimated Jaccard similarity of at least `threshold`, found with MinHash
+signatures and locality-sensitive hashing (LSH). The returned `TextDeduplication` selects
+one representative row per group (`unique`) and broadcasts per-representative results
+back to every original row (`expand`), so embedding, SAE activations and annotation can
+run once per unique text.
+"""
+
+import unicodedata
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from .embedding_cache import hash_texts
+
+_MINHASH_PRIME = (1 << 31) - 1
+
+
+def normalize_for_dedup(text: str) -> str:
+    """Normalize a text for duplicate detection: NFKC, case folding, and collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFKC", str(text)).casefold().split())
+
+
+def _take_rows(values: Any, rows: np.ndarray) -> Any:
+    if isinstance(values, (list, tuple)):
+        return [values[i] for i in rows]
+    if isinstance(values, torch.Tensor):
+        return values[torch.as_tensor(rows, device=values.device)]
+    return values[rows]
+
+
+@dataclass
+class TextDeduplication:
+    """Mapping between original rows and unique (representative) rows."""
+    representatives: np.ndarray  # (n_unique,) original row of each group's representative (its first row)
+    inverse: np.ndarray  # (n_texts,) group of each original row, i.e. index into `representatives`
+    n_exact_duplicates: int  # rows collapsed because their normalized text was already seen
+    n_near_duplicates: int  # further rows collapsed as near-duplicates
+
+    @property
+    def n_unique(self) -> int:
+        return len(self.representatives)
+
+    def unique(self, values: Any) -> Any:
+        """Select the representative rows of `values` (list, array, tensor, or sparse matrix)."""
+        return _take_rows(values, self.representatives)
+
+    def expand(self, values: Any) -> Any:
+        """Broadcast per-representative `values` back to all original rows."""
+        return _take_rows(values, self.inverse)
+
+
+def _shingle_hashes(text: str, shingle_size: int) -> np.ndarray:
+    words = text.split()
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))}
+    return np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def _minhash_signatures(texts: Sequence[str], num_perm: int, shingle_size: int, seed: int) -> np.ndarray:
+    """(n_texts, num_perm) MinHash signatures over word shingles, with hashes (a * x + b) mod p."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _MINHASH_PRIME, size=(num_perm, 1), dtype=np.uint64)
+    b = rng.integers(0, _MINHASH_PRIME, size=(num_perm, 1), dtype=np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint32)
+    for i, text in enumerate(texts):
+        x = _shingle_hashes(text, shingle_size)[None, :]
+        signatures[i] = ((a * x + b) % _MINHASH_PRIME).min(axis=1)
+    return signatures
+
+
+def _lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Return (bands, rows per band) whose LSH threshold (1 / bands) ** (1 / rows) is highest without exceeding `threshold`."""
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [option for option in options if (1 / option[0]) ** (1 / option[1]) <= threshold]
+    return max(below, key=lambda option: (1 / option[0]) ** (1 / option[1])) if below else options[0]
+
+
+def _find(parent: np.ndarray, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def deduplicate_texts(
+    texts: List[str],
+    near_duplicates: bool = False,
+    threshold: float = 0.8,
+    num_perm: int = 128,
+    shingle_size: int = 3,
+    seed: int = 0,
+    verbose: bool = True,
+) -> TextDeduplication:
+    """Group exact (after normalization) and, optionally, near-duplicate texts.
+
+    Args:
+        texts: Texts to deduplicate
+        near_duplicates: Whether to also collapse near-duplicates with MinHash/LSH
+        threshold: Minimum estimated Jaccard similarity of word shingles for near-duplicates
+        num_perm: Number of MinHash permutations (more is more accurate and slower)
+        shingle_size: Number of consecutive words per shingle
+        seed: Seed of the MinHash permutations
+        verbose: Whether to print how many rows were collapsed
+
+    Returns:
+        A `TextDeduplication`; each group is represented by its first row. Near-duplicate
+        groups are connected components of similar pairs, so a group can chain texts that
+        are similar to a common neighbor but not to each other.
+    """
+    normalized = [normalize_for_dedup(text) for text in texts]
+    _, first, exact_inverse = np.unique(hash_texts(normalized), return_index=True, return_inverse=True)
+    exact_inverse = exact_inverse.reshape(-1)
+    # Exact groups ordered by first occurrence
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    representatives, inverse = first[order], rank[exact_inverse]
+    n_exact_duplicates = len(texts) - len(representatives)
+
+    n_near_duplicates = 0
+    if near_duplicates and len(representatives) > 1:
+        signatures = _minhash_signatures([normalized[i] for i in representatives], num_perm, shingle_size, seed)
+        n_bands, rows_per_band = _lsh_bands(num_perm, threshold)
+        parent = np.arange(len(representatives))
+        for band in range(n_bands):
+            band_signatures = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+            buckets: Dict[bytes, List[int]] = {}
+            for i, key in enumerate(map(bytes, band_signatures)):
+                buckets.setdefault(key, []).append(i)
+            for members in buckets.values():
+                # Compare each member with the distinct groups seen so far in this bucket
+                centers: List[int] = []
+                for i in members:
+                    for center in centers:
+                        if np.mean(signatures[i] == signatures[center]) >= threshold:
+                            root_i, root_center = _find(parent, i), _find(parent, center)
+                            parent[max(root_i, root_center)] = min(root_i, root_center)
+                            break
+                    else:
+                        centers.append(i)
+        roots = np.array([_find(parent, i) for i in range(len(parent))])
+        # Roots are the earliest member of each group, so groups stay ordered by first occurrence
+        unique_roots, group = np.unique(roots, return_inverse=True)
+        n_near_duplicates = len(representatives) - len(unique_roots)
+        representatives, inverse = representatives[unique_roots], group.reshape(-1)[inverse]
+
+    if verbose:
+        message = f"Deduplication: {len(texts)} texts -> {len(representatives)} unique ({n_exact_duplicates} exact duplicates"
+        print(message + (f", {n_near_duplicates} near-duplicates)" if near_duplicates else ")"))
+    return TextDeduplication(
+        representatives=representatives.astype(np.int64),
+        inverse=inverse.astype(np.int64),
+        n_exact_duplicates=n_exact_duplicates,
+        n_near_duplicates=n_near_duplicates,
+    )
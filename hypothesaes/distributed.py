@@ -0,0 +1,121 @@
+"""Data-parallel SAE training across CPU processes.
+
+`fit_data_parallel` spawns one worker process per rank, joins them into a
+`torch.distributed` process group with the gloo backend, and runs
+`SparseAutoencoder.fit` in each of them. Every rank draws the same shuffled
+batches and trains on its own slice of each batch; `fit` and `training_step`
+detect the process group and all-reduce gradients, dead-neuron counters and
+losses (see `SparseAutoencoder.fit`). The trained weights are copied back into
+the SAE passed by the caller.
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Dict, Optional, Union
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from .sae import SparseAutoencoder, device
+from .streaming import StreamingEmbeddingDataset
+
+
+def _data_parallel_worker(
+    rank: int,
+    n_processes: int,
+    work_dir: str,
+    config: Dict,
+    sparse_decode: bool,
+    seed: int,
+    n_threads: int,
+    X_train: Union[torch.Tensor, StreamingEmbeddingDataset],
+    X_val: Optional[Union[torch.Tensor, StreamingEmbeddingDataset]],
+    fit_kwargs: Dict,
+) -> None:
+    torch.set_num_threads(n_threads)
+    dist.init_process_group(
+        "gloo",
+        init_method=f"file://{os.path.join(work_dir, 'rendezvous')}",
+        rank=rank,
+        world_size=n_processes,
+    )
+    try:
+        # Same seed on every rank, so all ranks draw the same shuffled batches
+        torch.manual_seed(seed)
+        sae = SparseAutoencoder(**config, sparse_decode=sparse_decode)
+        history = sae.fit(X_train, X_val, **fit_kwargs)
+        if rank == 0:
+            torch.save(
+                {
+                    "state_dict": sae.state_dict(),
+                    "steps_since_activation": sae.steps_since_activation.cpu(),
+                    "history": history,
+                },
+                os.path.join(work_dir, "result.pt"),
+            )
+    finally:
+        dist.destroy_process_group()
+
+
+def fit_data_parallel(
+    sae: SparseAutoencoder,
+    X_train: Union[torch.Tensor, StreamingEmbeddingDataset],
+    X_val: Optional[Union[torch.Tensor, StreamingEmbeddingDataset]] = None,
+    *,
+    n_processes: int,
+    n_threads_per_process: Optional[int] = None,
+    **fit_kwargs,
+) -> Dict:
+    """Train `sae` in place with `n_processes` data-parallel CPU workers.
+
+    Args:
+        sae: The SAE to train; its config is used to build a replica in each worker,
+            and the trained weights and dead-neuron counters are loaded back into it
+        X_train: Training embeddings, as for `SparseAutoencoder.fit`. In-memory tensors
+            are shared with the workers; streaming datasets reopen their files in each worker
+        X_val: Optional validation embeddings; validation batches are split across ranks
+        n_processes: Number of worker processes (ranks)
+        n_threads_per_process: Intra-op threads per worker (default: CPU count / n_processes)
+        **fit_kwargs: Any other keyword arguments of `SparseAutoencoder.fit`; `batch_size`
+            is the global batch size, split evenly across ranks
+
+    Returns:
+        The training history of `fit`
+    """
+    if n_processes < 1:
+        raise ValueError(f"n_processes must be at least 1, got {n_processes}")
+    if device.type != "cpu":
+        raise ValueError(f"Data-parallel training uses the gloo backend on CPU, but the training device is {device}")
+    # Every rank needs at least one row of each batch; otherwise all batches are skipped
+    if len(X_train) < n_processes:
+        raise ValueError(f"X_train has {len(X_train)} rows, fewer than n_processes ({n_processes})")
+    if fit_kwargs.get("batch_size", n_processes) < n_processes:
+        raise ValueError(f"batch_size ({fit_kwargs['batch_size']}) must be at least n_processes ({n_processes})")
+    if n_threads_per_process is None:
+        n_threads_per_process = max(1, (os.cpu_count() or 1) // n_processes)
+    if isinstance(X_train, torch.Tensor):
+        X_train = X_train.float().share_memory_()
+    if isinstance(X_val, torch.Tensor):
+        X_val = X_val.float().share_memory_()
+    seed = int(torch.randint(0, 2**62, (1,)).item())
+
+    work_dir = tempfile.mkdtemp(prefix="hypothesaes_ddp_")
+    try:
+        mp.spawn(
+            _data_parallel_worker,
+            args=(
+                n_processes, work_dir, sae.get_config(), sae.sparse_decode, seed,
+                n_threads_per_process, X_train, X_val, fit_kwargs,
+            ),
+            nprocs=n_processes,
+            join=True,
+        )
+        result = torch.load(os.path.join(work_dir, "result.pt"), weights_only=False)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    sae.load_state_dict(result["state_dict"])
+    sae.steps_since_activation = result["steps_since_activation"].to(device)
+    return result["history"]
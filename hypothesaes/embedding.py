@@ -1,58 +1,98 @@
 """Utilities for computing text embeddings."""
 
 import numpy as np
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+from dataclasses import dataclass
+import asyncio
 import concurrent.futures
+import hashlib
+import json
+import re
 from tqdm.auto import tqdm
 import tiktoken
 import os
-import time
 from pathlib import Path
-import glob
 import torch
 import openai
-from .utils import filter_invalid_texts
+from .embedding_cache import EmbeddingCache
 from .rate_limiter import get_rate_limiter
 
 # Use environment variable for cache dir if set, otherwise use default
 CACHE_DIR = os.getenv('EMB_CACHE_DIR') or os.path.join(Path(__file__).parent.parent, 'emb_cache')
+# Storage dtype of new embedding caches: "float32", "float16", or "int8" (see EmbeddingCache)
+CACHE_DTYPE = os.getenv('EMB_CACHE_DTYPE') or "float32"
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
-def _embed_batch_openai(
-        batch: List[str], 
-        model: str, 
+@dataclass
+class EmbeddingRequestLimits:
+    """Limits used to pack texts into OpenAI embedding requests."""
+    max_input_tokens: int = 8191  # longer texts are truncated
+    max_request_tokens: int = 32768  # token budget per request (the API allows up to 300k)
+    max_request_inputs: int = 2048  # number of texts per request
+    encoding: str = "cl100k_base"  # tiktoken encoding of the model
+
+# Per-model request limits; models not listed use the defaults above
+OPENAI_EMBEDDING_LIMITS = {
+    "text-embedding-3-small": EmbeddingRequestLimits(),
+    "text-embedding-3-large": EmbeddingRequestLimits(),
+    "text-embedding-ada-002": EmbeddingRequestLimits(),
+}
+OPENAI_EMBEDDING_DIMS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+def _tokenize_texts(texts: List[str], limits: EmbeddingRequestLimits) -> List[np.ndarray]:
+    """Tokenize (stripped) texts once, truncated to `limits.max_input_tokens`, as compact int32 arrays."""
+    enc = tiktoken.get_encoding(limits.encoding)
+    token_lists = enc.encode_ordinary_batch([text.strip() for text in texts])
+    return [np.asarray(tokens[:limits.max_input_tokens], dtype=np.int32) for tokens in token_lists]
+
+def pack_token_batches(
+    token_counts: np.ndarray,
+    max_request_tokens: int,
+    max_request_inputs: int,
+) -> List[np.ndarray]:
+    """Greedily pack texts, sorted from longest to shortest, into batches within both limits.
+
+    Returns arrays of positions into `token_counts`. Sorting groups texts of similar
+    length, so long outliers share a few small requests instead of bloating many.
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for i in np.argsort(-np.asarray(token_counts), kind="stable"):
+        n_tokens = int(token_counts[i])
+        if current and (current_tokens + n_tokens > max_request_tokens or len(current) >= max_request_inputs):
+            batches.append(np.array(current, dtype=np.int64))
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n_tokens
+    if current:
+        batches.append(np.array(current, dtype=np.int64))
+    return batches
+
+async def _embed_batch_openai_async(
+        token_batch: List[List[int]],
+        model: str,
         client,
-        max_tokens: int = 8192, 
-        max_retries: int = 5, 
+        max_retries: int = 5,
         backoff_factor: float = 3.0,
         timeout: float = 10.0,
         use_rate_limiter: bool = False,
 ) -> List[List[float]]:
-    """Helper function for batch embedding using OpenAI API."""
-    # Truncate texts to max tokens
-    enc = tiktoken.get_encoding("cl100k_base")  # encoding for OpenAI text-embedding models
-    truncated_batch = []
-    total_tokens = 0
-    
-    for text in batch:
-        tokens = enc.encode(text.strip())
-        if len(tokens) > max_tokens:
-            tokens = tokens[:max_tokens]
-            text = enc.decode(tokens)
-        truncated_batch.append(text)
-        total_tokens += len(tokens)
-    
+    """Helper function for batch embedding of pre-tokenized texts using the async OpenAI API."""
     # Apply rate limiting
     if use_rate_limiter:
         from .rate_limiter import get_embedding_rate_limiter
         rate_limiter = get_embedding_rate_limiter()
-        rate_limiter.wait_for_capacity(total_tokens)
+        await rate_limiter.wait_for_capacity_async(sum(len(tokens) for tokens in token_batch))
     
     for attempt in range(max_retries):
         try:
-            response = client.embeddings.create(
-                input=truncated_batch,
+            response = await client.embeddings.create(
+                input=token_batch,
                 model=model,
                 timeout=timeout
             )
@@ -65,87 +105,557 @@ def _embed_batch_openai(
             wait_time = timeout * (backoff_factor ** attempt)
             if attempt > 0:
                 print(f"API error: {e}; retrying in {wait_time:.1f}s... ({attempt + 1}/{max_retries})")
-            time.sleep(wait_time)
+            await asyncio.sleep(wait_time)
 
+def normalize_text(text: str) -> str:
+    """Normalization applied to every text before it is embedded and used as a cache key."""
+    return str(text).strip()
 
-def load_embedding_cache(cache_name: str) -> dict:
-    """Load cached embeddings from chunked files."""
-    if not cache_name:
-        return {}
-    
-    cache_dir = f"{CACHE_DIR}/{cache_name}"
-    if not os.path.exists(cache_dir):
-        return {}
-    
-    text2embedding = {}
-    chunk_files = sorted(glob.glob(f"{cache_dir}/chunk_*.npy"))
-    
-    start_time = time.time()
-    for chunk_file in tqdm(chunk_files, desc="Loading embedding chunks"):
-        # Each chunk file contains a list of (text, embedding) tuples
-        chunk_data = np.load(chunk_file, allow_pickle=True)
-        for text, emb in chunk_data:
-            text2embedding[text] = emb
-            
-    load_time = time.time() - start_time
-    print(f"Loaded {len(text2embedding)} embeddings in {load_time:.1f}s")
-            
-    return text2embedding
+def get_openai_recipe(model: str) -> Dict:
+    """Preprocessing recipe of an OpenAI embedding model: everything besides the model id that affects its embeddings."""
+    limits = OPENAI_EMBEDDING_LIMITS.get(model, EmbeddingRequestLimits())
+    return {"backend": "openai", "normalize": "strip", "encoding": limits.encoding, "max_input_tokens": limits.max_input_tokens}
 
+def get_local_recipe(model: str, backend: str = "torch", quantization_config: str = "avx2") -> Dict:
+    """Preprocessing recipe of a local SentenceTransformer model (see `get_openai_recipe`)."""
+    recipe = {"backend": "sentence-transformers", "normalize": "strip"}
+    if backend != "torch":
+        recipe["inference"] = f"{backend}-{quantization_config}"
+    if "nomic-ai" in model:
+        recipe["prefix"] = "search_document: "
+    elif "instructor" in model:
+        recipe["instruction"] = "Represent the text for classification: "
+    return recipe
 
-def update_embedding_cache(cache_name: str, text2embedding: dict, chunk_size: int = 50000) -> None:
-    """Update cache files in chunks."""
-    if not cache_name:
-        return
-        
-    cache_dir = f"{CACHE_DIR}/{cache_name}"
-    os.makedirs(cache_dir, exist_ok=True)
-    
-    # Convert to list of (text, embedding) tuples for storage
-    items = list(text2embedding.items())
-    
-    for i in range(0, len(items), chunk_size):
-        chunk_items = items[i:i + chunk_size]
-        chunk_num = i // chunk_size
-        chunk_path = f"{cache_dir}/chunk_{chunk_num:03d}.npy"
-        np.save(chunk_path, np.array(chunk_items, dtype=object))
-        
-
-def _get_next_chunk_index(cache_name: str) -> int:
-    """Determine the next available chunk index for a cache."""
+def _apply_local_recipe(texts: List[str], recipe: Dict) -> List:
+    if "prefix" in recipe:
+        return [recipe["prefix"] + text for text in texts]
+    if "instruction" in recipe:
+        return [[recipe["instruction"], text] for text in texts]
+    return texts
+
+def get_embedding_cache_dir(cache_name: str, model: str, recipe: Dict) -> str:
+    """Return the cache namespace directory of (`cache_name`, `model`, `recipe`).
+
+    Each model and preprocessing recipe gets its own subdirectory of the cache, so
+    models never share (or overwrite) each other's entries; within it, entries are keyed
+    by the hash of the normalized text.
+    """
+    recipe_hash = hashlib.sha256(json.dumps(recipe, sort_keys=True).encode()).hexdigest()[:8]
+    model_dir = re.sub(r"[^A-Za-z0-9._-]+", "--", model)
+    return os.path.join(CACHE_DIR, cache_name, f"{model_dir}-{recipe_hash}")
+
+def get_embedding_cache(cache_name: Optional[str], model: str, recipe: Dict) -> Optional[EmbeddingCache]:
+    """Open the memory-mapped embedding cache of `model` and `recipe` in `cache_name` (None if caching is disabled).
+
+    A cache created before caches were namespaced by model (directly in `cache_name`) is
+    not used, since it does not record which model it holds; import it with
+    `migrate_unnamespaced_embedding_cache`.
+    """
     if not cache_name:
-        return 0
-        
-    cache_dir = f"{CACHE_DIR}/{cache_name}"
-    if not os.path.exists(cache_dir):
-        return 0
-        
-    chunk_files = glob.glob(f"{cache_dir}/chunk_*.npy")
-    if not chunk_files:
-        return 0
-        
-    indices = [int(os.path.basename(f).split("_")[1].split(".")[0]) for f in chunk_files]
-    return max(indices) + 1
-    
-def _save_embedding_chunk(cache_name: str, chunk_embeddings: dict, chunk_idx: int) -> int:
-    """Save a chunk of embeddings to disk."""
-    if not cache_name or not chunk_embeddings:
-        return chunk_idx
-        
-    cache_dir = f"{CACHE_DIR}/{cache_name}"
+        return None
+    cache_dir = get_embedding_cache_dir(cache_name, model, recipe)
+    namespace_path = os.path.join(cache_dir, "namespace.json")
+    if not os.path.exists(namespace_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        if _unnamespaced_cache_files(os.path.join(CACHE_DIR, cache_name)):
+            print(
+                f"Warning: {os.path.join(CACHE_DIR, cache_name)} holds an embedding cache from before caches were "
+                f"namespaced by model, which is ignored; to reuse it, call "
+                f"migrate_unnamespaced_embedding_cache({cache_name!r}, model=<the model that created it>)"
+            )
+        with open(namespace_path, "w") as f:
+            json.dump({"model": model, "recipe": recipe}, f, indent=2)
+    return EmbeddingCache(cache_dir, dtype=CACHE_DTYPE)
+
+def _unnamespaced_cache_files(root_dir: str) -> List[str]:
+    if not os.path.isdir(root_dir):
+        return []
+    return [
+        name for name in os.listdir(root_dir)
+        if name in ("meta.json", "embeddings.bin", "scales.bin", "hashes.bin", "index.npz") or re.fullmatch(r"chunk_\d+\.npy", name)
+    ]
+
+def migrate_unnamespaced_embedding_cache(
+    cache_name: str,
+    model: str,
+    recipe: Optional[Dict] = None,
+    dim: Optional[int] = None,
+) -> str:
+    """Move a cache created before caches were namespaced by model into the namespace of `model`.
+
+    Args:
+        cache_name: Name of the cache (a directory of `CACHE_DIR`)
+        model: The model whose embeddings the legacy cache holds
+        recipe: Preprocessing recipe they were computed with (default: the current recipe of
+            `model`, which matches legacy caches, including the "search_document: " prefix
+            of nomic-ai models)
+        dim: Embedding dimension of `model` (known for OpenAI models); the migration is
+            refused if the cached embeddings have another dimension
+
+    Returns:
+        The namespace directory the cache was moved to
+    """
+    root_dir = os.path.join(CACHE_DIR, cache_name)
+    if not _unnamespaced_cache_files(root_dir):
+        raise ValueError(f"No unnamespaced embedding cache found in {root_dir}")
+    if recipe is None:
+        recipe = get_openai_recipe(model) if model in OPENAI_EMBEDDING_LIMITS else get_local_recipe(model)
+    dim = dim or OPENAI_EMBEDDING_DIMS.get(model)
+    cached_dim = EmbeddingCache(root_dir).dim  # converts legacy chunk_*.npy files
+    names = _unnamespaced_cache_files(root_dir)
+    if dim is not None and cached_dim is not None and cached_dim != dim:
+        raise ValueError(f"The cache in {root_dir} holds {cached_dim}-dimensional embeddings, but {model} has dimension {dim}")
+
+    cache_dir = get_embedding_cache_dir(cache_name, model, recipe)
+    if len(EmbeddingCache(cache_dir)) > 0:
+        raise ValueError(f"The namespace {cache_dir} already holds embeddings; refusing to overwrite them")
     os.makedirs(cache_dir, exist_ok=True)
-    
-    chunk_path = f"{cache_dir}/chunk_{chunk_idx:03d}.npy"
-    chunk_items = list(chunk_embeddings.items())
-    np.save(chunk_path, np.array(chunk_items, dtype=object))
-    print(f"Saved {len(chunk_items)} embeddings to {chunk_path}")
-    
-    return chunk_idx + 1
+    print(f"Moving the embedding cache in {root_dir} into the namespace of {model}: {cache_dir}")
+    for name in names:
+        os.replace(os.path.join(root_dir, name), os.path.join(cache_dir, name))
+    with open(os.path.join(cache_dir, "namespace.json"), "w") as f:
+        json.dump({"model": model, "recipe": recipe}, f, indent=2)
+    return cache_dir
+
+class _EmbeddingJob:
+    """Bookkeeping for embedding `texts` into an (N, D) float32 matrix in input order.
+
+    Each unique valid text is looked up in the cache, or embedded, once; rows are
+    written in place (and appended to the cache) as batches complete, and repeated
+    texts are copied from their first occurrence in `finish`. The matrix is allocated
+    once D is known (from the cache or the first batch); with `out_path` it is a
+    `.npy` memmap on disk.
+    """
+
+    def __init__(self, texts: List[str], cache: Optional[EmbeddingCache], out_path: Optional[str] = None):
+        self.cache = cache
+        self.out_path = out_path
+        self.array = None
+        self.failed = np.array([text is None or len(normalize_text(text)) == 0 for text in texts], dtype=bool)
+        if self.failed.any():
+            print(f"Warning: {self.failed.sum()} items are None or empty strings; their rows are marked as failed")
+
+        # Output row of the first occurrence of each unique normalized text
+        keys = [None if failed else normalize_text(text) for text, failed in zip(texts, self.failed)]
+        first_row = {}
+        for row in np.flatnonzero(~self.failed):
+            first_row.setdefault(keys[row], row)
+        unique_texts = list(first_row)
+        unique_rows = np.fromiter(first_row.values(), dtype=np.int64, count=len(first_row))
+        self.duplicate_rows = np.array(
+            [row for row in np.flatnonzero(~self.failed) if first_row[keys[row]] != row], dtype=np.int64
+        )
+        self.duplicate_sources = np.array([first_row[keys[row]] for row in self.duplicate_rows], dtype=np.int64)
+        self.n_rows = len(texts)
+
+        is_cached = np.zeros(len(unique_texts), dtype=bool)
+        if cache is not None and len(cache) > 0:
+            self._allocate(cache.dim)
+            cache_rows = cache.lookup(unique_texts)
+            is_cached = cache_rows >= 0
+            hits = np.flatnonzero(is_cached)
+            hits = hits[np.argsort(cache_rows[hits], kind="stable")]  # read the cache in file order
+            for start in range(0, len(hits), 65536):
+                block = hits[start:start + 65536]
+                self.array[unique_rows[block]] = cache.read_rows(cache_rows[block])
+
+        # Normalized texts left to embed, and the output row each one is written to
+        self.texts_to_embed = [text for text, cached in zip(unique_texts, is_cached) if not cached]
+        self.target_rows = unique_rows[~is_cached]
+        if cache is not None:
+            n_hits = int(is_cached.sum())
+            print(
+                f"Embedding cache hits: {n_hits}/{len(unique_texts)} unique texts "
+                f"({100 * n_hits / max(len(unique_texts), 1):.1f}%); embedding {len(self.texts_to_embed)} "
+                f"({cache.cache_dir})"
+            )
+
+    def _allocate(self, dim: int) -> None:
+        if self.out_path is not None:
+            self.array = np.lib.format.open_memmap(self.out_path, mode="w+", dtype=np.float32, shape=(self.n_rows, dim))
+        else:
+            self.array = np.zeros((self.n_rows, dim), dtype=np.float32)
+
+    def write(self, indices: np.ndarray, embeddings) -> None:
+        """Write embeddings of `texts_to_embed[indices]` into their output rows."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.array is None:
+            self._allocate(embeddings.shape[1])
+        self.array[self.target_rows[indices]] = embeddings
+
+    def fail(self, indices: np.ndarray) -> None:
+        self.failed[self.target_rows[indices]] = True
+
+    def save_to_cache(self, indices: np.ndarray) -> None:
+        """Add the (successfully embedded) `texts_to_embed[indices]` to the cache."""
+        if self.cache is None:
+            return
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = indices[~self.failed[self.target_rows[indices]]]
+        if len(indices) > 0:
+            self.cache.add([self.texts_to_embed[i] for i in indices], self.array[self.target_rows[indices]])
+
+    def finish(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.cache is not None:
+            self.cache.wait()
+        if self.array is None:
+            self._allocate(0)
+        self.array[self.duplicate_rows] = self.array[self.duplicate_sources]
+        self.failed[self.duplicate_rows] = self.failed[self.duplicate_sources]
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
+        return self.array, self.failed
+
+def _embeddings_dict(texts: List[str], matrix: np.ndarray, failed: np.ndarray) -> Dict[str, np.ndarray]:
+    return {text: matrix[i] for i, text in enumerate(texts) if not failed[i]}
+
+async def aget_openai_embedding_matrix(
+    texts: List[str],
+    model: str = "text-embedding-3-small",
+    batch_size: Optional[int] = None,
+    n_workers: int = 5,
+    cache_name: Optional[str] = None,
+    show_progress: bool = True,
+    chunk_size: int = 50000,
+    timeout: float = 10.0,
+    use_rate_limiter: bool = True,
+    out_path: Optional[str] = None,
+    max_tokens_per_request: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Embed texts with the async OpenAI API into a float32 matrix whose rows follow the input order.
+
+    Requests run in one rolling window of `n_workers` in-flight requests across the whole
+    job: a new request starts as soon as any request finishes, and the next chunk of texts
+    is tokenized while earlier requests are still in flight. Results are written into place,
+    and durably appended to the cache, batch by batch in completion order, so an interrupted
+    job loses at most its in-flight requests and resumes from the cache when rerun.
+
+    Args:
+        texts: Texts to embed (None or empty strings are marked as failed)
+        model: OpenAI embedding model
+        batch_size: Maximum number of texts per API request (default: the model's
+            `max_request_inputs` in `OPENAI_EMBEDDING_LIMITS`)
+        n_workers: Maximum number of concurrent API requests
+        cache_name: Optional name of the embedding cache to read from and add to
+        show_progress: Whether to show a progress bar
+        chunk_size: Number of texts tokenized at a time
+        timeout: Timeout per API request, in seconds
+        use_rate_limiter: Whether to throttle requests with the embedding rate limiter
+        out_path: Optional `.npy` path; if given, the matrix is a memmap of this file
+        max_tokens_per_request: Token budget per API request (default: the model's
+            `max_request_tokens`). Each chunk is tokenized once, and texts are sorted by
+            length and packed into requests within this budget and `batch_size`
+
+    Returns:
+        Tuple of ((N, D) float32 embeddings, (N,) boolean mask of texts that failed).
+        Rows of failed texts are zeros.
+    """
+    job = _EmbeddingJob(texts, get_embedding_cache(cache_name, model, get_openai_recipe(model)), out_path)
+    texts_to_embed = job.texts_to_embed
+    if not texts_to_embed:
+        return job.finish()
+
+    from .llm_api import get_async_client
+    client = get_async_client()
+    limits = OPENAI_EMBEDDING_LIMITS.get(model, EmbeddingRequestLimits())
+    max_request_inputs = batch_size or limits.max_request_inputs
+    max_request_tokens = max_tokens_per_request or limits.max_request_tokens
+
+    async def iterate_batches():
+        # Tokenize one chunk at a time (off the event loop) and pack it into token-budgeted batches
+        for chunk_start in range(0, len(texts_to_embed), chunk_size):
+            chunk_texts = texts_to_embed[chunk_start:chunk_start + chunk_size]
+            chunk_tokens = await asyncio.to_thread(_tokenize_texts, chunk_texts, limits)
+            token_counts = np.array([len(tokens) for tokens in chunk_tokens])
+            for batch in pack_token_batches(token_counts, max_request_tokens, max_request_inputs):
+                yield batch + chunk_start, [chunk_tokens[i].tolist() for i in batch]
+
+    pbar = tqdm(total=len(texts_to_embed), desc="Embedding texts") if show_progress else None
+    task_to_batch = {}
+    batches = iterate_batches()
+    try:
+        while True:
+            # Keep the window full
+            while len(task_to_batch) < n_workers:
+                try:
+                    batch, token_batch = await batches.__anext__()
+                except StopAsyncIteration:
+                    break
+                task = asyncio.create_task(_embed_batch_openai_async(
+                    token_batch, model, client, timeout=timeout, use_rate_limiter=use_rate_limiter,
+                ))
+                task_to_batch[task] = batch
+            if not task_to_batch:
+                break
+
+            done, _ = await asyncio.wait(task_to_batch, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                batch = task_to_batch.pop(task)
+                try:
+                    job.write(batch, task.result())
+                    # The cache append fsyncs; keep it off the event loop so in-flight requests keep progressing
+                    await asyncio.to_thread(job.save_to_cache, batch)
+                except Exception as e:
+                    print(f"Warning: failed to embed a batch of {len(batch)} texts ({type(e).__name__}: {e}); marking them as failed")
+                    job.fail(batch)
+                if pbar is not None:
+                    pbar.update(len(batch))
+    finally:
+        for task in task_to_batch:
+            task.cancel()
+        if pbar is not None:
+            pbar.close()
+        await client.close()
+
+    return job.finish()
+
+def _run_coroutine(coroutine):
+    """Run `coroutine` to completion from synchronous code, even if an event loop is already running (e.g. in Jupyter)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+def get_openai_embedding_matrix(
+    texts: List[str],
+    model: str = "text-embedding-3-small",
+    batch_size: Optional[int] = None,
+    n_workers: int = 5,
+    cache_name: Optional[str] = None,
+    show_progress: bool = True,
+    chunk_size: int = 50000,
+    timeout: float = 10.0,
+    use_rate_limiter: bool = True,
+    out_path: Optional[str] = None,
+    max_tokens_per_request: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Embed texts with the OpenAI API into a float32 matrix whose rows follow the input order.
+
+    Synchronous wrapper around `aget_openai_embedding_matrix`, which takes the same
+    arguments and returns the same ((N, D) embeddings, (N,) failed mask) tuple.
+    """
+    return _run_coroutine(aget_openai_embedding_matrix(
+        texts, model=model, batch_size=batch_size, n_workers=n_workers, cache_name=cache_name,
+        show_progress=show_progress, chunk_size=chunk_size, timeout=timeout, use_rate_limiter=use_rate_limiter,
+        out_path=out_path, max_tokens_per_request=max_tokens_per_request,
+    ))
+
+# Use environment variable for the exported model dir if set, otherwise use default
+QUANTIZED_MODEL_DIR = os.getenv('QUANTIZED_MODEL_DIR') or os.path.join(Path(__file__).parent.parent, 'quantized_models')
+LOCAL_BACKENDS = ("torch", "onnx-int8")
+
+def export_quantized_model(model: str, quantization_config: str = "avx2", export_dir: Optional[str] = None) -> Tuple[str, str]:
+    """Export `model` to ONNX with dynamic int8 quantization, once, and return (export_dir, onnx file name).
+
+    The export is cached in `export_dir` (default: a subdirectory of `QUANTIZED_MODEL_DIR`)
+    and reused by later calls. `quantization_config` is one of sentence-transformers'
+    ONNX quantization configs: "avx2" runs on any x86-64 CPU, "avx512_vnni" and "arm64"
+    are faster on CPUs that support them. Requires `sentence-transformers[onnx]`.
+    """
+    import glob
+    import shutil
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    if export_dir is None:
+        export_dir = os.path.join(QUANTIZED_MODEL_DIR, re.sub(r"[^A-Za-z0-9._-]+", "--", model))
+    # Weights are quint8 for "avx2" and qint8 for the other configs
+    pattern = f"*_q*int8_{quantization_config}.onnx"
+    existing = glob.glob(os.path.join(export_dir, "**", pattern), recursive=True)
+    if not existing:
+        print(f"Exporting {model} to ONNX with int8 dynamic quantization ({quantization_config}) in {export_dir}")
+        # Export into a temporary directory and rename it into place, so an interrupted export is never reused
+        tmp_dir = f"{export_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        onnx_model = SentenceTransformer(model, device="cpu", backend="onnx")
+        onnx_model.save_pretrained(tmp_dir)
+        export_dynamic_quantized_onnx_model(onnx_model, quantization_config, tmp_dir)
+        shutil.rmtree(export_dir, ignore_errors=True)
+        os.replace(tmp_dir, export_dir)
+        existing = glob.glob(os.path.join(export_dir, "**", pattern), recursive=True)
+        if not existing:
+            raise RuntimeError(f"Quantized export of {model} did not produce a {pattern} file in {export_dir}")
+    return export_dir, os.path.relpath(existing[0], export_dir)
+
+def _load_local_model(model: str, backend: str, quantization_config: str, n_threads: Optional[int] = None):
+    """Load a SentenceTransformer with the "torch" backend (on `device`) or the exported "onnx-int8" backend (on CPU)."""
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch":
+        if n_threads is not None:
+            torch.set_num_threads(n_threads)
+        return SentenceTransformer(model, device=device if n_threads is None else "cpu")
+
+    export_dir, file_name = export_quantized_model(model, quantization_config)
+    model_kwargs = {"file_name": file_name, "provider": "CPUExecutionProvider"}
+    if n_threads is not None:
+        import onnxruntime
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = n_threads
+        model_kwargs["session_options"] = session_options
+    return SentenceTransformer(export_dir, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+_local_worker_model = None
+
+def _init_local_worker(model: str, backend: str, quantization_config: str, n_threads: int) -> None:
+    """Load the SentenceTransformer once per worker process."""
+    global _local_worker_model
+    _local_worker_model = _load_local_model(model, backend, quantization_config, n_threads)
+
+def _encode_local_batch(args: Tuple[np.ndarray, List]) -> Tuple[np.ndarray, np.ndarray]:
+    batch, model_inputs = args
+    return batch, _local_worker_model.encode(model_inputs, batch_size=len(model_inputs), show_progress_bar=False)
+
+def _length_sorted_batches(texts: List[str], batch_size: int) -> List[np.ndarray]:
+    """Split texts into batches of similar length, longest first, to minimize padding.
+
+    Character length is the same proxy for token length that SentenceTransformer uses
+    to sort within an `encode` call.
+    """
+    order = np.argsort(-np.array([len(text) for text in texts]), kind="stable")
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+def get_local_embedding_matrix(
+    texts: List[str],
+    model: str = "nomic-ai/modernbert-embed-base",
+    batch_size: int = 128,
+    show_progress: bool = True,
+    cache_name: Optional[str] = None,
+    chunk_size: int = 50000,
+    out_path: Optional[str] = None,
+    n_processes: int = 1,
+    backend: str = "torch",
+    quantization_config: str = "avx2",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Embed texts with a local SentenceTransformer model into a float32 matrix in input order.
+
+    Accepts the same `texts`, `cache_name`, `chunk_size` and `out_path` arguments as
+    `get_openai_embedding_matrix`, and returns the same (embeddings, failed mask) tuple.
+
+    Within each chunk, texts are sorted by length and batched longest first, so each
+    batch is padded only to the length of similar texts. With `n_processes > 1` (CPU
+    only), batches are spread over a pool of worker processes that each load the model
+    once and use CPU count / `n_processes` threads; results are written back in input
+    order as they arrive. Workers are spawned, so scripts that use this need an
+    `if __name__ == "__main__":` guard. Whether more processes help depends on the
+    machine (measure with `benchmarks/benchmark_local_embedding.py`); with more
+    processes than CPUs they only add overhead.
+
+    With `backend="onnx-int8"`, the model is exported once to a dynamically int8-quantized
+    ONNX model (see `export_quantized_model`, which takes `quantization_config`) and run
+    with ONNX Runtime on CPU. Its embeddings are cached separately from fp32 embeddings;
+    use `check_quantized_embeddings` to measure their agreement on your data.
+    """
+    if n_processes < 1:
+        raise ValueError(f"n_processes must be at least 1, got {n_processes}")
+    if backend not in LOCAL_BACKENDS:
+        raise ValueError(f"backend must be one of {LOCAL_BACKENDS}, got {backend}")
+    if n_processes > 1 and backend == "torch" and device != "cpu":
+        raise ValueError(f"Multi-process local embedding runs on CPU, but the embedding device is {device}")
+
+    recipe = get_local_recipe(model, backend, quantization_config)
+    job = _EmbeddingJob(texts, get_embedding_cache(cache_name, model, recipe), out_path)
+    texts_to_embed = job.texts_to_embed
+    if not texts_to_embed:
+        return job.finish()
+
+    # Load the model, here or once per worker process
+    pool = None
+    if n_processes > 1:
+        import multiprocessing
+        if backend != "torch":
+            export_quantized_model(model, quantization_config)  # export once, before the workers load it
+        n_cpus = os.cpu_count() or 1
+        if n_processes > n_cpus:
+            print(f"Warning: {n_processes} worker processes on {n_cpus} CPUs compete for cores and are usually slower than one process")
+        n_threads = max(1, n_cpus // n_processes)
+        pool = multiprocessing.get_context("spawn").Pool(
+            n_processes, initializer=_init_local_worker, initargs=(model, backend, quantization_config, n_threads)
+        )
+        print(f"Loading model {model} ({backend}) in {n_processes} worker processes ({n_threads} threads each)")
+    else:
+        transformer_model = _load_local_model(model, backend, quantization_config)
+        print(f"Loaded model {model} ({backend}) to {device if backend == 'torch' else 'cpu'}")
+
+    pbar = tqdm(total=len(texts_to_embed), desc="Embedding texts") if show_progress else None
+    try:
+        for chunk_start in range(0, len(texts_to_embed), chunk_size):
+            chunk_texts = texts_to_embed[chunk_start:chunk_start + chunk_size]
+            batches = [batch + chunk_start for batch in _length_sorted_batches(chunk_texts, batch_size)]
+            tasks = ((batch, _apply_local_recipe([texts_to_embed[j] for j in batch], recipe)) for batch in batches)
+            if pool is not None:
+                results = pool.imap_unordered(_encode_local_batch, tasks)
+            else:
+                results = (
+                    (batch, transformer_model.encode(model_inputs, batch_size=len(model_inputs), show_progress_bar=False))
+                    for batch, model_inputs in tasks
+                )
+            for batch, embeddings in results:
+                job.write(batch, embeddings)
+                job.save_to_cache(batch)
+                if pbar is not None:
+                    pbar.update(len(batch))
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if pbar is not None:
+            pbar.close()
+
+    return job.finish()
+
+def check_quantized_embeddings(
+    texts: List[str],
+    model: str = "nomic-ai/modernbert-embed-base",
+    quantization_config: str = "avx2",
+    batch_size: int = 128,
+    show_progress: bool = True,
+) -> Dict[str, float]:
+    """Compare int8 ONNX embeddings of `texts` with fp32 torch embeddings of the same model.
+
+    Returns summary statistics of the per-text cosine similarity between the two
+    (mean, min, and 1st/5th percentiles); a mean above ~0.99 usually means downstream
+    SAE features are unaffected.
+    """
+    fp32, fp32_failed = get_local_embedding_matrix(texts, model=model, batch_size=batch_size, show_progress=show_progress)
+    int8, int8_failed = get_local_embedding_matrix(
+        texts, model=model, batch_size=batch_size, show_progress=show_progress,
+        backend="onnx-int8", quantization_config=quantization_config,
+    )
+    valid = ~(fp32_failed | int8_failed)
+    fp32, int8 = fp32[valid], int8[valid]
+    cosine = np.sum(fp32 * int8, axis=1) / (np.linalg.norm(fp32, axis=1) * np.linalg.norm(int8, axis=1))
+    report = {
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "p01_cosine": float(np.percentile(cosine, 1)),
+        "p05_cosine": float(np.percentile(cosine, 5)),
+    }
+    print(", ".join(f"{name}={value:.4f}" for name, value in report.items()))
+    return report
+
+async def aget_openai_embeddings(
+    texts: List[str],
+    model: str = "text-embedding-3-small",
+    batch_size: Optional[int] = None,
+    n_workers: int = 5,
+    cache_name: Optional[str] = None,
+    show_progress: bool = True,
+    chunk_size: int = 50000,
+    timeout: float = 10.0,
+    use_rate_limiter: bool = True,
+) -> Dict[str, np.ndarray]:
+    """Async version of `get_openai_embeddings`."""
+    matrix, failed = await aget_openai_embedding_matrix(
+        texts, model=model, batch_size=batch_size, n_workers=n_workers, cache_name=cache_name,
+        show_progress=show_progress, chunk_size=chunk_size, timeout=timeout, use_rate_limiter=use_rate_limiter,
+    )
+    return _embeddings_dict(texts, matrix, failed)
 
 def get_openai_embeddings(
     texts: List[str],
     model: str = "text-embedding-3-small",
-    batch_size: int = 256,
+    batch_size: Optional[int] = None,
     n_workers: int = 5,
     cache_name: Optional[str] = None,
     show_progress: bool = True,
@@ -153,62 +663,16 @@ def get_openai_embeddings(
     timeout: float = 10.0,
     use_rate_limiter: bool = True,
 ) -> Dict[str, np.ndarray]:
-    """Get embeddings using OpenAI API with parallel processing and chunked caching."""
-    # Filter out None values and empty strings
-    texts = filter_invalid_texts(texts)
-    
-    # Setup cache
-    text2embedding = load_embedding_cache(cache_name)
-    texts_to_embed = [text for text in texts if text not in text2embedding]
-    
-    if not texts_to_embed:
-        return text2embedding
-    
-    from .llm_api import get_client
-    client = get_client()
-    
-    # Process in chunks
-    next_chunk_idx = _get_next_chunk_index(cache_name)
-    
-    # Create chunk ranges
-    chunk_ranges = [(i, min(i+chunk_size, len(texts_to_embed))) 
-                   for i in range(0, len(texts_to_embed), chunk_size)]
-    
-    # Outer progress bar for chunks
-    chunk_iterator = chunk_ranges
-    if show_progress:
-        chunk_iterator = tqdm(chunk_iterator, desc="Processing chunks", total=len(chunk_ranges))
-    
-    for chunk_start, chunk_end in chunk_iterator:
-        chunk_texts = texts_to_embed[chunk_start:chunk_end]
-        chunk_embeddings = {}
-        
-        # Process chunk in batches with parallel workers
-        batches = [chunk_texts[i:i+batch_size] for i in range(0, len(chunk_texts), batch_size)]
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
-            futures = []
-            for batch in batches:
-                futures.append(executor.submit(_embed_batch_openai, batch, model, client, timeout=timeout, use_rate_limiter=use_rate_limiter))
-            
-            # Process results as they complete
-            iterator = concurrent.futures.as_completed(futures)
-            if show_progress:
-                iterator = tqdm(iterator, total=len(batches), desc=f"Chunk {next_chunk_idx}")
-                
-            for future in iterator:
-                batch_result = future.result()
-                batch_idx = futures.index(future)
-                batch = batches[batch_idx]
-                
-                for text, embedding in zip(batch, batch_result):
-                    chunk_embeddings[text] = embedding
-                    text2embedding[text] = embedding
-        
-        # Save completed chunk
-        next_chunk_idx = _save_embedding_chunk(cache_name, chunk_embeddings, next_chunk_idx)
-    
-    return text2embedding
+    """Get embeddings using the OpenAI API with a rolling window of concurrent requests and chunked caching.
+
+    Returns a dict mapping each requested text to its embedding (failed texts are omitted).
+    To get a matrix in input order without building a dict, use `get_openai_embedding_matrix`.
+    """
+    matrix, failed = get_openai_embedding_matrix(
+        texts, model=model, batch_size=batch_size, n_workers=n_workers, cache_name=cache_name,
+        show_progress=show_progress, chunk_size=chunk_size, timeout=timeout, use_rate_limiter=use_rate_limiter,
+    )
+    return _embeddings_dict(texts, matrix, failed)
 
 def get_local_embeddings(
     texts: List[str],
@@ -217,60 +681,16 @@ def get_local_embeddings(
     show_progress: bool = True,
     cache_name: Optional[str] = None,
     chunk_size: int = 50000,
+    n_processes: int = 1,
+    backend: str = "torch",
 ) -> Dict[str, np.ndarray]:
-    """Get embeddings using local SentenceTransformer model with chunked caching."""
-    from sentence_transformers import SentenceTransformer
+    """Get embeddings using local SentenceTransformer model with chunked caching.
 
-    # Filter out None values and empty strings
-    texts = filter_invalid_texts(texts)
-    
-    # Setup cache
-    text2embedding = load_embedding_cache(cache_name)
-    texts_to_embed = [text for text in texts if text not in text2embedding]
-    
-    if not texts_to_embed:
-        return text2embedding
-    
-    # Load model
-    transformer_model = SentenceTransformer(model, device=device)
-    print(f"Loaded model {model} to {device}")
-    
-    # Process in chunks
-    next_chunk_idx = _get_next_chunk_index(cache_name)
-    
-    # Create chunk ranges
-    chunk_ranges = [(i, min(i+chunk_size, len(texts_to_embed))) 
-                   for i in range(0, len(texts_to_embed), chunk_size)]
-    
-    # Outer progress bar for chunks
-    chunk_iterator = chunk_ranges
-    if show_progress:
-        chunk_iterator = tqdm(chunk_iterator, desc="Processing chunks", total=len(chunk_ranges))
-    
-    for chunk_start, chunk_end in chunk_iterator:
-        chunk_texts = texts_to_embed[chunk_start:chunk_end]
-        chunk_embeddings = {}
-        
-        # Process chunk in batches
-        batch_iterator = range(0, len(chunk_texts), batch_size)
-        if show_progress:
-            batch_iterator = tqdm(batch_iterator, desc=f"Chunk {next_chunk_idx}")
-            
-        for i in batch_iterator:
-            batch = chunk_texts[i:i+batch_size]
-            if "nomic-ai" in model:
-                batch = ["search_document: " + text for text in batch]
-            elif "instructor" in model:
-                batch = [["Represent the text for classification: ", text] for text in batch]
-            else:
-                batch = batch
-            batch_embs = transformer_model.encode(batch, batch_size=batch_size)
-            
-            for text, embedding in zip(batch, batch_embs):
-                chunk_embeddings[text] = embedding
-                text2embedding[text] = embedding
-        
-        # Save completed chunk
-        next_chunk_idx = _save_embedding_chunk(cache_name, chunk_embeddings, next_chunk_idx)
-    
-    return text2embedding
\ No newline at end of file
+    Returns a dict mapping each requested text to its embedding (failed texts are omitted).
+    To get a matrix in input order without building a dict, use `get_local_embedding_matrix`.
+    """
+    matrix, failed = get_local_embedding_matrix(
+        texts, model=model, batch_size=batch_size, show_progress=show_progress,
+        cache_name=cache_name, chunk_size=chunk_size, n_processes=n_processes, backend=backend,
+    )
+    return _embeddings_dict(texts, matrix, failed)
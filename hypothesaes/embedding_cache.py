@@ -0,0 +1,384 @@
+"""Memory-mapped embedding cache: one contiguous float matrix plus a text-hash -> row index.
+
+A cache directory holds:
+    meta.json        {"dim": D, "dtype": "<f4"}
+    embeddings.bin   raw (N, D) row-major matrix, memory-mapped for reads and appended to on writes
+    scales.bin       float32 scale of each row (int8 caches only)
+    hashes.bin       append-only journal of the 64-bit text hash of each row, in row order
+    index.npz        sorted hashes and row numbers of the first `n_rows` rows (a compacted snapshot)
+
+Each `add` appends its rows to `embeddings.bin`, fsyncs, and only then appends their
+hashes to `hashes.bin` and fsyncs again. A row is committed once its hash is in the
+journal, so a crash mid-write leaves at most an uncommitted tail that is ignored on
+open and overwritten by the next write. Rows journaled after the last index snapshot
+are indexed in memory on open; once there are `compact_every` of them, they are merged
+into `index.npz` by a background thread (written to a temporary file and renamed).
+Since files are only appended to or atomically replaced, concurrent readers always see
+a consistent prefix of the cache. Writers, in any thread or process, serialize each
+append-and-commit with an exclusive `flock` on a `lock` file, and first index the rows
+other writers committed, so rows are never written at the same offset twice.
+
+Looking up a batch of texts hashes them, binary-searches the index, and gathers only
+the requested rows from the memory-mapped matrix.
+
+Embeddings can be stored as float32, float16, or int8 with one symmetric scale per row
+(`max |x| / 127`), which halves or quarters the size of the cache on disk and in the page
+cache; rows are dequantized to float32 when read.
+"""
+
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from tqdm.auto import tqdm
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+EMBEDDING_CACHE_DTYPE = np.dtype(np.float32)
+EMBEDDING_CACHE_STORAGE_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2"), "int8": np.dtype("i1")}
+# Number of journaled rows outside the index snapshot that triggers a background compaction
+EMBEDDING_CACHE_COMPACT_EVERY = 65536
+
+_HASH_DTYPE = np.dtype("<u8")
+
+
+def hash_texts(texts: Sequence[str]) -> np.ndarray:
+    """Return a uint64 hash (first 8 bytes of BLAKE2b) of each text."""
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little") for text in texts),
+        dtype=np.uint64,
+        count=len(texts),
+    )
+
+
+def quantize_embeddings(embeddings: np.ndarray, dtype: np.dtype) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Convert float embeddings to the storage `dtype`; returns (stored, per-row scales or None)."""
+    embeddings = np.asarray(embeddings, dtype=EMBEDDING_CACHE_DTYPE)
+    if np.dtype(dtype) != np.int8:
+        return embeddings.astype(dtype), None
+    scales = np.abs(embeddings).max(axis=1) / 127
+    scales[scales == 0] = 1
+    stored = np.rint(embeddings / scales[:, None]).astype(np.int8)
+    return stored, scales.astype(EMBEDDING_CACHE_DTYPE)
+
+
+def dequantize_embeddings(stored: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    """Inverse of `quantize_embeddings` (up to rounding): float32 embeddings."""
+    embeddings = np.asarray(stored, dtype=EMBEDDING_CACHE_DTYPE)
+    if scales is not None:
+        embeddings *= np.asarray(scales, dtype=EMBEDDING_CACHE_DTYPE)[:, None]
+    return embeddings
+
+
+def _search(sorted_hashes: np.ndarray, rows: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+    """Return the row of each of `hashes` in a sorted (hashes, rows) index, or -1."""
+    if len(sorted_hashes) == 0:
+        return np.full(len(hashes), -1, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(sorted_hashes, hashes), len(sorted_hashes) - 1)
+    return np.where(sorted_hashes[pos] == hashes, rows[pos], -1)
+
+
+@contextlib.contextmanager
+def _exclusive_file_lock(path: str):
+    """Hold an exclusive `flock` on `path` (not available on Windows, where writers are not serialized)."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _append_durably(path: str, committed_bytes: int, data: memoryview) -> None:
+    with open(path, "ab") as f:
+        f.truncate(committed_bytes)  # drop the uncommitted tail of an interrupted write
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, compact_every: int = EMBEDDING_CACHE_COMPACT_EVERY, dtype: str = "float32") -> None:
+        """Open (or lazily create) the embedding cache stored in `cache_dir`.
+
+        Parameters
+        ----------
+        cache_dir : str
+            Cache directory. If it contains only legacy `chunk_*.npy` files (pickled
+            lists of (text, embedding) tuples), they are converted once on open.
+        compact_every : int, optional
+            Number of rows journaled since the last index snapshot at which `add`
+            starts a background compaction.
+        dtype : str, optional
+            Storage dtype of a new cache: "float32", "float16", or "int8" (per-row scaled).
+            An existing cache keeps the dtype it was created with.
+        """
+        if dtype not in EMBEDDING_CACHE_STORAGE_DTYPES:
+            raise ValueError(f"dtype must be one of {list(EMBEDDING_CACHE_STORAGE_DTYPES)}, got {dtype}")
+        self.cache_dir = cache_dir
+        self.compact_every = compact_every
+        self.dtype = EMBEDDING_CACHE_STORAGE_DTYPES[dtype]
+        self.dim = None
+        self.n_rows = 0
+        self._lock = threading.Lock()
+        self._compaction = None
+        # Sorted snapshot of rows [0, _n_indexed), and sorted journal tail of rows [_n_indexed, n_rows)
+        self._n_indexed = 0
+        self._index_hashes = np.empty(0, dtype=np.uint64)
+        self._index_rows = np.empty(0, dtype=np.int64)
+        self._tail_hashes = np.empty(0, dtype=np.uint64)
+        self._tail_rows = np.empty(0, dtype=np.int64)
+        self._matrix = None
+        self._scales = None
+
+        if os.path.exists(self._path("meta.json")):
+            self.refresh()
+        elif glob.glob(self._path("chunk_*.npy")):
+            self._convert_legacy_chunks()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    @property
+    def _is_scaled(self) -> bool:
+        return self.dtype == np.int8
+
+    def _write_meta(self) -> None:
+        with open(self._path("meta.json.tmp"), "w") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.str}, f)
+        os.replace(self._path("meta.json.tmp"), self._path("meta.json"))
+
+    def refresh(self) -> None:
+        """(Re)read the committed state of the cache from disk, e.g. to see rows added by another process."""
+        with open(self._path("meta.json"), "r") as f:
+            meta = json.load(f)
+        with self._lock:
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta.get("dtype", EMBEDDING_CACHE_DTYPE.str))
+            if not os.path.exists(self._path("hashes.bin")) and meta.get("n_rows"):
+                self._create_journal_from_index(meta["n_rows"])
+
+            if os.path.exists(self._path("index.npz")):
+                with np.load(self._path("index.npz")) as index:
+                    self._index_hashes, self._index_rows = index["hashes"], index["rows"]
+                    self._n_indexed = int(index["n_rows"]) if "n_rows" in index else len(index["rows"])
+
+            # Committed rows: journaled hashes whose data is fully written
+            n_journaled = os.path.getsize(self._path("hashes.bin")) // _HASH_DTYPE.itemsize if os.path.exists(self._path("hashes.bin")) else 0
+            n_data = os.path.getsize(self._path("embeddings.bin")) // self._row_bytes if os.path.exists(self._path("embeddings.bin")) and self.dim else 0
+            if self._is_scaled:
+                n_data = min(n_data, os.path.getsize(self._path("scales.bin")) // EMBEDDING_CACHE_DTYPE.itemsize if os.path.exists(self._path("scales.bin")) else 0)
+            self.n_rows = max(min(n_journaled, n_data), self._n_indexed)
+
+            tail_hashes = np.empty(0, dtype=np.uint64)
+            if self.n_rows > self._n_indexed:
+                tail_hashes = np.fromfile(
+                    self._path("hashes.bin"), dtype=_HASH_DTYPE,
+                    count=self.n_rows - self._n_indexed, offset=self._n_indexed * _HASH_DTYPE.itemsize,
+                ).astype(np.uint64)
+            order = np.argsort(tail_hashes, kind="stable")
+            self._tail_hashes = tail_hashes[order]
+            self._tail_rows = np.arange(self._n_indexed, self.n_rows, dtype=np.int64)[order]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """The (n_rows, dim) cached embedding matrix in its storage dtype, memory-mapped read-only.
+
+        Use `read_rows` (or `get`) for float32 embeddings.
+        """
+        if self.n_rows == 0:
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+        if self._matrix is None or self._matrix.shape[0] != self.n_rows:
+            self._matrix = np.memmap(
+                self._path("embeddings.bin"), dtype=self.dtype, mode="r", shape=(self.n_rows, self.dim)
+            )
+        return self._matrix
+
+    def read_rows(self, rows: np.ndarray) -> np.ndarray:
+        """Return the float32 embeddings of cache `rows` (read in increasing row order for best I/O)."""
+        if not self._is_scaled:
+            return np.asarray(self.matrix[rows], dtype=EMBEDDING_CACHE_DTYPE)
+        if self._scales is None or self._scales.shape[0] != self.n_rows:
+            self._scales = np.memmap(self._path("scales.bin"), dtype=EMBEDDING_CACHE_DTYPE, mode="r", shape=(self.n_rows,))
+        return dequantize_embeddings(self.matrix[rows], self._scales[rows])
+
+    def _lookup_hashes(self, hashes: np.ndarray) -> np.ndarray:
+        with self._lock:
+            index_hashes, index_rows = self._index_hashes, self._index_rows
+            tail_hashes, tail_rows = self._tail_hashes, self._tail_rows
+        rows = _search(index_hashes, index_rows, hashes)
+        missing = np.flatnonzero(rows < 0)
+        if len(missing) > 0:
+            rows[missing] = _search(tail_hashes, tail_rows, hashes[missing])
+        return rows
+
+    def lookup(self, texts: Sequence[str]) -> np.ndarray:
+        """Return the cache row of each text, or -1 for texts that are not cached."""
+        return self._lookup_hashes(hash_texts(texts))
+
+    def get(self, texts: Sequence[str], out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ((N, dim) embeddings, found mask) for `texts`; rows of uncached texts are left as zeros.
+
+        Rows are gathered from the memory-mapped matrix in file order, so only the
+        requested rows are read. If `out` is given, rows are written into it.
+        """
+        rows = self.lookup(texts)
+        found = rows >= 0
+        if out is None:
+            out = np.zeros((len(texts), self.dim or 0), dtype=EMBEDDING_CACHE_DTYPE)
+        positions = np.flatnonzero(found)
+        if len(positions) > 0:
+            order = np.argsort(rows[positions], kind="stable")
+            out[positions[order]] = self.read_rows(rows[positions[order]])
+        return out, found
+
+    def add(self, texts: Sequence[str], embeddings: np.ndarray) -> None:
+        """Durably append embeddings for texts that are not cached yet.
+
+        Cheap enough to call after every batch: it appends to the data file and the
+        hash journal and updates the in-memory index; the index file is rewritten
+        only by (background) compaction.
+        """
+        embeddings = np.asarray(embeddings, dtype=EMBEDDING_CACHE_DTYPE)
+        if len(texts) == 0:
+            return
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(texts):
+            raise ValueError(f"Expected embeddings of shape ({len(texts)}, dim), got {embeddings.shape}")
+        if self.dim is not None and embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match the cache dimension {self.dim}")
+
+        # Skip texts repeated within this batch
+        hashes = hash_texts(texts)
+        new_hashes, first = np.unique(hashes, return_index=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Writers in other threads and processes append at the same offsets, so the append and
+        # its commit are serialized by a lock file, after catching up on their committed rows
+        with self._lock, _exclusive_file_lock(self._path("lock")):
+            self._read_new_rows()
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                self._write_meta()
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match the cache dimension {self.dim}")
+
+            # Skip texts that are already cached
+            is_new = (_search(self._index_hashes, self._index_rows, new_hashes) < 0) & (_search(self._tail_hashes, self._tail_rows, new_hashes) < 0)
+            first = np.sort(first[is_new])
+            if len(first) == 0:
+                return
+            new_hashes = hashes[first]
+
+            # Data (and scales) first, then the journal entries that commit it
+            stored, scales = quantize_embeddings(embeddings[first], self.dtype)
+            _append_durably(self._path("embeddings.bin"), self.n_rows * self._row_bytes, np.ascontiguousarray(stored).data)
+            if scales is not None:
+                _append_durably(self._path("scales.bin"), self.n_rows * EMBEDDING_CACHE_DTYPE.itemsize, scales.data)
+            _append_durably(self._path("hashes.bin"), self.n_rows * _HASH_DTYPE.itemsize, new_hashes.astype(_HASH_DTYPE).data)
+
+            self._extend_tail(new_hashes)
+            should_compact = len(self._tail_rows) >= self.compact_every
+
+        if should_compact:
+            self.compact(background=True)
+
+    def _extend_tail(self, new_hashes: np.ndarray) -> None:
+        """Index `new_hashes` as the rows following `n_rows` (caller holds `_lock`)."""
+        tail_hashes = np.concatenate([self._tail_hashes, new_hashes])
+        tail_rows = np.concatenate([self._tail_rows, np.arange(self.n_rows, self.n_rows + len(new_hashes), dtype=np.int64)])
+        order = np.argsort(tail_hashes, kind="stable")
+        self._tail_hashes, self._tail_rows = tail_hashes[order], tail_rows[order]
+        self.n_rows += len(new_hashes)
+
+    def _read_new_rows(self) -> None:
+        """Index rows committed by other writers since this cache was read (caller holds both locks)."""
+        if self.dim is None:
+            if not os.path.exists(self._path("meta.json")):
+                return
+            with open(self._path("meta.json"), "r") as f:
+                meta = json.load(f)
+            self.dim, self.dtype = meta["dim"], np.dtype(meta.get("dtype", EMBEDDING_CACHE_DTYPE.str))
+        # No other writer holds the lock, so every journaled row is committed
+        n_journaled = os.path.getsize(self._path("hashes.bin")) // _HASH_DTYPE.itemsize if os.path.exists(self._path("hashes.bin")) else 0
+        if n_journaled > self.n_rows:
+            self._extend_tail(np.fromfile(
+                self._path("hashes.bin"), dtype=_HASH_DTYPE,
+                count=n_journaled - self.n_rows, offset=self.n_rows * _HASH_DTYPE.itemsize,
+            ).astype(np.uint64))
+
+    def compact(self, background: bool = False) -> None:
+        """Merge the journaled rows into the `index.npz` snapshot (in a daemon thread if `background`)."""
+        if self._compaction is not None and self._compaction.is_alive():
+            if background:
+                return
+            self._compaction.join()
+        if background:
+            self._compaction = threading.Thread(target=self._compact, daemon=True)
+            self._compaction.start()
+        else:
+            self._compact()
+
+    def wait(self) -> None:
+        """Wait for a running background compaction to finish."""
+        if self._compaction is not None:
+            self._compaction.join()
+
+    def _compact(self) -> None:
+        with self._lock:
+            n_rows = self.n_rows
+            hashes = np.concatenate([self._index_hashes, self._tail_hashes])
+            rows = np.concatenate([self._index_rows, self._tail_rows])
+        if n_rows == self._n_indexed:
+            return
+        order = np.argsort(hashes, kind="stable")
+        hashes, rows = hashes[order], rows[order]
+
+        tmp_path = self._path(f"index.npz.tmp-{os.getpid()}")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, hashes=hashes, rows=rows, n_rows=np.int64(n_rows))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path("index.npz"))
+
+        with self._lock:
+            # Rows added while compacting stay in the tail
+            keep = self._tail_rows >= n_rows
+            self._tail_hashes, self._tail_rows = self._tail_hashes[keep], self._tail_rows[keep]
+            self._index_hashes, self._index_rows, self._n_indexed = hashes, rows, n_rows
+
+    def _create_journal_from_index(self, n_rows: int) -> None:
+        """Write `hashes.bin` for a cache whose committed row count was stored in `meta.json`."""
+        with np.load(self._path("index.npz")) as index:
+            row_hashes = np.empty(n_rows, dtype=_HASH_DTYPE)
+            row_hashes[index["rows"]] = index["hashes"]
+        _append_durably(self._path("hashes.bin"), 0, row_hashes.data)
+        self._write_meta()
+
+    def _convert_legacy_chunks(self) -> None:
+        chunk_files = sorted(glob.glob(self._path("chunk_*.npy")))
+        print(f"Converting {len(chunk_files)} legacy embedding cache chunks in {self.cache_dir}")
+        for chunk_file in tqdm(chunk_files, desc="Converting embedding chunks"):
+            # Legacy chunks are object arrays of (text, embedding) tuples
+            chunk_data = np.load(chunk_file, allow_pickle=True)
+            texts: List[str] = [text for text, _ in chunk_data]
+            self.add(texts, np.stack([np.asarray(emb, dtype=EMBEDDING_CACHE_DTYPE) for _, emb in chunk_data]))
+        self.compact()
+        print(f"Converted {self.n_rows} embeddings; the chunk_*.npy files are no longer read and can be deleted")
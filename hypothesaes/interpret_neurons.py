@@ -8,7 +8,7 @@ import os
 from dataclasses import dataclass, field
 
 from .llm_api import get_completion
-from .utils import load_prompt, truncate_text
+from .utils import load_prompt, truncate_text, get_neuron_activations, to_neuron_major
 from .annotate import annotate, CACHE_DIR
 
 DEFAULT_TASK_SPECIFIC_INSTRUCTIONS = """An example feature could be:
@@ -28,7 +28,7 @@ def sample_top_zero(
     if random_seed is not None:
         np.random.seed(random_seed)
         
-    neuron_acts = activations[:, neuron_idx]
+    neuron_acts = get_neuron_activations(activations, neuron_idx)
     n_per_class = n_examples // 2
     
     # Get indices of positive activations and take top n_per_class (or fewer if not enough positive)
@@ -75,7 +75,7 @@ def sample_percentile_bins(
     if random_seed is not None:
         np.random.seed(random_seed)
         
-    neuron_acts = activations[:, neuron_idx]
+    neuron_acts = get_neuron_activations(activations, neuron_idx)
     n_per_class = n_examples // 2
     
     pos_mask = neuron_acts > 0
@@ -139,7 +139,8 @@ def sample_custom(
     
     Args:
         texts: List of all text examples
-        activations: Neuron activation matrix (n_samples, n_neurons)
+        activations: Neuron activation matrix (n_samples, n_neurons), or a sparse form accepted by
+            `utils.get_neuron_activations` (use it to extract the neuron's activation vector)
         neuron_idx: Index of neuron to sample examples for
         [any other arguments]
     """
@@ -242,7 +243,7 @@ class NeuronInterpreter:
         config: InterpretConfig
     ) -> str:
         """Generate interpretation for a single neuron."""
-        if np.all(activations[:, neuron_idx] <= 0):
+        if np.all(get_neuron_activations(activations, neuron_idx) <= 0):
             print(f"Warning: All activations for neuron {neuron_idx} are <= 0. This neuron may be dead. Skipping interpretation.")
             return None
 
@@ -272,6 +273,7 @@ class NeuronInterpreter:
     ) -> Dict[int, List[str]]:
         """Generate interpretations for multiple neurons with multiple candidates each."""
         config = config or InterpretConfig()
+        activations = to_neuron_major(activations)
         
         interpretation_tasks = [
             (neuron_idx, candidate_idx)
@@ -348,6 +350,7 @@ class NeuronInterpreter:
     ) -> Dict[int, Dict[str, Dict[str, float]]]:
         """Score all interpretations for all neurons."""
         config = config or ScoringConfig()
+        activations = to_neuron_major(activations)
         tasks = []
         scoring_info = {}
 
@@ -379,7 +382,7 @@ class NeuronInterpreter:
         # Annotate all tasks
         progress_desc = f"Scoring neuron interpretation fidelity ({len(interpretations)} neurons; {len(next(iter(interpretations.values())))} candidate interps per neuron; {config.n_examples} examples to score each interp)"
         
-        cache_path = None if self.cache_name is None else os.path.join(CACHE_DIR, f"{self.cache_name}_interp-scoring.json")
+        cache_path = None if self.cache_name is None else os.path.join(CACHE_DIR, f"{self.cache_name}_interp-scoring.sqlite")
         annotations = annotate(
             tasks=tasks,
             cache_path=cache_path,
@@ -40,6 +40,14 @@ def get_client():
     
     return openai.OpenAI(api_key=api_key)
 
+def get_async_client():
+    """Get an asyncio OpenAI client (create it inside the event loop that uses it)."""
+    api_key = os.environ.get('OPENAI_KEY_SAE')
+    if api_key is None or '...' in api_key:
+        raise ValueError("Please set the OPENAI_KEY_SAE environment variable before using functions which require the OpenAI API.")
+    
+    return openai.AsyncOpenAI(api_key=api_key)
+
 def get_completion(
     prompt: str,
     model: str = "gpt-4o",
@@ -7,23 +7,55 @@ import torch
 import os
 from pathlib import Path
 
-from .sae import SparseAutoencoder, load_model, get_multiple_sae_activations, get_sae_checkpoint_name
+from .sae import SparseAutoencoder, load_model, get_multiple_sae_activations, get_sae_checkpoint_name, find_existing_checkpoint
+from .distributed import fit_data_parallel
+from .activation_cache import get_cached_sae_activations
+from .dedup import TextDeduplication
 from .select_neurons import select_neurons
+from .streaming import StreamingEmbeddingDataset
 from .interpret_neurons import NeuronInterpreter, InterpretConfig, ScoringConfig, LLMConfig, SamplingConfig
-from .utils import get_text_for_printing
+from .utils import get_text_for_printing, get_neuron_activations, get_num_neurons
 from .annotate import annotate_texts_with_concepts
 from .evaluation import score_hypotheses
 BASE_DIR = Path(__file__).parent.parent
 
+def _prepare_training_embeddings(
+    embeddings: Union[List, np.ndarray, str, StreamingEmbeddingDataset],
+) -> Union[torch.Tensor, StreamingEmbeddingDataset]:
+    """Return an in-memory float tensor, or a streaming dataset for on-disk embeddings.
+
+    Paths (or lists of paths), memmaps, and `StreamingEmbeddingDataset`s are streamed;
+    in-memory float32 arrays are shared with the returned tensor rather than copied.
+    """
+    if isinstance(embeddings, StreamingEmbeddingDataset):
+        return embeddings
+    if isinstance(embeddings, (str, os.PathLike, np.memmap)):
+        return StreamingEmbeddingDataset(embeddings)
+    if isinstance(embeddings, list) and len(embeddings) > 0 and isinstance(embeddings[0], (str, os.PathLike, np.memmap)):
+        return StreamingEmbeddingDataset(embeddings)
+    if isinstance(embeddings, torch.Tensor):
+        return embeddings.float()
+    return torch.from_numpy(np.asarray(embeddings, dtype=np.float32))
+
+def _get_activations(sae, X, cache_activations: bool, dedup: Optional[TextDeduplication] = None):
+    if dedup is not None:
+        # Encode one representative per group of duplicates and broadcast its activations
+        activations, neuron_source_sae_info = _get_activations(sae, dedup.unique(X), cache_activations)
+        return dedup.expand(activations), neuron_source_sae_info
+    if cache_activations:
+        # Stored as top-K (K values per row rather than M), returned neuron-major
+        return get_cached_sae_activations(sae, X, output_format="csc")
+    return get_multiple_sae_activations(sae, X, return_neuron_source_info=True)
+
 def train_sae(
-    embeddings: Union[List, np.ndarray],
+    embeddings: Union[List, np.ndarray, str, StreamingEmbeddingDataset],
     M: int,
     K: int,
     *,
     matryoshka_prefix_lengths: Optional[List[int]] = None,
     checkpoint_dir: Optional[str] = None,
     overwrite_checkpoint: bool = False,
-    val_embeddings: Optional[Union[List, np.ndarray]] = None,
+    val_embeddings: Optional[Union[List, np.ndarray, str, StreamingEmbeddingDataset]] = None,
     aux_k: Optional[int] = None,
     multi_k: Optional[int] = None,
     dead_neuron_threshold_steps: int = 256,
@@ -35,11 +67,19 @@ def train_sae(
     patience: int = 3,
     clip_grad: float = 1.0,
     show_progress: bool = True,
+    checkpoint_every_n_steps: Optional[int] = None,
+    resume: bool = False,
+    device_resident_data: bool = False,
+    mixed_precision: bool = False,
+    compile: bool = False,
+    n_processes: int = 1,
 ) -> SparseAutoencoder:
     """Train a Sparse Autoencoder or load an existing one.
     
     Args:
-        embeddings: Pre-computed embeddings for training (list or numpy array)
+        embeddings: Pre-computed embeddings for training (list or numpy array). For embedding sets
+            larger than RAM, pass a `.npy` path, a list of shard paths, a memmap, or a
+            `StreamingEmbeddingDataset`; batches are then streamed from disk
         M: Number of neurons in SAE
         K: Number of top-activating neurons to keep per forward pass
         matryoshka_prefix_lengths: List of prefix lengths for Matryoshka loss (None for vanilla SAE)
@@ -57,22 +97,30 @@ def train_sae(
         patience: Early stopping patience
         clip_grad: Gradient clipping value
         show_progress: Whether to show training progress bar
+        checkpoint_every_n_steps: If set, write a resumable training checkpoint (including optimizer
+            and RNG state) to checkpoint_dir/resume/ every this many steps and after every epoch
+        resume: Whether to continue from the newest resumable checkpoint in checkpoint_dir, if any
+        device_resident_data: Whether to move the in-memory embeddings to the training device once
+            (faster on GPU if they fit) instead of copying each batch from host memory
+        mixed_precision: Whether to run encoder/decoder matmuls under bf16 autocast (weights and loss stay fp32)
+        compile: Whether to wrap the forward+loss step in torch.compile (falls back to eager mode on failure)
+        n_processes: Number of CPU processes for data-parallel training (torch.distributed with the gloo
+            backend); each batch of batch_size rows is split across the processes
         
     Returns:
         Trained SparseAutoencoder model
     """
-    embeddings = np.array(embeddings)
-    input_dim = embeddings.shape[1]
-    
-    X = torch.tensor(embeddings, dtype=torch.float)
-    X_val = torch.tensor(val_embeddings, dtype=torch.float) if val_embeddings is not None else None
+    X = _prepare_training_embeddings(embeddings)
+    X_val = _prepare_training_embeddings(val_embeddings) if val_embeddings is not None else None
+    input_dim = X.shape[1]
     
     if checkpoint_dir is not None:
         os.makedirs(checkpoint_dir, exist_ok=True)
         checkpoint_name = get_sae_checkpoint_name(M, K, matryoshka_prefix_lengths)
         checkpoint_path = os.path.join(checkpoint_dir, checkpoint_name)
-        if os.path.exists(checkpoint_path) and not overwrite_checkpoint:
-            return load_model(checkpoint_path)
+        existing_path = find_existing_checkpoint(checkpoint_path)
+        if existing_path is not None and not overwrite_checkpoint:
+            return load_model(existing_path)
     
     sae = SparseAutoencoder(
         input_dim=input_dim,
@@ -84,9 +132,7 @@ def train_sae(
         prefix_lengths=matryoshka_prefix_lengths,
     )
     
-    sae.fit(
-        X_train=X,
-        X_val=X_val,
+    fit_kwargs = dict(
         save_dir=checkpoint_dir,
         batch_size=batch_size,
         learning_rate=learning_rate,
@@ -96,7 +142,16 @@ def train_sae(
         patience=patience,
         clip_grad=clip_grad,
         show_progress=show_progress,
+        checkpoint_every_n_steps=checkpoint_every_n_steps,
+        resume=resume,
+        device_resident_data=device_resident_data,
+        mixed_precision=mixed_precision,
+        compile=compile,
     )
+    if n_processes > 1:
+        fit_data_parallel(sae, X, X_val, n_processes=n_processes, **fit_kwargs)
+    else:
+        sae.fit(X_train=X, X_val=X_val, **fit_kwargs)
 
     return sae
 
@@ -117,6 +172,8 @@ def interpret_sae(
     print_examples_n: int = 3,
     print_examples_max_chars: int = 1024,
     task_specific_instructions: Optional[str] = None,
+    cache_activations: bool = False,
+    dedup: Optional[TextDeduplication] = None,
 ) -> Dict:
     """Interpret neurons in a Sparse Autoencoder.
     
@@ -136,6 +193,11 @@ def interpret_sae(
         print_examples_n: Number of top activating examples to print (0 to disable)
         print_examples_max_chars: Maximum characters per example to print (None to print full text)
         task_specific_instructions: Optional task-specific instructions to include in the interpretation prompt
+        cache_activations: Whether to load/store SAE activations in the on-disk activation cache
+            (see `activation_cache.ActivationCache`), keyed by the SAE weights and the embeddings;
+            activations are then stored as top-K and returned as a SciPy CSC matrix
+        dedup: Optional `deduplicate_texts(texts)` result; SAE activations are computed once
+            per group of duplicate texts and copied to every row of the group
         
     Returns:
         Dictionary mapping neuron indices to their interpretations and top examples
@@ -152,12 +214,12 @@ def interpret_sae(
         X = embeddings
     
     # Get activations from SAE(s)
-    activations, neuron_source_sae_info = get_multiple_sae_activations(sae, X, return_neuron_source_info=True)
+    activations, neuron_source_sae_info = _get_activations(sae, X, cache_activations, dedup)
     print(f"Activations shape: {activations.shape}")
     
     # Select neurons to interpret
     if neuron_indices is None:
-        total_neurons = activations.shape[1]
+        total_neurons = get_num_neurons(activations)
         neuron_indices = np.random.choice(total_neurons, size=n_random_neurons, replace=False)
     
     # Set up interpreter
@@ -190,7 +252,7 @@ def interpret_sae(
     # Find top activating examples for each neuron if requested
     results_list = []
     for idx in neuron_indices:
-        neuron_activations = activations[:, idx]
+        neuron_activations = get_neuron_activations(activations, idx)
         result_dict = {
             "neuron_idx": int(idx),
             "source_sae": neuron_source_sae_info[idx],
@@ -233,6 +295,8 @@ def generate_hypotheses(
     n_workers_interpretation: int = 10,
     n_workers_annotation: int = 30,
     task_specific_instructions: Optional[str] = None,
+    cache_activations: bool = False,
+    dedup: Optional[TextDeduplication] = None,
 ) -> Union[pd.DataFrame, Tuple[pd.DataFrame, np.ndarray]]:
     """Generate interpretable hypotheses from text data using SAEs.
     
@@ -251,6 +315,11 @@ def generate_hypotheses(
         n_scoring_examples: Number of examples to use when scoring interpretations
         scoring_metric: Metric to use for ranking interpretations ('f1', 'precision', 'recall', 'correlation')
         task_specific_instructions: Optional task-specific instructions to include in the interpretation prompt
+        cache_activations: Whether to load/store SAE activations in the on-disk activation cache
+            (see `activation_cache.ActivationCache`), keyed by the SAE weights and the embeddings;
+            activations are then stored as top-K and returned as a SciPy CSC matrix
+        dedup: Optional `deduplicate_texts(texts)` result; SAE activations are computed once
+            per group of duplicate texts and copied to every row of the group
 
     Returns:
         DataFrame with columns: neuron_idx, target_{selection_method}, interpretation, interp_{scoring_metric}
@@ -268,7 +337,7 @@ def generate_hypotheses(
     print(f"Embeddings shape: {embeddings.shape}")
 
     # Get activations from SAE(s)
-    activations, neuron_source_sae_info = get_multiple_sae_activations(sae, X, return_neuron_source_info=True)
+    activations, neuron_source_sae_info = _get_activations(sae, X, cache_activations, dedup)
     print(f"Activations shape: {activations.shape}")
 
     print(f"\nStep 1: Selecting top {n_selected_neurons} predictive neurons")
@@ -364,6 +433,7 @@ def evaluate_hypotheses(
     classification: Optional[bool] = None,
     n_workers_annotation: int = 30,
     corrected_pval_threshold: float = 0.1,
+    dedup: Optional[TextDeduplication] = None,
 ) -> pd.DataFrame:
     """Evaluate hypotheses on a heldout dataset.
     
@@ -375,6 +445,8 @@ def evaluate_hypotheses(
         max_words_per_example: Maximum words per example for annotation
         classification: Whether this is a classification task. If None, inferred from labels
         cache_name: Optional string prefix for storing annotation cache
+        dedup: Optional `deduplicate_texts(texts)` result; each group of duplicate texts is
+            annotated once and its annotations are copied to every row of the group
         
     Returns:
         DataFrame with original columns plus evaluation metrics
@@ -397,6 +469,7 @@ def evaluate_hypotheses(
         model=annotator_model,
         cache_name=cache_name,
         n_workers=n_workers_annotation,
+        dedup=dedup,
     )
     
     # Step 2: Evaluate annotations against the true labels
@@ -39,21 +39,29 @@ class RateLimiter:
         )
         self._last_update_time = current_time
     
+    def _try_reserve(self, tokens_needed: int) -> bool:
+        """Reserve capacity for one request if it is available."""
+        with self._lock:
+            self._update_capacity()
+            
+            if (self._available_request_capacity >= 1 and 
+                self._available_token_capacity >= tokens_needed):
+                # Reserve capacity
+                self._available_request_capacity -= 1
+                self._available_token_capacity -= tokens_needed
+                return True
+            return False
+    
     def wait_for_capacity(self, tokens_needed: int = 1) -> None:
         """Wait until sufficient capacity is available for the request."""
-        while True:
-            with self._lock:
-                self._update_capacity()
-                
-                if (self._available_request_capacity >= 1 and 
-                    self._available_token_capacity >= tokens_needed):
-                    # Reserve capacity
-                    self._available_request_capacity -= 1
-                    self._available_token_capacity -= tokens_needed
-                    return
-            
+        while not self._try_reserve(tokens_needed):
             # Sleep briefly and try again
             time.sleep(0.1)
+    
+    async def wait_for_capacity_async(self, tokens_needed: int = 1) -> None:
+        """Like `wait_for_capacity`, but yields to the event loop while waiting."""
+        while not self._try_reserve(tokens_needed):
+            await asyncio.sleep(0.1)
 
 
 # Global rate limiter instance
@@ -12,15 +12,19 @@ Our implementation draws from:
 
 import os
 import pickle
-from typing import Optional, Tuple, Dict, List
+from typing import Optional, Tuple, Dict, List, Union
 
 import numpy as np
 import torch
+import torch.distributed as dist
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.utils.data import DataLoader, TensorDataset
 from tqdm.auto import tqdm
 
+from .utils import TopKActivations, topk_to_sparse
+from .checkpoint import is_tensor_checkpoint, load_tensor_checkpoint, save_tensor_checkpoint
+from .streaming import StreamingEmbeddingDataset
+
 if torch.cuda.is_available():
     device = torch.device("cuda")
 elif torch.backends.mps.is_available():
@@ -28,6 +32,69 @@ elif torch.backends.mps.is_available():
 else:
     device = torch.device("cpu")
 
+ACTIVATION_OUTPUT_FORMATS = ("dense", "topk", "csr", "csc")
+STREAMING_INIT_SAMPLE_SIZE = 65536
+# Use the sparse decoder by default once M is this many times larger than K
+SPARSE_DECODE_MIN_RATIO = 256
+# Subdirectory of the checkpoint dir holding resumable mid-training checkpoints
+TRAINING_STATE_DIRNAME = "resume"
+# Extension of SAE checkpoints in the pickle-free format (see `checkpoint.py`); `.pt` is the legacy torch.save format
+CHECKPOINT_SUFFIX = ".sae"
+LEGACY_CHECKPOINT_SUFFIX = ".pt"
+# Parameters needed by the encoder-only inference path (`encode` / `get_activations`)
+ENCODER_STATE_KEYS = ("encoder.weight", "input_bias", "neuron_bias")
+
+
+# ----------------------------------------------------------------------------
+# Sparse (gather-based) decoding of top-K codes
+# ----------------------------------------------------------------------------
+
+class _SparseDecode(torch.autograd.Function):
+    """out[b] = sum_k values[b, k] * dec_weight[:, indices[b, k]], with a matching sparse backward.
+
+    With `compute_dtype` (autocast), only the gathered (B, K, D) columns are cast; gradients
+    are returned in the dtypes of `values` and `dec_weight`.
+    """
+
+    @staticmethod
+    def forward(ctx, indices, values, dec_weight, compute_dtype):
+        # Gathering rows of the transposed view reads only the K active columns (no (M, D) copy)
+        columns = dec_weight.t()[indices]
+        if compute_dtype is not None:
+            columns, values_c = columns.to(compute_dtype), values.to(compute_dtype)
+        else:
+            values_c = values
+        out = torch.bmm(values_c.unsqueeze(1), columns).squeeze(1)
+        ctx.save_for_backward(indices, values, dec_weight)
+        return out
+
+    @staticmethod
+    def backward(ctx, grad_out):
+        indices, values, dec_weight = ctx.saved_tensors
+        grad_values = grad_dec_weight = None
+        if ctx.needs_input_grad[1]:
+            columns = dec_weight.t()[indices].to(grad_out.dtype)
+            grad_values = torch.bmm(columns, grad_out.unsqueeze(-1)).squeeze(-1).to(values.dtype)
+        if ctx.needs_input_grad[2]:
+            # Accumulate in the weight's dtype (fp32 under autocast)
+            grad_out = grad_out.to(dec_weight.dtype)
+            contributions = (values.to(dec_weight.dtype).unsqueeze(-1) * grad_out.unsqueeze(1)).reshape(-1, grad_out.shape[-1])
+            grad_dec_weight = torch.zeros_like(dec_weight).index_add_(1, indices.reshape(-1), contributions.t())
+        return None, grad_values, grad_dec_weight, None
+
+
+def sparse_decode(indices: torch.Tensor, values: torch.Tensor, dec_weight: torch.Tensor) -> torch.Tensor:
+    """Decode top-K codes by gathering the K active decoder columns per row.
+
+    Equivalent to scattering `values` into a dense (B, M) matrix and multiplying by
+    `dec_weight.t()`, but costs O(B * K * D) instead of O(B * M * D).
+    """
+    # Custom autograd Functions are not autocast; cast the gathered columns explicitly
+    compute_dtype = None
+    if torch.is_autocast_enabled(indices.device.type):
+        compute_dtype = torch.get_autocast_dtype(indices.device.type)
+    return _SparseDecode.apply(indices, values, dec_weight, compute_dtype)
+
 
 # ----------------------------------------------------------------------------
 # Sparse Autoencoder with optional Matryoshka loss
@@ -44,6 +111,7 @@ class SparseAutoencoder(nn.Module):
         multi_k: Optional[int] = None,
         dead_neuron_threshold_steps: int = 256,
         prefix_lengths: Optional[List[int]] = None,
+        sparse_decode: Optional[bool] = None,
     ) -> None:
         """Create a top-K sparse autoencoder.
 
@@ -70,6 +138,11 @@ class SparseAutoencoder(nn.Module):
             If given (e.g. `[16, 64]`), activates *Matryoshka* loss: the first
             prefix has 16 neurons, the second 64, etc.  If *None*, all
             M neurons are treated equally.
+        sparse_decode : bool | None, optional
+            Whether to decode by gathering the K active decoder columns per
+            example instead of a dense (B×M)·(M×D) matmul.  Defaults to True
+            when `m_total_neurons >= SPARSE_DECODE_MIN_RATIO * k_active_neurons`.
+            This is a runtime choice and is not stored in checkpoints.
         """
 
         super().__init__()
@@ -83,6 +156,10 @@ class SparseAutoencoder(nn.Module):
         )
         self.multi_k = multi_k
         self.dead_neuron_threshold_steps = dead_neuron_threshold_steps
+        self.sparse_decode = (
+            m_total_neurons >= SPARSE_DECODE_MIN_RATIO * k_active_neurons
+            if sparse_decode is None else sparse_decode
+        )
 
         # Matryoshka prefixes as full lengths --------------------------------
         self.prefix_lengths = prefix_lengths
@@ -106,8 +183,28 @@ class SparseAutoencoder(nn.Module):
             m_total_neurons, dtype=torch.long, device=device
         )
 
+        # optional fast training (see `configure_fast_training_`) -------------
+        self._autocast_dtype = None
+        self._compiled_forward_loss = None
+
+        if self.encoder.weight.is_meta:
+            return  # built without storage by `load_model`, which assigns the checkpoint tensors
         self.to(device)
 
+    # ---------------------------------------------------------------------
+    # Encoder-only inference path
+    # ---------------------------------------------------------------------
+    @torch.inference_mode()
+    def encode(self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Return the top-K (indices, values) of the encoder for a batch of inputs.
+
+        Inference-only: skips the decoder, multi-K and aux-K paths, and does not
+        update the dead-neuron counters in `steps_since_activation`.
+        """
+        pre_act = self.encoder(x - self.input_bias) + self.neuron_bias
+        topk_vals, topk_idx = torch.topk(pre_act, self.k_active_neurons, dim=-1)
+        return topk_idx, F.relu(topk_vals)
+
     # ---------------------------------------------------------------------
     # Forward pass (agnostic to Matryoshka configuration)
     # ---------------------------------------------------------------------
@@ -119,36 +216,37 @@ class SparseAutoencoder(nn.Module):
         # main Top‑K ---------------------------------------------------------
         topk_vals, topk_idx = torch.topk(pre_act, self.k_active_neurons, dim=-1)
         topk_vals = F.relu(topk_vals)
-        activ = torch.zeros_like(pre_act)
-        activ.scatter_(-1, topk_idx, topk_vals)
 
         # multi‑K --------------------------------------------------
         if self.multi_k is not None:
             multik_vals, multik_idx = torch.topk(pre_act, self.multi_k, dim=-1)
             multik_vals = F.relu(multik_vals)
-            multik_activ = torch.zeros_like(pre_act)
-            multik_activ.scatter_(-1, multik_idx, multik_vals)
-            multik_recon = self.decoder(multik_activ) + self.input_bias
+            multik_recon = self._decode(multik_idx, multik_vals) + self.input_bias
         else:
             multik_recon = None
 
-        # dead‑neuron tracking
-        self.steps_since_activation += 1
-        self.steps_since_activation.scatter_(0, topk_idx.unique(), 0)
+        # dead‑neuron tracking (training steps only; validation must not change the
+        # counters, which would also let them diverge across data-parallel ranks)
+        if self.training:
+            self.steps_since_activation += 1
+            self.steps_since_activation[topk_idx.flatten()] = 0
 
         # reconstructions ----------------------------------------------------
-        recon = self.decoder(activ) + self.input_bias
+        if self.sparse_decode:
+            activ = None
+            recon = sparse_decode(topk_idx, topk_vals, self.decoder.weight) + self.input_bias
+        else:
+            activ = torch.zeros_like(pre_act)
+            activ.scatter_(-1, topk_idx, topk_vals)
+            recon = self.decoder(activ) + self.input_bias
 
-        # aux‑K --------------------------------------------------------------
+        # aux‑K (training only, over the dead neurons only) ---------------------
         aux_idx = aux_vals = None
-        if self.aux_k is not None:
-            dead_mask = (self.steps_since_activation > self.dead_neuron_threshold_steps).float()
-            dead_pre_act = pre_act * dead_mask
-            aux_vals, aux_idx = torch.topk(dead_pre_act, self.aux_k, dim=-1)
-            aux_vals = F.relu(aux_vals)
+        if self.aux_k is not None and self.training:
+            aux_idx, aux_vals = self._dead_topk(pre_act)
 
         info = {
-            "activations": activ,  # needed for Matryoshka slices
+            "activations": activ,  # dense codes for Matryoshka slices (None when decoding sparsely)
             "topk_indices": topk_idx,
             "topk_values": topk_vals,
             "multik_reconstruction": multik_recon,
@@ -157,15 +255,67 @@ class SparseAutoencoder(nn.Module):
         }
         return recon, info
 
+    def _dead_topk(self, pre_act: torch.Tensor) -> Tuple[Optional[torch.Tensor], Optional[torch.Tensor]]:
+        """Return the top-`aux_k` (indices, values) among dead neurons, or (None, None) if none are dead.
+
+        Top-K runs over the gathered (B, n_dead) dead columns only, so the cost scales
+        with the number of dead neurons rather than with M.
+        """
+        dead_idx = torch.nonzero(self.steps_since_activation > self.dead_neuron_threshold_steps).squeeze(1)
+        if dead_idx.numel() == 0:
+            return None, None
+        dead_pre_act = pre_act.index_select(-1, dead_idx)
+        aux_vals, local_idx = torch.topk(dead_pre_act, min(self.aux_k, dead_idx.numel()), dim=-1)
+        return dead_idx[local_idx], F.relu(aux_vals)
+
     # ------------------------------------------------------------------
     # Loss with optional Matryoshka terms
     # ------------------------------------------------------------------
     @staticmethod
     def _normalized_mse(pred: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
+        # Losses are always reduced in fp32, also under bf16 autocast
+        pred, target = pred.float(), target.float()
         mse = F.mse_loss(pred, target)
         baseline_mse = F.mse_loss(target.mean(dim=0, keepdim=True).expand_as(target), target)
         return mse / baseline_mse
     
+    def _decode(self, topk_idx: torch.Tensor, topk_vals: torch.Tensor) -> torch.Tensor:
+        """Decode top-K codes (without input bias), sparsely or via a dense scatter + matmul."""
+        if self.sparse_decode:
+            return sparse_decode(topk_idx, topk_vals, self.decoder.weight)
+        activ = torch.zeros(
+            topk_idx.shape[0], self.m_total_neurons, dtype=topk_vals.dtype, device=topk_vals.device
+        )
+        activ.scatter_(-1, topk_idx, topk_vals)
+        return self.decoder(activ)
+
+    def _prefix_reconstructions(self, info: Dict[str, torch.Tensor], recon: torch.Tensor) -> List[torch.Tensor]:
+        """Return the Matryoshka prefix reconstructions, built incrementally.
+
+        Each prefix adds only its own block of neurons to the previous prefix's
+        reconstruction, and the last prefix (all M neurons) reuses `recon` from the
+        forward pass, so the extra decoder cost is one pass over the first
+        `prefix_lengths[-2]` neurons rather than over every prefix from scratch.
+        With sparse decoding, each block decodes only the active neurons it contains.
+        """
+        activ = info["activations"]
+        topk_idx, topk_vals = info["topk_indices"], info["topk_values"]
+        dec_weight = self.decoder.weight  # (input_dim, m_total_neurons)
+        prefix_recons = []
+        prefix_recon = self.input_bias
+        start = 0
+        for end in self.prefix_lengths[:-1]:
+            if activ is None:
+                in_block = (topk_idx >= start) & (topk_idx < end)
+                prefix_recon = prefix_recon + sparse_decode(topk_idx, topk_vals * in_block, dec_weight)
+            else:
+                # activ[:, start:end] is (batchsize, end - start);  dec_weight[:, start:end] is (input_dim, end - start)
+                prefix_recon = prefix_recon + activ[:, start:end] @ dec_weight[:, start:end].t()
+            prefix_recons.append(prefix_recon)
+            start = end
+        prefix_recons.append(recon)
+        return prefix_recons
+
     def compute_loss(
         self,
         x: torch.Tensor,
@@ -183,17 +333,14 @@ class SparseAutoencoder(nn.Module):
         multiK / auxK implemented as in O'Neill et al. (2024).
         """
 
-        activ = info["activations"]
         # main L2 -----------------------------------------------------------
         if self.prefix_lengths is None or len(self.prefix_lengths) == 1:
             main_l2 = self._normalized_mse(recon, x)
         else:
-            l2_terms = []
-            dec_weight = self.decoder.weight  # (input_dim, m_total_neurons)
-            for end in self.prefix_lengths:
-                # activ[:, :end] is (batchsize, end);  dec_weight[:, :end] is (input_dim, end)
-                prefix_recon = activ[:, :end] @ dec_weight[:, :end].t() + self.input_bias
-                l2_terms.append(self._normalized_mse(prefix_recon, x))
+            l2_terms = [
+                self._normalized_mse(prefix_recon, x)
+                for prefix_recon in self._prefix_reconstructions(info, recon)
+            ]
             main_l2 = torch.stack(l2_terms).mean()
 
         # multi‑K term ------------------------------------------------------
@@ -205,9 +352,8 @@ class SparseAutoencoder(nn.Module):
         # aux‑K term --------------------------------------------------------
         if self.aux_k is not None and info["aux_indices"] is not None:
             err = x - recon.detach()
-            aux_act = torch.zeros_like(activ)
-            aux_act.scatter_(-1, info["aux_indices"], info["aux_values"])
-            err_recon = self.decoder(aux_act)
+            # aux_k is small, so decode by gathering its columns regardless of `sparse_decode`
+            err_recon = sparse_decode(info["aux_indices"], info["aux_values"], self.decoder.weight)
             aux_loss = self._normalized_mse(err_recon, err)
             return main_l2 + aux_coef * aux_loss
         else:
@@ -230,12 +376,116 @@ class SparseAutoencoder(nn.Module):
         self.input_bias.data = torch.median(data_sample, dim=0).values
         nn.init.xavier_uniform_(self.decoder.weight)
         self.normalize_decoder_()
-        self.encoder.weight.data = self.decoder.weight.t().clone()
+        # Contiguous, like a freshly constructed (or resumed) encoder, so matmuls take the same kernels
+        self.encoder.weight.data = self.decoder.weight.t().contiguous()
         nn.init.zeros_(self.neuron_bias)
         
-    def save(self, save_path: str):
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        config = {
+    def configure_fast_training_(self, mixed_precision: bool = False, compile: bool = False):
+        """Opt into bf16 autocast and/or a `torch.compile`d forward+loss step.
+
+        Under mixed precision the encoder/decoder matmuls run in bfloat16 while the
+        parameters (and hence optimizer state, `normalize_decoder_` and
+        `adjust_decoder_gradient_`) and the loss reductions stay in fp32. If bf16
+        autocast or `torch.compile` is unavailable, training falls back to fp32 /
+        eager mode with a warning.
+        """
+        self._autocast_dtype = None
+        if mixed_precision:
+            try:
+                with torch.autocast(device_type=device.type, dtype=torch.bfloat16):
+                    pass
+                self._autocast_dtype = torch.bfloat16
+            except RuntimeError as e:
+                print(f"Warning: bf16 autocast is unavailable on {device.type} ({e}); training in fp32")
+
+        self._compiled_forward_loss = None
+        if compile:
+            if hasattr(torch, "compile"):
+                self._compiled_forward_loss = torch.compile(self._forward_loss)
+            else:
+                print("Warning: torch.compile is unavailable in this version of PyTorch; training in eager mode")
+
+    def _forward_loss(self, batch_x: torch.Tensor, aux_coef: float, multi_coef: float) -> torch.Tensor:
+        with torch.autocast(device_type=device.type, dtype=self._autocast_dtype, enabled=self._autocast_dtype is not None):
+            recon, info = self(batch_x)
+            return self.compute_loss(batch_x, recon, info, aux_coef, multi_coef)
+
+    def training_step(
+        self,
+        batch_x: torch.Tensor,
+        optimizer: torch.optim.Optimizer,
+        aux_coef: float,
+        multi_coef: float,
+        clip_grad: Optional[float],
+    ) -> torch.Tensor:
+        """Run one optimization step on a batch and return the (detached) loss."""
+        self.train()
+        if self._compiled_forward_loss is not None:
+            try:
+                loss = self._compiled_forward_loss(batch_x, aux_coef, multi_coef)
+            except Exception as e:
+                print(f"Warning: compiled training step failed ({type(e).__name__}: {e}); falling back to eager mode")
+                self._compiled_forward_loss = None
+                loss = self._forward_loss(batch_x, aux_coef, multi_coef)
+        else:
+            loss = self._forward_loss(batch_x, aux_coef, multi_coef)
+        
+        optimizer.zero_grad()
+        loss.backward()
+        _, world_size = _get_world()
+        if world_size > 1:
+            self._all_reduce_gradients_(world_size)
+        self.adjust_decoder_gradient_()
+        
+        # Apply gradient clipping
+        if clip_grad is not None:
+            torch.nn.utils.clip_grad_norm_(self.parameters(), clip_grad)
+        
+        optimizer.step()
+        self.normalize_decoder_()
+        if world_size > 1:
+            # A neuron is alive if it fired on any rank: the elementwise min of the
+            # per-rank counters is exactly the counter of a single-process step
+            dist.all_reduce(self.steps_since_activation, op=dist.ReduceOp.MIN)
+        return loss.detach()
+
+    def _all_reduce_gradients_(self, world_size: int):
+        """Average gradients across data-parallel ranks with one flat all-reduce."""
+        grads = [p.grad for p in self.parameters() if p.grad is not None]
+        flat = torch.cat([g.reshape(-1) for g in grads])
+        dist.all_reduce(flat)
+        flat.div_(world_size)
+        offset = 0
+        for g in grads:
+            g.copy_(flat[offset:offset + g.numel()].view_as(g))
+            offset += g.numel()
+
+    def evaluate_loss(self, X_val, batch_size: int, aux_coef: float, multi_coef: float) -> float:
+        """Return the mean loss over validation batches.
+
+        Under data-parallel training, each rank evaluates every `world_size`-th batch
+        and the sums are all-reduced, so all ranks return the same value. Evaluation
+        does not update the dead-neuron counters.
+        """
+        self.eval()
+        rank, world_size = _get_world()
+        val_loss_sum = torch.zeros((), device=device)
+        n_batches = 0
+        with torch.no_grad():
+            for i, batch_x in enumerate(_iterate_batches(X_val, batch_size, shuffle=False)):
+                if i % world_size != rank:
+                    continue
+                batch_x = _batch_to_device(batch_x)
+                val_loss_sum += self._forward_loss(batch_x, aux_coef, multi_coef)
+                n_batches += 1
+        if world_size > 1:
+            totals = torch.stack([val_loss_sum, torch.tensor(float(n_batches), device=device)])
+            dist.all_reduce(totals)
+            val_loss_sum, n_batches = totals[0], totals[1]
+        return (val_loss_sum / n_batches).item()
+
+    def get_config(self) -> Dict:
+        return {
             "input_dim": self.input_dim,
             "m_total_neurons": self.m_total_neurons,
             "k_active_neurons": self.k_active_neurons,
@@ -244,7 +494,15 @@ class SparseAutoencoder(nn.Module):
             "dead_neuron_threshold_steps": self.dead_neuron_threshold_steps,
             "prefix_lengths": self.prefix_lengths,
         }
-        torch.save({"config": config, "state_dict": self.state_dict()}, save_path, pickle_module=pickle)
+
+    def save(self, save_path: str):
+        """Save config and weights; paths ending in `.pt` use the legacy `torch.save` format."""
+        os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+        config = self.get_config()
+        if save_path.endswith(LEGACY_CHECKPOINT_SUFFIX):
+            torch.save({"config": config, "state_dict": self.state_dict()}, save_path, pickle_module=pickle)
+        else:
+            save_tensor_checkpoint(save_path, config, self.state_dict())
         print(f"Saved model to {save_path}")
         return save_path
 
@@ -253,8 +511,8 @@ class SparseAutoencoder(nn.Module):
     # ------------------------------------------------------------------
     def fit(
         self,
-        X_train: torch.Tensor,
-        X_val: Optional[torch.Tensor] = None,
+        X_train: Union[torch.Tensor, StreamingEmbeddingDataset],
+        X_val: Optional[Union[torch.Tensor, StreamingEmbeddingDataset]] = None,
         save_dir: Optional[str] = None,
         batch_size: int = 512,
         learning_rate: float = 5e-4,
@@ -263,47 +521,142 @@ class SparseAutoencoder(nn.Module):
         multi_coef: float = 0.0,
         patience: int = 5,
         show_progress: bool = True,
-        clip_grad: float = 1.0
+        clip_grad: float = 1.0,
+        init_sample_size: Optional[int] = None,
+        checkpoint_every_n_steps: Optional[int] = None,
+        resume: bool = False,
+        device_resident_data: bool = False,
+        mixed_precision: bool = False,
+        compile: bool = False,
     ) -> Dict:
-        """Train the sparse autoencoder on input data."""
-        train_loader = DataLoader(TensorDataset(X_train), batch_size=batch_size, shuffle=True)
-        val_loader = DataLoader(TensorDataset(X_val), batch_size=batch_size) if X_val is not None else None
+        """Train the sparse autoencoder on input data.
+
+        `X_train` / `X_val` may be in-memory tensors or `StreamingEmbeddingDataset`s
+        (anything else, e.g. a `.npy` path or memmap, is wrapped in one), in which case
+        batches are streamed from disk with bounded memory.
+
+        `init_sample_size` is the number of rows used to compute the median for the
+        `input_bias` initialization. By default all rows of an in-memory tensor are
+        used, and `STREAMING_INIT_SAMPLE_SIZE` randomly sampled rows of a streaming dataset.
+
+        If `checkpoint_every_n_steps` is set (requires `save_dir`), the full training
+        state (weights, Adam state, epoch/step, RNG state, dead-neuron counters and
+        early-stopping state) is written atomically to `save_dir/resume/` every that
+        many steps and at the end of every epoch. With `resume=True`, training
+        continues from the newest such checkpoint, if any. Resume checkpoints are
+        removed once the final model is saved.
+
+        With `device_resident_data=True`, in-memory `X_train` / `X_val` are moved to the
+        training device once, so batches are drawn there without host-to-device copies.
+        By default they stay on the host and each batch is copied over.
+
+        `mixed_precision` and `compile` enable the opt-in fast training mode described
+        in `configure_fast_training_` for the duration of this call.
+
+        When called inside an initialized `torch.distributed` process group (see
+        `hypothesaes.distributed.fit_data_parallel`), training is data-parallel: each
+        batch is split across ranks, gradients are averaged with an all-reduce before
+        the decoder-gradient projection and optimizer step, and the dead-neuron counters
+        are synchronized after every step. Only rank 0 shows progress and writes checkpoints.
+        """
+        if (checkpoint_every_n_steps is not None or resume) and save_dir is None:
+            raise ValueError("save_dir must be provided to write or resume from training checkpoints")
+        if not isinstance(X_train, torch.Tensor):
+            X_train = _as_streaming_dataset(X_train)
+        if X_val is not None and not isinstance(X_val, torch.Tensor):
+            X_val = _as_streaming_dataset(X_val)
+        if device_resident_data:
+            X_train = X_train.to(device) if isinstance(X_train, torch.Tensor) else X_train
+            X_val = X_val.to(device) if isinstance(X_val, torch.Tensor) else X_val
         
-        # Initialize from batch of data
-        self.initialize_weights_(X_train.to(device))
+        rank, world_size = _get_world()
+        show_progress = show_progress and rank == 0
         
         optimizer = torch.optim.Adam(self.parameters(), lr=learning_rate)
+        self.configure_fast_training_(mixed_precision=mixed_precision, compile=compile)
         
         # Training loop setup
         best_val_loss = float('inf')
         patience_counter = 0
         history = {'train_loss': [], 'val_loss': [], 'dead_neuron_ratio': []}
+        start_epoch = global_step = resume_step_in_epoch = 0
+        resume_loss_sum = 0.0
+        resume_rng_state = None
+
+        filename = get_sae_checkpoint_name(self.m_total_neurons, self.k_active_neurons, self.prefix_lengths)
+        resume_dir = os.path.join(save_dir, TRAINING_STATE_DIRNAME) if save_dir is not None else None
+        resume_prefix = os.path.splitext(filename)[0]
+        state = load_training_state(resume_dir, resume_prefix) if resume else None
+        if state is not None:
+            self.load_state_dict(state["state_dict"])
+            self.steps_since_activation = state["steps_since_activation"].to(device)
+            optimizer.load_state_dict(state["optimizer"])
+            start_epoch, resume_step_in_epoch = state["epoch"], state["step_in_epoch"]
+            global_step, resume_loss_sum = state["global_step"], state["epoch_loss_sum"]
+            best_val_loss, patience_counter = state["best_val_loss"], state["patience_counter"]
+            history, resume_rng_state = state["history"], state["rng_state"]
+            if rank == 0:
+                print(f"Resuming training from epoch {start_epoch + 1}, step {resume_step_in_epoch} (global step {global_step})")
+        else:
+            # Initialize from (a sample of) the data
+            self.initialize_weights_(_get_init_data(X_train, init_sample_size).to(device))
+        if world_size > 1:
+            for param in self.parameters():
+                dist.broadcast(param.data, src=0)
+
+        def save_training_state(epoch, step_in_epoch, epoch_loss_sum, epoch_rng_state):
+            if rank != 0:
+                return
+            save_training_state_(
+                resume_dir, resume_prefix, global_step,
+                {
+                    "config": self.get_config(),
+                    "state_dict": self.state_dict(),
+                    "steps_since_activation": self.steps_since_activation.cpu(),
+                    "optimizer": optimizer.state_dict(),
+                    "epoch": epoch,
+                    "step_in_epoch": step_in_epoch,
+                    "global_step": global_step,
+                    "epoch_loss_sum": float(epoch_loss_sum),
+                    "best_val_loss": best_val_loss,
+                    "patience_counter": patience_counter,
+                    "history": history,
+                    "rng_state": epoch_rng_state,
+                },
+            )
         
         # Training loop
-        iterator = tqdm(range(n_epochs)) if show_progress else range(n_epochs)
+        iterator = tqdm(range(start_epoch, n_epochs)) if show_progress else range(start_epoch, n_epochs)
         for epoch in iterator:
             self.train()
-            train_losses = []
+            # Accumulate the loss on device and sync once per epoch
+            epoch_loss_sum = torch.zeros((), device=device)
+            skip_steps = 0
+            if resume_rng_state is not None:
+                # Replay the interrupted epoch's shuffle and skip the batches already trained on
+                _set_rng_state(resume_rng_state)
+                skip_steps = resume_step_in_epoch
+                epoch_loss_sum += resume_loss_sum
+                resume_rng_state = None
+            epoch_rng_state = _get_rng_state()
             
-            for batch_x, in train_loader:
-                batch_x = batch_x.to(device)
-                recon, info = self(batch_x)
-                loss = self.compute_loss(batch_x, recon, info, aux_coef, multi_coef)
-                
-                optimizer.zero_grad()
-                loss.backward()
-                self.adjust_decoder_gradient_()
-                
-                # Apply gradient clipping
-                if clip_grad is not None:
-                    torch.nn.utils.clip_grad_norm_(self.parameters(), clip_grad)
-                
-                optimizer.step()
-                self.normalize_decoder_()
-                
-                train_losses.append(loss.item())
+            # Skipped batches were full batches, so they all counted as steps
+            n_steps = skip_steps
+            batches = _iterate_batches(X_train, batch_size, shuffle=True, skip_batches=skip_steps)
+            for step_in_epoch, batch_x in enumerate(batches, start=skip_steps):
+                if world_size > 1:
+                    if batch_x.shape[0] < world_size:
+                        continue  # only possible for a tiny final batch
+                    # Every rank draws the same shuffled batch and trains on its own slice of it
+                    batch_x = batch_x.tensor_split(world_size)[rank]
+                n_steps += 1
+                batch_x = _batch_to_device(batch_x)
+                epoch_loss_sum += self.training_step(batch_x, optimizer, aux_coef, multi_coef, clip_grad)
+                global_step += 1
+                if checkpoint_every_n_steps is not None and global_step % checkpoint_every_n_steps == 0:
+                    save_training_state(epoch, step_in_epoch + 1, _all_reduce_mean(epoch_loss_sum).item(), epoch_rng_state)
             
-            avg_train_loss = np.mean(train_losses)
+            avg_train_loss = (_all_reduce_mean(epoch_loss_sum) / n_steps).item()
             history['train_loss'].append(avg_train_loss)
             
             # Track dead neurons
@@ -311,17 +664,8 @@ class SparseAutoencoder(nn.Module):
             history['dead_neuron_ratio'].append(dead_ratio)
             
             # Validation
-            if val_loader is not None:
-                self.eval()
-                val_losses = []
-                with torch.no_grad():
-                    for batch_x, in val_loader:
-                        batch_x = batch_x.to(device)
-                        recon, info = self(batch_x)
-                        val_loss = self.compute_loss(batch_x, recon, info, aux_coef, multi_coef)
-                        val_losses.append(val_loss.item())
-                
-                avg_val_loss = np.mean(val_losses)
+            if X_val is not None:
+                avg_val_loss = self.evaluate_loss(X_val, batch_size, aux_coef, multi_coef)
                 history['val_loss'].append(avg_val_loss)
                 
                 # Early stopping check
@@ -331,97 +675,378 @@ class SparseAutoencoder(nn.Module):
                 else:
                     patience_counter += 1
                     if patience_counter >= patience:
-                        print(f"Early stopping triggered after {epoch+1} epochs")
+                        if rank == 0:
+                            print(f"Early stopping triggered after {epoch+1} epochs")
                         break
+
+            if checkpoint_every_n_steps is not None:
+                save_training_state(epoch + 1, 0, 0.0, _get_rng_state())
             
             # Update progress bar
             if show_progress:
                 iterator.set_postfix({
                     'train_loss': f'{avg_train_loss:.4f}',
-                    'val_loss': f'{avg_val_loss:.4f}' if val_loader else 'N/A',
+                    'val_loss': f'{avg_val_loss:.4f}' if X_val is not None else 'N/A',
                     'dead_ratio': f'{dead_ratio:.3f}'
                 })
         
+        self.configure_fast_training_()
+
         # Save final model
-        if save_dir is not None:
+        if save_dir is not None and rank == 0:
             os.makedirs(save_dir, exist_ok=True)
-            filename = get_sae_checkpoint_name(self.m_total_neurons, self.k_active_neurons, self.prefix_lengths)
             self.save(os.path.join(save_dir, filename))
+            remove_training_states(resume_dir, resume_prefix)
             
         return history
     
     # ------------------------------------------------------------------
     # Compute activations with batched SAE inference
     # ------------------------------------------------------------------
-    def get_activations(self, inputs, batch_size=16384, show_progress=True):
+    def get_activations(self, inputs, batch_size=16384, show_progress=True, output_format="dense"):
         """Get sparse activations for input data with batching to prevent CUDA OOM.
         
         Args:
             inputs: Input data as numpy array or torch tensor
             batch_size: Number of samples per batch (default: 16384)
+            output_format: One of "dense", "topk", "csr", or "csc" (default: "dense").
+                "dense" returns an (N, M) numpy array. "topk" returns a
+                `TopKActivations` tuple of (indices, values) arrays, each of shape (N, K),
+                which records M as `n_neurons`. "csr"/"csc" return a
+                SciPy sparse matrix of shape (N, M). The sparse formats are built
+                directly from the top-K indices/values, without a dense intermediate.
         
         Returns:
-            Numpy array of activations
+            Activations in the requested output format
         """
+        if output_format not in ACTIVATION_OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {ACTIVATION_OUTPUT_FORMATS}, got {output_format}")
         self.eval()
 
-        if isinstance(inputs, list):
-            inputs = torch.tensor(inputs, dtype=torch.float)
-        elif isinstance(inputs, np.ndarray):
-            inputs = torch.from_numpy(inputs).float()
-        elif not isinstance(inputs, torch.Tensor):
-            raise TypeError("inputs must be a list, numpy array, or torch tensor")
-        if not inputs.dtype == torch.float:
-            inputs = inputs.float()
+        inputs = _to_float_tensor(inputs)
         
         num_samples = inputs.shape[0]
         all_activations = []
-        with torch.no_grad():
-            if show_progress:
-                iterator = tqdm(range(0, num_samples, batch_size), desc=f"Computing activations (batchsize={batch_size})")
+        all_topk_indices = []
+        all_topk_values = []
+        if show_progress:
+            iterator = tqdm(range(0, num_samples, batch_size), desc=f"Computing activations (batchsize={batch_size})")
+        else:
+            iterator = range(0, num_samples, batch_size)
+            
+        for i in iterator:
+            batch = inputs[i:i+batch_size]
+            batch = batch.to(device)
+            topk_idx, topk_vals = self.encode(batch)
+            if output_format == "dense":
+                with torch.inference_mode():
+                    activ = torch.zeros(topk_idx.shape[0], self.m_total_neurons, dtype=topk_vals.dtype, device=topk_vals.device)
+                    activ.scatter_(-1, topk_idx, topk_vals)
+                all_activations.append(activ.cpu())
             else:
-                iterator = range(0, num_samples, batch_size)
-                
-            for i in iterator:
-                batch = inputs[i:i+batch_size]
-                batch = batch.to(device)
-                _, info = self(batch)
-                batch_activations = info['activations']
-                all_activations.append(batch_activations.cpu())
+                all_topk_indices.append(topk_idx.cpu())
+                all_topk_values.append(topk_vals.cpu())
         
-        return torch.cat(all_activations, dim=0).numpy()
+        if output_format == "dense":
+            return torch.cat(all_activations, dim=0).numpy()
+
+        topk_indices = torch.cat(all_topk_indices, dim=0).numpy()
+        topk_values = torch.cat(all_topk_values, dim=0).numpy()
+        if output_format == "topk":
+            return TopKActivations(topk_indices, topk_values, self.m_total_neurons)
+        return topk_to_sparse(topk_indices, topk_values, self.m_total_neurons, format=output_format)
 
 # -----------------------------------------------------------------------------
 # Additional utils
 # -----------------------------------------------------------------------------
-def get_sae_checkpoint_name(m_total_neurons, k_active_neurons, prefix_lengths=None):
+def get_sae_checkpoint_name(m_total_neurons, k_active_neurons, prefix_lengths=None, suffix=CHECKPOINT_SUFFIX):
     if prefix_lengths is None:
-        return f'SAE_M={m_total_neurons}_K={k_active_neurons}.pt'
+        return f'SAE_M={m_total_neurons}_K={k_active_neurons}{suffix}'
     else:
         prefix_str = "-".join(str(g) for g in prefix_lengths)
-        return f'SAE_matryoshka_M={m_total_neurons}_K={k_active_neurons}_prefixes={prefix_str}.pt'
+        return f'SAE_matryoshka_M={m_total_neurons}_K={k_active_neurons}_prefixes={prefix_str}{suffix}'
+
+def find_existing_checkpoint(checkpoint_path: str) -> Optional[str]:
+    """Return `checkpoint_path` if it exists, else its legacy `.pt` counterpart if that exists, else None."""
+    if os.path.exists(checkpoint_path):
+        return checkpoint_path
+    legacy_path = os.path.splitext(checkpoint_path)[0] + LEGACY_CHECKPOINT_SUFFIX
+    if os.path.exists(legacy_path):
+        return legacy_path
+    return None
+
+def _get_world() -> Tuple[int, int]:
+    """Return (rank, world_size) of the data-parallel process group, or (0, 1) outside one."""
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank(), dist.get_world_size()
+    return 0, 1
+
+def _all_reduce_mean(tensor: torch.Tensor) -> torch.Tensor:
+    """Return the mean of `tensor` over data-parallel ranks (`tensor` itself outside a process group)."""
+    _, world_size = _get_world()
+    if world_size == 1:
+        return tensor
+    tensor = tensor.clone()
+    dist.all_reduce(tensor)
+    return tensor / world_size
+
+def _get_rng_state() -> Dict:
+    return {
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        "numpy": np.random.get_state(),
+    }
+
+def _set_rng_state(rng_state: Dict) -> None:
+    torch.set_rng_state(rng_state["torch"])
+    if rng_state["cuda"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng_state["cuda"])
+    np.random.set_state(rng_state["numpy"])
+
+def _atomic_torch_save(obj, path: str) -> None:
+    """Write to a temporary file in the same directory, fsync, then rename over `path`."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        torch.save(obj, f, pickle_module=pickle)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _list_training_states(resume_dir: str, prefix: str) -> List[Tuple[int, str]]:
+    """Return (global_step, path) of all training-state checkpoints, newest first."""
+    if resume_dir is None or not os.path.isdir(resume_dir):
+        return []
+    states = []
+    for name in os.listdir(resume_dir):
+        if name.startswith(f"{prefix}_step=") and name.endswith(".pt"):
+            step = name[len(f"{prefix}_step="):-len(".pt")]
+            if step.isdigit():
+                states.append((int(step), os.path.join(resume_dir, name)))
+    return sorted(states, reverse=True)
+
+def save_training_state_(resume_dir: str, prefix: str, global_step: int, state: Dict, keep_last: int = 2) -> str:
+    """Atomically write a training-state checkpoint and prune all but the newest `keep_last`."""
+    os.makedirs(resume_dir, exist_ok=True)
+    path = os.path.join(resume_dir, f"{prefix}_step={global_step:09d}.pt")
+    _atomic_torch_save(state, path)
+    for _, old_path in _list_training_states(resume_dir, prefix)[keep_last:]:
+        os.remove(old_path)
+    return path
+
+def load_training_state(resume_dir: str, prefix: str) -> Optional[Dict]:
+    """Load the newest readable training-state checkpoint, or return None if there is none."""
+    for _, path in _list_training_states(resume_dir, prefix):
+        try:
+            return torch.load(path, map_location="cpu", pickle_module=pickle, weights_only=False)
+        except Exception as e:
+            print(f"Warning: could not load training checkpoint {path} ({e}); trying an older one")
+    return None
+
+def remove_training_states(resume_dir: str, prefix: str) -> None:
+    for _, path in _list_training_states(resume_dir, prefix):
+        os.remove(path)
+
+def load_model(path: str, map_location=None, encoder_only: bool = False) -> SparseAutoencoder:
+    """Load an SAE checkpoint.
+
+    Checkpoints in the pickle-free format are memory-mapped: loading onto the CPU is
+    zero-copy, and no weights are read until they are used. Legacy `.pt` checkpoints
+    are unpickled with `torch.load` (see `convert_checkpoint`).
 
-def load_model(path: str) -> SparseAutoencoder:
-    ckpt = torch.load(path, pickle_module=pickle)
-    model = SparseAutoencoder(**ckpt["config"]).to(device)
-    model.load_state_dict(ckpt["state_dict"])
-    print(f"Loaded model from {path} onto device {device}")
+    Args:
+        path: Checkpoint path
+        map_location: Device to load the weights onto (default: the module-level `device`)
+        encoder_only: Whether to load only the encoder half (`encoder`, `input_bias`,
+            `neuron_bias`), for inference via `encode` / `get_activations`. The decoder is
+            set to None, so `forward` and training are unavailable
+    """
+    map_location = torch.device(map_location) if map_location is not None else device
+    if is_tensor_checkpoint(path):
+        config, state_dict = load_tensor_checkpoint(path, ENCODER_STATE_KEYS if encoder_only else None)
+    else:
+        ckpt = torch.load(path, map_location="cpu", pickle_module=pickle)
+        config, state_dict = ckpt["config"], ckpt["state_dict"]
+        if encoder_only:
+            state_dict = {key: state_dict[key] for key in ENCODER_STATE_KEYS}
+
+    with torch.device("meta"):
+        model = SparseAutoencoder(**config)
+    if encoder_only:
+        model.decoder = None
+    model.load_state_dict({key: value.to(map_location) for key, value in state_dict.items()}, assign=True)
+    model.steps_since_activation = model.steps_since_activation.to(map_location)
+    print(f"Loaded {'encoder of ' if encoder_only else ''}model from {path} onto device {map_location}")
     return model
 
+def convert_checkpoint(path: str, output_path: Optional[str] = None) -> str:
+    """Convert a legacy `.pt` checkpoint to the pickle-free format and return the new path.
+
+    Only convert checkpoints from trusted sources: reading a `.pt` file runs pickle.
+    """
+    if output_path is None:
+        output_path = os.path.splitext(path)[0] + CHECKPOINT_SUFFIX
+    ckpt = torch.load(path, map_location="cpu", pickle_module=pickle)
+    save_tensor_checkpoint(output_path, ckpt["config"], ckpt["state_dict"])
+    print(f"Converted {path} to {output_path}")
+    return output_path
+
+def _as_streaming_dataset(X) -> StreamingEmbeddingDataset:
+    if isinstance(X, StreamingEmbeddingDataset):
+        return X
+    return StreamingEmbeddingDataset(X)
+
+def _get_init_data(X, init_sample_size: Optional[int] = None) -> torch.Tensor:
+    """Return the rows used for `initialize_weights_` (see `fit` for the defaults)."""
+    if isinstance(X, StreamingEmbeddingDataset):
+        return X.sample_rows(init_sample_size or STREAMING_INIT_SAMPLE_SIZE)
+    if init_sample_size is not None and init_sample_size < len(X):
+        return X[torch.randperm(len(X))[:init_sample_size]]
+    return X
+
+def _iterate_batches(X, batch_size: int, shuffle: bool, skip_batches: int = 0):
+    """Yield the batches of one epoch, skipping the first `skip_batches` without materializing them."""
+    if isinstance(X, StreamingEmbeddingDataset):
+        # Seed from torch's RNG so that saving/restoring torch RNG state reproduces the shuffle
+        rng = np.random.default_rng(int(torch.randint(0, 2**62, (1,)).item())) if shuffle else None
+        return X.iter_batches(batch_size, shuffle=shuffle, rng=rng, skip_batches=skip_batches)
+    return _iterate_tensor_batches(X, batch_size, shuffle, skip_batches)
+
+def _iterate_tensor_batches(X: torch.Tensor, batch_size: int, shuffle: bool, skip_batches: int = 0):
+    """Yield batches from an in-memory tensor using one permutation per epoch.
+
+    Each batch is a single gather (or a contiguous slice when not shuffling) on the
+    device `X` lives on, avoiding the per-sample Python collation of
+    `DataLoader(TensorDataset(X))`.
+    """
+    n_samples = X.shape[0]
+    perm = torch.randperm(n_samples, device=X.device) if shuffle else None
+    # Gather CPU batches bound for CUDA straight into pinned memory (see `_batch_to_device`)
+    pin = X.device.type == "cpu" and device.type == "cuda"
+    for start in range(skip_batches * batch_size, n_samples, batch_size):
+        if perm is None:
+            yield X[start:start + batch_size]
+        elif pin:
+            idx = perm[start:start + batch_size]
+            out = torch.empty((len(idx), *X.shape[1:]), dtype=X.dtype, pin_memory=True)
+            yield torch.index_select(X, 0, idx, out=out)
+        else:
+            yield X.index_select(0, perm[start:start + batch_size])
+
+def _batch_to_device(batch: torch.Tensor) -> torch.Tensor:
+    """Move a batch to `device`; CPU batches bound for CUDA are copied asynchronously from pinned memory."""
+    if device.type == "cuda" and batch.device.type == "cpu":
+        if not batch.is_pinned():
+            batch = batch.pin_memory()
+        return batch.to(device, non_blocking=True)
+    return batch.to(device)
+
+def _to_float_tensor(inputs) -> torch.Tensor:
+    if isinstance(inputs, list):
+        inputs = torch.tensor(inputs, dtype=torch.float)
+    elif isinstance(inputs, np.ndarray):
+        inputs = torch.from_numpy(inputs).float()
+    elif not isinstance(inputs, torch.Tensor):
+        raise TypeError("inputs must be a list, numpy array, or torch tensor")
+    if not inputs.dtype == torch.float:
+        inputs = inputs.float()
+    return inputs
+
+# -----------------------------------------------------------------------------
+# Fused inference over several SAEs
+# -----------------------------------------------------------------------------
+class FusedSAEEncoder:
+    """Encoder-only inference for several SAEs trained on the same embeddings.
+
+    The encoder weights of all SAEs are stacked into one (sum(M), D) matrix and each
+    SAE's input bias is folded into its neuron bias (W(x - b_pre) + b_enc = Wx + (b_enc - W b_pre)),
+    so each input batch needs a single matmul followed by a per-SAE segmented top-K.
+    Neuron indices refer to the concatenated neuron axis, in the order of `sae_list`.
+    """
+
+    def __init__(self, sae_list: List[SparseAutoencoder]):
+        if not isinstance(sae_list, list):
+            sae_list = [sae_list]
+        input_dims = {s.input_dim for s in sae_list}
+        if len(input_dims) != 1:
+            raise ValueError(f"All SAEs must have the same input_dim, got {sorted(input_dims)}")
+
+        self.sae_list = sae_list
+        self.input_dim = sae_list[0].input_dim
+        self.m_per_sae = [s.m_total_neurons for s in sae_list]
+        self.k_per_sae = [s.k_active_neurons for s in sae_list]
+        self.m_total_neurons = sum(self.m_per_sae)
+        self.k_total = sum(self.k_per_sae)
+        self.neuron_offsets = np.cumsum([0] + self.m_per_sae[:-1]).tolist()
+        self.neuron_source_sae_info = []
+        for s in sae_list:
+            self.neuron_source_sae_info += [(s.m_total_neurons, s.k_active_neurons)] * s.m_total_neurons
+
+        with torch.no_grad():
+            self.weight = torch.cat([s.encoder.weight.to(device) for s in sae_list], dim=0)
+            self.bias = torch.cat([
+                s.neuron_bias.to(device) - s.encoder.weight.to(device) @ s.input_bias.to(device)
+                for s in sae_list
+            ])
+
+    @torch.inference_mode()
+    def encode(self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Return top-K (indices, values) of shape (B, sum(K)) over the concatenated neuron axis."""
+        pre_act = F.linear(x, self.weight, self.bias)
+        all_idx, all_vals = [], []
+        for offset, m, k in zip(self.neuron_offsets, self.m_per_sae, self.k_per_sae):
+            topk_vals, topk_idx = torch.topk(pre_act[:, offset:offset + m], k, dim=-1)
+            all_idx.append(topk_idx + offset)
+            all_vals.append(F.relu(topk_vals))
+        return torch.cat(all_idx, dim=-1), torch.cat(all_vals, dim=-1)
+
+    def get_activations(self, inputs, batch_size=16384, show_progress=True, output_format="dense"):
+        """Get activations of all SAEs, written batch by batch into one preallocated output.
+
+        Accepts the same arguments as `SparseAutoencoder.get_activations`.
+        """
+        if output_format not in ACTIVATION_OUTPUT_FORMATS:
+            raise ValueError(f"output_format must be one of {ACTIVATION_OUTPUT_FORMATS}, got {output_format}")
+        inputs = _to_float_tensor(inputs)
+        num_samples = inputs.shape[0]
+
+        if output_format == "dense":
+            activations = np.zeros((num_samples, self.m_total_neurons), dtype=np.float32)
+        else:
+            topk_indices = np.empty((num_samples, self.k_total), dtype=np.int64)
+            topk_values = np.empty((num_samples, self.k_total), dtype=np.float32)
+
+        if show_progress:
+            iterator = tqdm(range(0, num_samples, batch_size), desc=f"Computing activations for {len(self.sae_list)} SAE(s) (batchsize={batch_size})")
+        else:
+            iterator = range(0, num_samples, batch_size)
+
+        for i in iterator:
+            batch = inputs[i:i+batch_size].to(device)
+            topk_idx, topk_vals = self.encode(batch)
+            topk_idx, topk_vals = topk_idx.cpu().numpy(), topk_vals.cpu().numpy()
+            if output_format == "dense":
+                np.put_along_axis(activations[i:i+batch_size], topk_idx, topk_vals, axis=1)
+            else:
+                topk_indices[i:i+batch_size] = topk_idx
+                topk_values[i:i+batch_size] = topk_vals
+
+        if output_format == "dense":
+            return activations
+        if output_format == "topk":
+            return TopKActivations(topk_indices, topk_values, self.m_total_neurons)
+        return topk_to_sparse(topk_indices, topk_values, self.m_total_neurons, format=output_format)
+
 def get_multiple_sae_activations(sae_list, X, return_neuron_source_info=False, **kwargs):
-    if not isinstance(sae_list, list):
-        sae_list = [sae_list]
-    if not isinstance(X, torch.Tensor):
-        X = torch.tensor(X, dtype=torch.float)
-
-    activations_list = []
-    neuron_source_sae_info = []
-    for s in sae_list:
-        activations_list.append(s.get_activations(X, **kwargs))
-        neuron_source_sae_info += [(s.m_total_neurons, s.k_active_neurons)] * s.m_total_neurons
-    activations = np.concatenate(activations_list, axis=1)
+    """Compute activations for one or more SAEs, concatenated along the neuron axis.
+
+    Uses a `FusedSAEEncoder`, so all SAEs share a single pass over X. Accepts the same
+    keyword arguments as `SparseAutoencoder.get_activations`. With `output_format="topk"`,
+    neuron indices refer to the concatenated neuron axis.
+    """
+    fused_encoder = FusedSAEEncoder(sae_list)
+    activations = fused_encoder.get_activations(X, **kwargs)
     
     if return_neuron_source_info:
-        return activations, neuron_source_sae_info
+        return activations, fused_encoder.neuron_source_sae_info
     else:
         return activations
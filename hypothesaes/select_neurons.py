@@ -6,6 +6,9 @@ from typing import List, Optional, Callable, Tuple
 from sklearn.linear_model import Lasso, LogisticRegression
 from sklearn.preprocessing import StandardScaler
 from scipy.stats import pearsonr
+import scipy.sparse
+
+from .utils import get_neuron_activations, get_num_neurons, to_neuron_major
 
 def select_neurons_lasso(
     activations: np.ndarray,
@@ -32,8 +35,13 @@ def select_neurons_lasso(
     Returns:
         Indices of selected neurons and corresponding coefficients
     """
-    # Standardize features
-    scaler = StandardScaler()
+    activations = to_neuron_major(activations)
+    if classification and scipy.sparse.issparse(activations):
+        # liblinear penalizes the intercept, so uncentered features would change the fit; center densely
+        activations = activations.toarray()
+    # Standardize features. Sparse matrices (regression only) are scaled but not centered, to keep
+    # them sparse: Lasso centers sparse input implicitly and does not penalize the intercept
+    scaler = StandardScaler(with_mean=not scipy.sparse.issparse(activations))
     X_scaled = scaler.fit_transform(activations)
     
     if alpha is not None:
@@ -126,9 +134,10 @@ def select_neurons_correlation(
     Returns:
         Indices of selected neurons and corresponding correlations
     """
+    activations = to_neuron_major(activations)
     correlations = np.array([
-        pearsonr(activations[:, i], target)[0]
-        for i in range(activations.shape[1])
+        pearsonr(get_neuron_activations(activations, i), target)[0]
+        for i in range(get_num_neurons(activations))
     ])
     
     # Sort by absolute correlation but return raw correlations
@@ -158,9 +167,10 @@ def select_neurons_separation_score(
     Returns:
         Indices of selected neurons and corresponding separation scores
     """
+    activations = to_neuron_major(activations)
     scores = []
-    for i in range(activations.shape[1]):
-        neuron_acts = activations[:, i]
+    for i in range(get_num_neurons(activations)):
+        neuron_acts = get_neuron_activations(activations, i)
         sorted_indices = np.argsort(-neuron_acts)
         
         # Get mean target value for top n activations
@@ -202,9 +212,10 @@ def select_neurons_custom(
     Returns:
         Indices of selected neurons and corresponding scores
     """
+    activations = to_neuron_major(activations)
     scores = np.array([
-        metric_fn(activations[:, i], target)
-        for i in range(activations.shape[1])
+        metric_fn(get_neuron_activations(activations, i), target)
+        for i in range(get_num_neurons(activations))
     ])
     
     sorted_indices = np.argsort(scores)[-n_select:]
@@ -226,7 +237,9 @@ def select_neurons(
     (coefficients for lasso, correlations for correlation method, etc.)
     
     Args:
-        activations: Neuron activation matrix (n_samples, n_neurons)
+        activations: Neuron activation matrix (n_samples, n_neurons); may also be a SciPy
+            sparse matrix or the `TopKActivations` returned by `get_activations(..., output_format="topk")`
+            (a plain (indices, values) tuple does not record the number of neurons)
         target: Target variable (n_samples,)
         n_select: Number of neurons to select
         method: One of "lasso", "correlation", or "custom"
@@ -240,6 +253,9 @@ def select_neurons(
     if classification and len(np.unique(target)) > 2:
         raise ValueError("classification=True, but the target variable has more than 2 classes. We currently do not support multi-class classification, but you can convert to a one-vs-rest binary classification.")
 
+    # Convert sparse activations once so that per-neuron column access is cheap
+    activations = to_neuron_major(activations)
+
     if method == "lasso":
         return select_neurons_lasso(
             activations=activations,
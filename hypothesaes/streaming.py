@@ -0,0 +1,160 @@
+"""Out-of-core embedding datasets for SAE training.
+
+Embeddings are read from memory-mapped `.npy` files, raw binary memmaps, in-memory
+arrays, or a list of such shards. Batches are drawn with a block shuffle: contiguous
+blocks of rows are visited in random order and shuffled in memory, so only one block
+is resident at a time and every read from disk is sequential.
+"""
+
+import os
+from typing import Iterator, List, Optional, Union
+
+import numpy as np
+import torch
+
+EmbeddingSource = Union[str, os.PathLike, np.ndarray]
+
+
+def _open_shard(source: EmbeddingSource, dim: Optional[int], dtype: np.dtype) -> np.ndarray:
+    if isinstance(source, np.ndarray):
+        arr = source
+    elif str(source).endswith(".npy"):
+        arr = np.load(source, mmap_mode="r")
+    else:
+        if dim is None:
+            raise ValueError(f"dim must be provided to read raw memmap file {source}")
+        arr = np.memmap(source, dtype=dtype, mode="r").reshape(-1, dim)
+    if arr.ndim != 2:
+        raise ValueError(f"Embedding shards must be 2D, got shape {arr.shape} for {source}")
+    return arr
+
+
+class StreamingEmbeddingDataset:
+    def __init__(
+        self,
+        sources: Union[EmbeddingSource, List[EmbeddingSource]],
+        *,
+        dim: Optional[int] = None,
+        dtype: Union[str, np.dtype] = np.float32,
+        block_rows: int = 65536,
+    ) -> None:
+        """Wrap one or more embedding shards for streaming, bounded-memory batching.
+
+        Parameters
+        ----------
+        sources : path | np.ndarray | list of these
+            `.npy` files (opened with `mmap_mode="r"`), raw binary files (require
+            `dim` and `dtype`), or arrays (including `np.memmap`). Any iterable of
+            shards is accepted and consumed once; shards are reopened lazily.
+        dim : int | None, optional
+            Embedding dimension, needed only for raw binary files.
+        dtype : np.dtype, optional
+            Element type of raw binary files.
+        block_rows : int, optional
+            Number of contiguous rows read into memory at a time for shuffling.
+        """
+        if isinstance(sources, (str, os.PathLike, np.ndarray)):
+            sources = [sources]
+        sources = list(sources)
+        self.shards = [_open_shard(s, dim, np.dtype(dtype)) for s in sources]
+        # Shards opened from a path are pickled by path (see `__getstate__`)
+        self._shard_paths = [None if isinstance(s, np.ndarray) else s for s in sources]
+        self._raw_dtype = np.dtype(dtype)
+        if not self.shards:
+            raise ValueError("StreamingEmbeddingDataset needs at least one shard")
+
+        dims = {shard.shape[1] for shard in self.shards}
+        if len(dims) != 1:
+            raise ValueError(f"All shards must have the same embedding dimension, got {sorted(dims)}")
+        self.dim = dims.pop()
+        self.block_rows = block_rows
+        self.shard_rows = [shard.shape[0] for shard in self.shards]
+
+    def __getstate__(self):
+        # Reopen file-backed shards in the unpickling process instead of copying their data
+        state = self.__dict__.copy()
+        state["shards"] = [
+            shard if path is None else None for shard, path in zip(self.shards, self._shard_paths)
+        ]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shards = [
+            shard if path is None else _open_shard(path, self.dim, self._raw_dtype)
+            for shard, path in zip(self.shards, self._shard_paths)
+        ]
+
+    def __len__(self) -> int:
+        return sum(self.shard_rows)
+
+    @property
+    def shape(self):
+        return (len(self), self.dim)
+
+    def _blocks(self):
+        return [
+            (shard_idx, start, min(start + self.block_rows, n_rows))
+            for shard_idx, n_rows in enumerate(self.shard_rows)
+            for start in range(0, n_rows, self.block_rows)
+        ]
+
+    def iter_batches(
+        self,
+        batch_size: int,
+        shuffle: bool = True,
+        rng: Optional[np.random.Generator] = None,
+        skip_batches: int = 0,
+    ) -> Iterator[torch.Tensor]:
+        """Yield float32 batches; rows left over at the end of a block carry into the next one.
+
+        The first `skip_batches` batches are skipped without reading their rows from disk; the
+        remaining batches (and the draws from `rng`) are the same as without skipping.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        blocks = self._blocks()
+        if shuffle:
+            blocks = [blocks[i] for i in rng.permutation(len(blocks))]
+
+        skip_rows = skip_batches * batch_size
+        leftover = np.empty((0, self.dim), dtype=np.float32)
+        for shard_idx, start, end in blocks:
+            rows = rng.permutation(end - start) if shuffle else None
+            offset = min(skip_rows, end - start)
+            skip_rows -= offset
+            if offset == end - start:
+                continue
+            if rows is not None:
+                block = self.shards[shard_idx][start:end][rows[offset:]]
+            else:
+                block = self.shards[shard_idx][start + offset:end]
+            # Memmap slices are read-only views; torch needs a writable buffer
+            block = np.require(block, dtype=np.float32, requirements=["C", "W"])
+            if len(leftover) > 0:
+                block = np.concatenate([leftover, block], axis=0)
+
+            n_full = (len(block) // batch_size) * batch_size
+            for i in range(0, n_full, batch_size):
+                yield torch.from_numpy(block[i:i + batch_size])
+            leftover = block[n_full:]
+
+        if len(leftover) > 0:
+            yield torch.from_numpy(np.ascontiguousarray(leftover))
+
+    def sample_rows(self, n_samples: int, rng: Optional[np.random.Generator] = None) -> torch.Tensor:
+        """Return a uniform random sample of rows (without replacement) as a float32 tensor."""
+        rng = rng if rng is not None else np.random.default_rng()
+        n_total = len(self)
+        if n_samples >= n_total:
+            rows = np.arange(n_total)
+        else:
+            rows = np.sort(rng.choice(n_total, size=n_samples, replace=False))
+
+        shard_ends = np.cumsum(self.shard_rows)
+        samples = []
+        for shard_idx, shard in enumerate(self.shards):
+            shard_start = shard_ends[shard_idx] - self.shard_rows[shard_idx]
+            shard_rows = rows[(rows >= shard_start) & (rows < shard_ends[shard_idx])] - shard_start
+            if len(shard_rows) > 0:
+                samples.append(np.asarray(shard[shard_rows], dtype=np.float32))
+        return torch.from_numpy(np.concatenate(samples, axis=0))
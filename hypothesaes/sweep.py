@@ -0,0 +1,266 @@
+"""Train many SAE configurations concurrently for hyperparameter sweeps.
+
+Configurations that share a batch size are *fused*: they are trained in a single
+loop in which every shuffled input batch is loaded once and fed to each SAE in
+turn. Groups that cannot be fused (different batch sizes) are spread across a
+process pool. Every run keeps its own optimizer, early-stopping state and timer.
+"""
+
+import concurrent.futures
+import multiprocessing
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import torch
+from tqdm.auto import tqdm
+
+from .sae import (
+    SparseAutoencoder,
+    device,
+    find_existing_checkpoint,
+    get_sae_checkpoint_name,
+    load_model,
+    _batch_to_device,
+    _get_init_data,
+    _iterate_batches,
+)
+from .streaming import StreamingEmbeddingDataset
+from .quickstart import _prepare_training_embeddings
+
+MODEL_KEYS = ("M", "K", "matryoshka_prefix_lengths", "aux_k", "multi_k", "dead_neuron_threshold_steps")
+TRAINING_KEYS = ("batch_size", "learning_rate", "n_epochs", "aux_coef", "multi_coef", "patience", "clip_grad")
+
+
+class _SweepRun:
+    """Model, optimizer and early-stopping state of one configuration in a fused loop."""
+
+    def __init__(self, config: Dict[str, Any], sae: Optional[SparseAutoencoder] = None):
+        self.config = config
+        self.checkpoint_path = config["checkpoint_path"]
+        self.sae = sae if sae is not None else SparseAutoencoder(
+            input_dim=config["input_dim"],
+            m_total_neurons=config["M"],
+            k_active_neurons=config["K"],
+            aux_k=config["aux_k"],
+            multi_k=config["multi_k"],
+            dead_neuron_threshold_steps=config["dead_neuron_threshold_steps"],
+            prefix_lengths=config["matryoshka_prefix_lengths"],
+        )
+        self.optimizer = None
+        self.history = {"train_loss": [], "val_loss": [], "dead_neuron_ratio": []}
+        self.best_val_loss = float("inf")
+        self.patience_counter = 0
+        self.stopped = False
+        self.wall_time = 0.0
+        self.epoch_loss_sum = None
+
+    def summary(self, loaded_from_checkpoint: bool = False) -> Dict[str, Any]:
+        return {
+            "M": self.config["M"],
+            "K": self.config["K"],
+            "matryoshka_prefix_lengths": self.config["matryoshka_prefix_lengths"],
+            "aux_k": self.sae.aux_k,
+            "multi_k": self.config["multi_k"],
+            "batch_size": self.config["batch_size"],
+            "learning_rate": self.config["learning_rate"],
+            "epochs_trained": len(self.history["train_loss"]),
+            "final_train_loss": self.history["train_loss"][-1] if self.history["train_loss"] else np.nan,
+            "final_val_loss": self.history["val_loss"][-1] if self.history["val_loss"] else np.nan,
+            "best_val_loss": self.best_val_loss if self.history["val_loss"] else np.nan,
+            "dead_neuron_ratio": self.history["dead_neuron_ratio"][-1] if self.history["dead_neuron_ratio"] else np.nan,
+            "wall_time_s": self.wall_time,
+            "loaded_from_checkpoint": loaded_from_checkpoint,
+            "checkpoint_path": self.checkpoint_path,
+        }
+
+
+def _train_fused_group(
+    embeddings: Any,
+    val_embeddings: Any,
+    configs: List[Dict[str, Any]],
+    show_progress: bool = True,
+    n_threads: Optional[int] = None,
+) -> List[Tuple[SparseAutoencoder, Dict[str, Any]]]:
+    """Train configs that share a batch size in one loop over shared shuffled batches."""
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+    X = _prepare_training_embeddings(embeddings)
+    X_val = _prepare_training_embeddings(val_embeddings) if val_embeddings is not None else None
+    batch_size = configs[0]["batch_size"]
+
+    runs = [_SweepRun(config) for config in configs]
+    init_data = _get_init_data(X).to(device)
+    for run in runs:
+        run.sae.initialize_weights_(init_data)
+        run.optimizer = torch.optim.Adam(run.sae.parameters(), lr=run.config["learning_rate"])
+    del init_data
+
+    max_epochs = max(run.config["n_epochs"] for run in runs)
+    iterator = tqdm(range(max_epochs), desc=f"Sweep ({len(runs)} SAEs, batchsize={batch_size})") if show_progress else range(max_epochs)
+    for epoch in iterator:
+        active_runs = [run for run in runs if not run.stopped and epoch < run.config["n_epochs"]]
+        if not active_runs:
+            break
+        for run in active_runs:
+            run.epoch_loss_sum = torch.zeros((), device=device)
+        n_steps = 0
+
+        for batch_x in _iterate_batches(X, batch_size, shuffle=True):
+            batch_x = _batch_to_device(batch_x)
+            n_steps += 1
+            for run in active_runs:
+                start_time = time.perf_counter()
+                run.epoch_loss_sum += run.sae.training_step(
+                    batch_x, run.optimizer, run.config["aux_coef"], run.config["multi_coef"], run.config["clip_grad"]
+                )
+                run.wall_time += time.perf_counter() - start_time
+
+        for run in active_runs:
+            start_time = time.perf_counter()
+            sae = run.sae
+            run.history["train_loss"].append((run.epoch_loss_sum / n_steps).item())
+            dead_ratio = (sae.steps_since_activation > sae.dead_neuron_threshold_steps).float().mean().item()
+            run.history["dead_neuron_ratio"].append(dead_ratio)
+
+            if X_val is not None:
+                val_loss = sae.evaluate_loss(X_val, batch_size, run.config["aux_coef"], run.config["multi_coef"])
+                run.history["val_loss"].append(val_loss)
+                if val_loss < run.best_val_loss:
+                    run.best_val_loss = val_loss
+                    run.patience_counter = 0
+                else:
+                    run.patience_counter += 1
+                    if run.patience_counter >= run.config["patience"]:
+                        run.stopped = True
+            run.wall_time += time.perf_counter() - start_time
+
+        if show_progress:
+            iterator.set_postfix({"active_runs": sum(not run.stopped for run in active_runs)})
+
+    results = []
+    for run in runs:
+        if run.checkpoint_path is not None:
+            run.sae.save(run.checkpoint_path)
+        results.append((run.sae, run.summary()))
+    return results
+
+
+def train_sae_sweep(
+    embeddings: Union[List, np.ndarray, str, StreamingEmbeddingDataset],
+    configs: List[Dict[str, Any]],
+    *,
+    val_embeddings: Optional[Union[List, np.ndarray, str, StreamingEmbeddingDataset]] = None,
+    checkpoint_dir: Optional[str] = None,
+    overwrite_checkpoint: bool = False,
+    n_processes: int = 1,
+    show_progress: bool = True,
+    **default_kwargs,
+) -> Tuple[List[SparseAutoencoder], pd.DataFrame]:
+    """Train several SAE configurations on the same embeddings and compare them.
+
+    Args:
+        embeddings: Training embeddings (anything accepted by `train_sae`)
+        configs: One dict per SAE with keys "M" and "K", and optionally any of
+            "matryoshka_prefix_lengths", "aux_k", "multi_k", "dead_neuron_threshold_steps",
+            "batch_size", "learning_rate", "n_epochs", "aux_coef", "multi_coef",
+            "patience", "clip_grad" (same meaning as in `train_sae`)
+        val_embeddings: Optional validation embeddings; each run early-stops on its own val loss
+        checkpoint_dir: Optional directory for storing/loading checkpoints; files are named with
+            `get_sae_checkpoint_name`, and existing checkpoints are loaded instead of retrained
+        overwrite_checkpoint: Whether to retrain configs whose checkpoint already exists
+        n_processes: Number of worker processes across which groups of configs that cannot be
+            fused (i.e. that use different batch sizes) are spread
+        show_progress: Whether to show progress bars
+        **default_kwargs: Defaults for any of the optional config keys above
+
+    Returns:
+        Tuple of (list of SAEs in the order of `configs`, DataFrame with one row per config
+        comparing val loss, dead-neuron ratio and wall time)
+    """
+    defaults = {
+        "matryoshka_prefix_lengths": None,
+        "aux_k": None,
+        "multi_k": None,
+        "dead_neuron_threshold_steps": 256,
+        "batch_size": 512,
+        "learning_rate": 5e-4,
+        "n_epochs": 100,
+        "aux_coef": 1 / 32,
+        "multi_coef": 0.0,
+        "patience": 3,
+        "clip_grad": 1.0,
+    }
+    unknown_defaults = set(default_kwargs) - set(defaults)
+    if unknown_defaults:
+        raise ValueError(f"Unknown sweep arguments: {sorted(unknown_defaults)}")
+    defaults.update(default_kwargs)
+
+    X_probe = embeddings if isinstance(embeddings, StreamingEmbeddingDataset) else None
+    if X_probe is None:
+        X_probe = _prepare_training_embeddings(embeddings)
+        if isinstance(X_probe, torch.Tensor):
+            embeddings = X_probe  # reuse the converted tensor instead of converting again per group
+    input_dim = X_probe.shape[1]
+
+    full_configs = []
+    checkpoint_paths = set()
+    for config in configs:
+        unknown_keys = set(config) - set(MODEL_KEYS) - set(TRAINING_KEYS)
+        if unknown_keys:
+            raise ValueError(f"Unknown keys in sweep config {config}: {sorted(unknown_keys)}")
+        if "M" not in config or "K" not in config:
+            raise ValueError(f"Each sweep config needs 'M' and 'K', got {config}")
+        full_config = {**defaults, **config, "input_dim": input_dim, "checkpoint_path": None}
+        if checkpoint_dir is not None:
+            name = get_sae_checkpoint_name(full_config["M"], full_config["K"], full_config["matryoshka_prefix_lengths"])
+            full_config["checkpoint_path"] = os.path.join(checkpoint_dir, name)
+            if full_config["checkpoint_path"] in checkpoint_paths:
+                raise ValueError(f"Two sweep configs map to the same checkpoint name {name}; use separate checkpoint_dirs")
+            checkpoint_paths.add(full_config["checkpoint_path"])
+        full_configs.append(full_config)
+
+    saes = [None] * len(full_configs)
+    rows = [None] * len(full_configs)
+    groups = {}
+    for i, config in enumerate(full_configs):
+        path = find_existing_checkpoint(config["checkpoint_path"]) if config["checkpoint_path"] is not None else None
+        if path is not None and not overwrite_checkpoint:
+            saes[i] = load_model(path)
+            rows[i] = _SweepRun(config, sae=saes[i]).summary(loaded_from_checkpoint=True)
+        else:
+            groups.setdefault(config["batch_size"], []).append(i)
+
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    group_indices = list(groups.values())
+    n_workers = min(n_processes, len(group_indices))
+    if n_workers <= 1:
+        group_results = [
+            _train_fused_group(embeddings, val_embeddings, [full_configs[i] for i in indices], show_progress)
+            for indices in group_indices
+        ]
+    else:
+        n_threads = max(1, (os.cpu_count() or 1) // n_workers)
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _train_fused_group, embeddings, val_embeddings,
+                    [full_configs[i] for i in indices], False, n_threads,
+                )
+                for indices in group_indices
+            ]
+            group_results = [future.result() for future in futures]
+
+    for indices, results in zip(group_indices, group_results):
+        for i, (sae, row) in zip(indices, results):
+            saes[i] = sae.to(device)
+            saes[i].steps_since_activation = saes[i].steps_since_activation.to(device)
+            rows[i] = row
+
+    return saes, pd.DataFrame(rows)
@@ -4,6 +4,8 @@ import os
 import json
 from typing import List, Dict, Any, Optional
 from pathlib import Path
+import numpy as np
+import scipy.sparse
 import tiktoken
 
 
@@ -84,6 +86,96 @@ def filter_invalid_texts(texts: List[str]) -> List[str]:
     
     return filtered_texts
 
+def topk_to_sparse(
+    topk_indices: np.ndarray,
+    topk_values: np.ndarray,
+    n_neurons: int,
+    format: str = "csr"
+) -> scipy.sparse.spmatrix:
+    """Build a sparse (N, n_neurons) activation matrix from top-K indices and values.
+    
+    Args:
+        topk_indices: Neuron indices of shape (N, K)
+        topk_values: Activation values of shape (N, K)
+        n_neurons: Total number of neurons (number of columns)
+        format: "csr" or "csc"
+    
+    Returns:
+        SciPy sparse matrix with explicit zeros (e.g. from ReLU) removed
+    """
+    # Drop zeros while gathering, rather than with `eliminate_zeros()`, which would compact
+    # the caller's `topk_values` in place (the matrix shares its buffer)
+    nonzero = topk_values != 0
+    indptr = np.zeros(topk_indices.shape[0] + 1, dtype=np.int64)
+    np.cumsum(nonzero.sum(axis=1), out=indptr[1:])
+    matrix = scipy.sparse.csr_matrix(
+        (topk_values[nonzero], topk_indices[nonzero], indptr),
+        shape=(topk_indices.shape[0], n_neurons),
+    )
+    return matrix.asformat(format)
+
+class TopKActivations(tuple):
+    """(indices, values) top-K activations that also record the total number of neurons.
+
+    Unpacks like a plain (indices, values) tuple; `n_neurons` is the width of the
+    activation matrix, which the indices alone do not determine (neurons that never
+    fire in the top-K would be lost).
+    """
+
+    def __new__(cls, indices: np.ndarray, values: np.ndarray, n_neurons: int) -> "TopKActivations":
+        activations = super().__new__(cls, (indices, values))
+        activations.n_neurons = int(n_neurons)
+        return activations
+
+    def __getnewargs__(self):
+        return (*self, self.n_neurons)
+
+def get_num_neurons(activations: Any, n_neurons: Optional[int] = None) -> int:
+    """Return the number of neurons in a dense, sparse, or (indices, values) activation matrix.
+    
+    The width of (indices, values) top-K tuples is `n_neurons` if given, else the
+    `n_neurons` recorded by a `TopKActivations`; for a plain tuple it must be given.
+    """
+    if isinstance(activations, tuple):
+        n_neurons = n_neurons if n_neurons is not None else getattr(activations, "n_neurons", None)
+        if n_neurons is None:
+            raise ValueError(
+                "The number of neurons of (indices, values) top-K activations cannot be inferred from the indices; "
+                "pass n_neurons or use TopKActivations(indices, values, n_neurons)"
+            )
+        return n_neurons
+    return activations.shape[1]
+
+def to_neuron_major(activations: Any, n_neurons: Optional[int] = None) -> Any:
+    """Convert activations to a format with fast per-neuron column access.
+    
+    Dense arrays are returned unchanged; SciPy sparse matrices and (indices, values)
+    top-K tuples (whose width is given as in `get_num_neurons`) are converted to CSC.
+    """
+    if isinstance(activations, tuple):
+        indices, values = activations
+        return topk_to_sparse(indices, values, get_num_neurons(activations, n_neurons), format="csc")
+    if scipy.sparse.issparse(activations):
+        return activations.tocsc()
+    return activations
+
+def get_neuron_activations(activations: Any, neuron_idx: int) -> np.ndarray:
+    """Return the dense (N,) activation vector of a single neuron.
+    
+    Args:
+        activations: Dense (N, M) array, SciPy sparse matrix, or (indices, values) top-K tuple
+        neuron_idx: Index of the neuron (column)
+    """
+    if isinstance(activations, tuple):
+        indices, values = activations
+        neuron_acts = np.zeros(indices.shape[0], dtype=values.dtype)
+        rows, cols = np.nonzero(indices == neuron_idx)
+        neuron_acts[rows] = values[rows, cols]
+        return neuron_acts
+    if scipy.sparse.issparse(activations):
+        return activations[:, [neuron_idx]].toarray().ravel()
+    return activations[:, neuron_idx]
+
 def save_json(data: Dict[str, Any], filepath: str) -> None:
     """Save data to a JSON file, creating directories if needed."""
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
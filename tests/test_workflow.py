@@ -1,18 +1,28 @@
 import os
+import asyncio
+import warnings
 import pytest
 import numpy as np
 import torch
+import torch.nn.functional as F
 from pathlib import Path
+from types import SimpleNamespace
 import hypothesaes
 from hypothesaes import (
     get_openai_embeddings,
     get_local_embeddings,
+    get_local_embedding_matrix,
     train_sae,
     interpret_sae,
     generate_hypotheses,
-    evaluate_hypotheses
+    evaluate_hypotheses,
+    get_multiple_sae_activations
 )
-from hypothesaes.sae import get_sae_checkpoint_name, load_model
+from hypothesaes.sae import get_sae_checkpoint_name, load_model, convert_checkpoint, sparse_decode, _iterate_batches
+from hypothesaes.embedding_cache import EmbeddingCache
+from hypothesaes.activation_cache import ActivationCache, get_cached_sae_activations
+from hypothesaes.quickstart import _get_activations
+from hypothesaes.utils import TopKActivations, get_num_neurons, to_neuron_major
 
 from hypothesaes.llm_api import get_completion
 
@@ -106,11 +116,230 @@ def test_compute_openai_embeddings(test_data):
     openai_embeddings = np.array([openai_emb_dict[text] for text in sentences])
     assert openai_embeddings.shape == (len(ALL_SENTENCES), 1536), f"OpenAI embeddings shape is {openai_embeddings.shape}, expected ({len(ALL_SENTENCES)}, 1536)"
 
+class _FakeEncoding:
+    """Word-level stand-in for a tiktoken encoding: one token per word."""
+
+    def encode_ordinary_batch(self, texts):
+        return [[sum(map(ord, word)) for word in text.split()] for text in texts]
+
+def _fake_embedding(tokens):
+    return [float(len(tokens)), float(sum(tokens)), float(tokens[0])]
+
+class _FakeAsyncEmbeddingClient:
+    """Stand-in for `openai.AsyncOpenAI` that records requests and the number in flight."""
+
+    def __init__(self, delays=(), failing_requests=()):
+        self.embeddings = self
+        self.delays = delays  # seconds per request, by request order (default 0.01)
+        self.failing_requests = set(failing_requests)
+        self.requests, self.done = [], []
+        self.in_flight = self.max_in_flight = 0
+
+    async def create(self, input, model, timeout):
+        request = len(self.requests)
+        self.requests.append(input)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays[request] if request < len(self.delays) else 0.01)
+            if request in self.failing_requests:
+                raise RuntimeError("fake API error")
+            return SimpleNamespace(data=[SimpleNamespace(embedding=_fake_embedding(tokens)) for tokens in input])
+        finally:
+            self.in_flight -= 1
+            self.done.append(request)
+
+    async def close(self):
+        pass
+
+def test_openai_embedding_packing(test_data, tmp_path, monkeypatch):
+    """Test token-budget packing, input-order rows, failure masking, and resuming from the cache (no API calls)."""
+    monkeypatch.setattr(hypothesaes.embedding.tiktoken, "get_encoding", lambda name: _FakeEncoding())
+    monkeypatch.setattr(hypothesaes.embedding, "CACHE_DIR", str(tmp_path))
+    texts = test_data["sentences"] + [None, " " + test_data["sentences"][0]]
+    tokens = _FakeEncoding().encode_ordinary_batch([text.strip() for text in test_data["sentences"]])
+    expected = np.array([_fake_embedding(t) for t in tokens], dtype=np.float32)
+    embed_kwargs = dict(model=OPENAI_MODEL_TESTING, batch_size=3, max_tokens_per_request=40, n_workers=2,
+                        cache_name="test", show_progress=False, use_rate_limiter=False)
+
+    client = _FakeAsyncEmbeddingClient(failing_requests={0})
+    monkeypatch.setattr(hypothesaes.llm_api, "get_async_client", lambda: client)
+    matrix, failed = hypothesaes.get_openai_embedding_matrix(texts, **embed_kwargs)
+    assert all(len(request) <= 3 and sum(map(len, request)) <= 40 for request in client.requests)
+    assert sorted(map(tuple, sum(client.requests, []))) == sorted(map(tuple, tokens))  # each unique text sent once
+    failed_tokens = set(map(tuple, client.requests[0]))
+    expected_failed = np.array([tuple(t) in failed_tokens for t in tokens] + [True, tuple(tokens[0]) in failed_tokens])
+    assert np.array_equal(failed, expected_failed)
+    assert not matrix[failed].any()
+    assert np.array_equal(matrix[:len(expected)][~failed[:len(expected)]], expected[~failed[:len(expected)]])
+
+    # A rerun embeds only the texts that failed; everything else comes from the cache
+    client = _FakeAsyncEmbeddingClient()
+    monkeypatch.setattr(hypothesaes.llm_api, "get_async_client", lambda: client)
+    matrix, failed = hypothesaes.get_openai_embedding_matrix(texts, **embed_kwargs)
+    assert set(map(tuple, sum(client.requests, []))) == failed_tokens
+    assert np.array_equal(failed, np.arange(len(texts)) == len(expected))
+    assert np.array_equal(matrix[:len(expected)], expected) and np.array_equal(matrix[-1], expected[0])
+
+def test_openai_embedding_rolling_window(test_data, monkeypatch):
+    """Test that requests run in one window of n_workers across chunks, so a slow request stalls no chunk."""
+    monkeypatch.setattr(hypothesaes.embedding.tiktoken, "get_encoding", lambda name: _FakeEncoding())
+    client = _FakeAsyncEmbeddingClient(delays=[0.5])
+    monkeypatch.setattr(hypothesaes.llm_api, "get_async_client", lambda: client)
+    sentences = test_data["sentences"]
+    matrix, failed = hypothesaes.get_openai_embedding_matrix(
+        sentences, model=OPENAI_MODEL_TESTING, batch_size=2, n_workers=3, chunk_size=8,
+        show_progress=False, use_rate_limiter=False,
+    )
+    assert not failed.any() and len(client.requests) == len(sentences) // 2
+    assert client.max_in_flight == 3
+    # Every other request, including those of later chunks, finished while the first one was in flight
+    assert client.done[-1] == 0
+    later_chunks = set(map(tuple, _FakeEncoding().encode_ordinary_batch(sentences[8:])))
+    assert any(tuple(tokens) in later_chunks for request in client.requests[1:] for tokens in request)
+
 def test_compute_local_embeddings(test_data):
     """Test local embeddings shape."""
     local_embeddings = test_data["local_embeddings"]
     assert local_embeddings.shape == (len(ALL_SENTENCES), 384), f"Local embeddings shape is {local_embeddings.shape}, expected ({len(ALL_SENTENCES)}, 384)"
 
+def test_local_embedding_matrix(test_data):
+    """Test that the matrix API returns float32 rows in input order, matching the dict API."""
+    texts = test_data["sentences"][::-1] + test_data["sentences"][:3]  # reordered, with repeats
+    embeddings, failed = get_local_embedding_matrix(texts=texts, model=LOCAL_MODEL_TESTING, show_progress=False)
+    assert embeddings.shape == (len(texts), 384) and embeddings.dtype == np.float32
+    assert failed.shape == (len(texts),) and not failed.any()
+    expected = dict(zip(test_data["sentences"], test_data["local_embeddings"]))
+    assert np.allclose(embeddings, np.array([expected[text] for text in texts]), atol=1e-5)
+
+def test_local_embedding_length_sorting():
+    """Test that length-sorted batching returns each row in input order, matching one unsorted batch."""
+    from sentence_transformers import SentenceTransformer
+    rng = np.random.default_rng(0)
+    texts = [" ".join(["word"] * n_words) + f" {i}" for i, n_words in enumerate(rng.integers(1, 40, size=13))]
+    texts = [texts[i] for i in rng.permutation(len(texts))]
+    embeddings, _ = get_local_embedding_matrix(texts=texts, model=LOCAL_MODEL_TESTING, batch_size=3, show_progress=False)
+    unsorted = SentenceTransformer(LOCAL_MODEL_TESTING).encode(texts, batch_size=len(texts), show_progress_bar=False)
+    for row, expected in zip(embeddings, unsorted):
+        assert np.allclose(row, expected, atol=1e-5)
+
+def test_onnx_int8_embeddings(test_data, tmp_path, monkeypatch):
+    """Test exporting the int8 ONNX backend once and its agreement with fp32 embeddings."""
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("optimum")
+    monkeypatch.setattr(hypothesaes.embedding, "QUANTIZED_MODEL_DIR", str(tmp_path))
+    export = hypothesaes.export_quantized_model(LOCAL_MODEL_TESTING)
+    assert os.path.exists(os.path.join(*export))
+    assert hypothesaes.export_quantized_model(LOCAL_MODEL_TESTING) == export  # reused, not re-exported
+
+    int8, failed = get_local_embedding_matrix(test_data["sentences"], model=LOCAL_MODEL_TESTING, backend="onnx-int8", show_progress=False)
+    assert not failed.any() and int8.shape == test_data["local_embeddings"].shape
+    report = hypothesaes.check_quantized_embeddings(test_data["sentences"], model=LOCAL_MODEL_TESTING, show_progress=False)
+    assert report["mean_cosine"] >= 0.98
+
+def test_embedding_cache(test_data, tmp_path):
+    """Test that the memory-mapped embedding cache returns rows in request order and persists."""
+    sentences, embeddings = test_data["sentences"], test_data["local_embeddings"]
+    cache = EmbeddingCache(str(tmp_path))
+    cache.add(sentences[:10], embeddings[:10])
+    cache.add(sentences, embeddings)
+
+    reopened = EmbeddingCache(str(tmp_path))
+    assert len(reopened) == len(sentences)
+    query = sentences[::-1] + ["not cached"]
+    matrix, found = reopened.get(query)
+    assert found[:-1].all() and not found[-1]
+    assert np.allclose(matrix[:-1], embeddings[::-1])
+
+    # A write interrupted before its journal entries are complete is ignored and overwritten
+    with open(tmp_path / "embeddings.bin", "ab") as f:
+        f.write(b"\0" * 100)
+    with open(tmp_path / "hashes.bin", "ab") as f:
+        f.write(b"\1" * 3)
+    resumed = EmbeddingCache(str(tmp_path))
+    assert len(resumed) == len(sentences)
+    resumed.add(["not cached"], embeddings[:1])
+    matrix, found = EmbeddingCache(str(tmp_path)).get(query)
+    assert found.all() and np.allclose(matrix[-1], embeddings[0])
+
+    # Two writers (e.g. processes) sharing a cache append after each other's committed rows
+    first, second = EmbeddingCache(str(tmp_path / "shared")), EmbeddingCache(str(tmp_path / "shared"))
+    first.add(sentences[:20], embeddings[:20])
+    second.add(sentences[10:30], embeddings[10:30])
+    first.add(sentences[25:], embeddings[25:])
+    shared = EmbeddingCache(str(tmp_path / "shared"))
+    matrix, found = shared.get(sentences)
+    assert len(shared) == len(sentences) and found.all() and np.allclose(matrix, embeddings)
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_embedding_cache(test_data, tmp_path, dtype):
+    """Test that float16/int8 caches dequantize to embeddings with matching SAE activations."""
+    sentences, embeddings = test_data["sentences"], test_data["local_embeddings"]
+    EmbeddingCache(str(tmp_path), dtype=dtype).add(sentences, embeddings)
+    cached, found = EmbeddingCache(str(tmp_path)).get(sentences)
+    assert found.all() and cached.dtype == np.float32
+
+    sae = train_sae(embeddings, M=8, K=2, n_epochs=3, show_progress=False)
+    expected = sae.get_activations(embeddings, show_progress=False)
+    actual = sae.get_activations(cached, show_progress=False)
+    assert np.corrcoef(expected.ravel(), actual.ravel())[0, 1] > 0.95
+
+def test_embedding_cache_namespaces(test_data, tmp_path, monkeypatch):
+    """Test that cached local embeddings are found again under their model namespace."""
+    monkeypatch.setattr(hypothesaes.embedding, "CACHE_DIR", str(tmp_path))
+    sentences = test_data["sentences"]
+    first, _ = get_local_embedding_matrix(sentences, model=LOCAL_MODEL_TESTING, cache_name="test", show_progress=False)
+    cache = hypothesaes.embedding.get_embedding_cache("test", LOCAL_MODEL_TESTING, hypothesaes.embedding.get_local_recipe(LOCAL_MODEL_TESTING))
+    assert cache.lookup([hypothesaes.embedding.normalize_text(" " + text) for text in sentences]).min() >= 0  # keys are normalized texts
+    second, _ = get_local_embedding_matrix([" " + text for text in sentences], model=LOCAL_MODEL_TESTING, cache_name="test", show_progress=False)
+    assert np.allclose(first, second)
+
+    # A legacy (un-namespaced) cache is only moved into a namespace explicitly, and only if its dimension matches
+    EmbeddingCache(str(tmp_path / "legacy")).add(sentences, first)
+    with pytest.raises(ValueError):
+        hypothesaes.migrate_unnamespaced_embedding_cache("legacy", model="text-embedding-3-small")
+    hypothesaes.migrate_unnamespaced_embedding_cache("legacy", model=LOCAL_MODEL_TESTING)
+    migrated, _ = get_local_embedding_matrix(sentences, model=LOCAL_MODEL_TESTING, cache_name="legacy", show_progress=False)
+    assert np.allclose(first, migrated)
+
+def test_deduplicate_texts(test_data):
+    """Test exact and near-duplicate collapsing and the mapping back to the original rows."""
+    sentences = test_data["sentences"]
+    texts = sentences + [sentences[0].upper(), "  " + sentences[1], sentences[2].replace(".", "!")]
+    exact = hypothesaes.deduplicate_texts(texts)
+    assert exact.n_unique == len(sentences) + 1
+    near = hypothesaes.deduplicate_texts(texts, near_duplicates=True, threshold=0.5)
+    assert near.n_unique == len(sentences)
+    assert list(near.expand(near.unique(texts))[-3:]) == sentences[:3]
+
+def test_annotation_store(test_data, tmp_path):
+    """Test full-text keys, batched lookups, and migration from a legacy JSON annotation cache."""
+    import json
+    sentences = test_data["sentences"]
+    # Two long texts with the same first and last 100 characters collided in the legacy keys
+    long_texts = ["a" * 100 + " one " + "b" * 100, "a" * 100 + " two " + "b" * 100]
+    store = hypothesaes.AnnotationStore(str(tmp_path / "annotations.sqlite"))
+    store.put_many("model", "v1", [(long_texts[0], "concept", 1), (long_texts[1], "concept", 0)])
+    store.put_many("model", "v1", [(text, "concept", i % 2) for i, text in enumerate(sentences)])
+    found = store.get_many("model", "v1", [(text, "concept") for text in long_texts + sentences])
+    assert found[(long_texts[0], "concept")] == 1 and found[(long_texts[1], "concept")] == 0
+    assert len(found) == len(sentences) + 2
+    assert store.get_many("other-model", "v1", [(sentences[0], "concept")]) == {}
+
+    # Every legacy entry is imported under the legacy namespace, keyed by its stored head and tail
+    legacy_path = tmp_path / "legacy.json"
+    legacy = {f"concept|||{text[:100]}...{text[-100:]}": 1 for text in sentences + long_texts}
+    legacy_path.write_text(json.dumps(legacy))
+    assert hypothesaes.migrate_json_annotation_cache(str(legacy_path), store) == len(legacy)
+    assert len(store.get_many_legacy([(text, "concept") for text in sentences + long_texts])) == len(sentences) + 2
+    assert store.get_many("legacy-model", "v0", [(sentences[0], "concept")]) == {}
+    store.close()
+
+    # annotate() imports a JSON cache next to its store and reads through to it for any model
+    legacy_path.rename(tmp_path / "cached.json")
+    results = hypothesaes.annotate.annotate([(text, "concept") for text in sentences], cache_path=str(tmp_path / "cached.sqlite"), show_progress=False)
+    assert all(results["concept"][text] == 1 for text in sentences)
+
 def test_train_sae(test_data):
     """Test training, saving, and loading SAEs with different configurations."""
     M, K = 2, 1
@@ -122,12 +351,334 @@ def test_train_sae(test_data):
     _ = load_model(checkpoint_path)
     os.remove(checkpoint_path)
 
+def test_train_sae_streaming(test_data, tmp_path):
+    """Test training from a memory-mapped .npy file, with batches carried across blocks."""
+    embeddings = test_data["local_embeddings"].astype(np.float32)
+    npy_path = tmp_path / "embeddings.npy"
+    np.save(npy_path, embeddings)
+    dataset = hypothesaes.StreamingEmbeddingDataset(str(npy_path), block_rows=7)
+
+    for shuffle in (False, True):
+        batches = list(dataset.iter_batches(4, shuffle=shuffle, rng=np.random.default_rng(0)))
+        # Batches are private copies, never views of the read-only memmap
+        assert not any(np.shares_memory(batch.numpy(), dataset.shards[0]) for batch in batches)
+        rows = torch.cat(batches)
+        assert rows.shape == embeddings.shape
+        if shuffle:
+            rows = rows[np.lexsort(rows.numpy().T)]
+            expected = embeddings[np.lexsort(embeddings.T)]
+        else:
+            expected = embeddings
+        assert np.array_equal(rows.numpy(), expected)
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings("error", message=".*not writable.*")
+        sae = train_sae(dataset, 4, 1, n_epochs=2, batch_size=8, checkpoint_dir=str(tmp_path), val_embeddings=str(npy_path))
+    assert sae.m_total_neurons == 4
+    assert os.path.exists(tmp_path / get_sae_checkpoint_name(4, 1))
+
+def test_iterate_batches_epoch(tmp_path):
+    """Test that one epoch visits every row exactly once, including the ragged last batch."""
+    n_rows, batch_size = 23, 5
+    X = torch.arange(n_rows, dtype=torch.float32)[:, None].repeat(1, 3)
+    np.save(tmp_path / "rows.npy", X.numpy())
+    dataset = hypothesaes.StreamingEmbeddingDataset(str(tmp_path / "rows.npy"), block_rows=7)
+    for data in (X, dataset):
+        for shuffle in (False, True):
+            rng_state = torch.get_rng_state()
+            batches = list(_iterate_batches(data, batch_size, shuffle=shuffle))
+            if not shuffle:
+                assert torch.equal(torch.get_rng_state(), rng_state)
+            assert [len(batch) for batch in batches] == [5, 5, 5, 5, 3]
+            rows = torch.cat(batches)[:, 0].long()
+            assert sorted(rows.tolist()) == list(range(n_rows))
+            if not shuffle:
+                assert rows.tolist() == list(range(n_rows))
+
+            # Resuming skips batches without changing the remaining ones
+            torch.manual_seed(0)
+            batches = list(_iterate_batches(data, batch_size, shuffle=shuffle))
+            torch.manual_seed(0)
+            resumed = list(_iterate_batches(data, batch_size, shuffle=shuffle, skip_batches=2))
+            assert len(resumed) == len(batches) - 2
+            assert all(torch.equal(a, b) for a, b in zip(batches[2:], resumed))
+
+    # Skipped streamed blocks are never read
+    class RecordingShard:
+        def __init__(self, shard):
+            self.shard, self.reads = shard, []
+        def __getitem__(self, key):
+            self.reads.append((key.start, key.stop))
+            return self.shard[key]
+    dataset.shards[0] = RecordingShard(dataset.shards[0])
+    list(dataset.iter_batches(batch_size, shuffle=False, skip_batches=2))
+    assert dataset.shards[0].reads == [(10, 14), (14, 21), (21, 23)]
+
+def test_train_sae_sweep(test_data, tmp_path):
+    """Test a fused sweep group plus a second group in the process pool, checkpoint reuse, and name clashes."""
+    embeddings = test_data["local_embeddings"]
+    configs = [{"M": 4, "K": 1}, {"M": 8, "K": 2}, {"M": 8, "K": 1, "batch_size": 16}]
+    sweep_kwargs = dict(checkpoint_dir=str(tmp_path), batch_size=32, n_epochs=2, show_progress=False)
+    saes, table = hypothesaes.train_sae_sweep(embeddings, configs, n_processes=2, **sweep_kwargs)
+    assert [sae.m_total_neurons for sae in saes] == [4, 8, 8]
+    assert not table["loaded_from_checkpoint"].any() and (table["epochs_trained"] == 2).all()
+    for config in configs:
+        assert os.path.exists(tmp_path / get_sae_checkpoint_name(config["M"], config["K"]))
+
+    _, table = hypothesaes.train_sae_sweep(embeddings, configs, **sweep_kwargs)
+    assert table["loaded_from_checkpoint"].all()
+    with pytest.raises(ValueError):
+        hypothesaes.train_sae_sweep(embeddings, [{"M": 4, "K": 1}, {"M": 4, "K": 1, "learning_rate": 1e-3}], **sweep_kwargs)
+
+def test_resume_training(test_data, tmp_path, monkeypatch):
+    """Test that resuming an interrupted fit reproduces the uninterrupted run exactly."""
+    X = torch.tensor(test_data["local_embeddings"])
+    fit_kwargs = dict(X_val=X[:8], batch_size=8, n_epochs=3, show_progress=False, checkpoint_every_n_steps=3)
+    torch.manual_seed(0)
+    reference = hypothesaes.SparseAutoencoder(X.shape[1], 8, 2)
+    reference_history = reference.fit(X, save_dir=str(tmp_path / "full"), **fit_kwargs)
+
+    # Interrupt in the middle of the second epoch (5 steps per epoch), after the checkpoint at step 6
+    training_step, n_steps = hypothesaes.SparseAutoencoder.training_step, [0]
+    def interrupted_training_step(self, *args):
+        n_steps[0] += 1
+        if n_steps[0] > 7:
+            raise KeyboardInterrupt
+        return training_step(self, *args)
+    monkeypatch.setattr(hypothesaes.SparseAutoencoder, "training_step", interrupted_training_step)
+    torch.manual_seed(0)
+    with pytest.raises(KeyboardInterrupt):
+        hypothesaes.SparseAutoencoder(X.shape[1], 8, 2).fit(X, save_dir=str(tmp_path / "resumed"), **fit_kwargs)
+    monkeypatch.undo()
+
+    torch.manual_seed(1)  # the resumed run must not depend on the caller's RNG state
+    resumed = hypothesaes.SparseAutoencoder(X.shape[1], 8, 2)
+    resumed_history = resumed.fit(X, save_dir=str(tmp_path / "resumed"), resume=True, **fit_kwargs)
+    assert resumed_history == reference_history
+    for name, tensor in reference.state_dict().items():
+        assert torch.equal(tensor, resumed.state_dict()[name]), name
+    assert torch.equal(reference.steps_since_activation, resumed.steps_since_activation)
+
+def test_checkpoint_formats(test_data, tmp_path):
+    """Test legacy .pt conversion and encoder-only loading of the memory-mapped checkpoint format."""
+    embeddings = test_data["local_embeddings"]
+    sae = train_sae(embeddings, M=4, K=2, n_epochs=3)
+    legacy_path = sae.save(str(tmp_path / "sae.pt"))
+    converted_path = convert_checkpoint(legacy_path)
+    assert converted_path.endswith(".sae")
+
+    expected = sae.get_activations(embeddings, show_progress=False)
+    for encoder_only in [False, True]:
+        loaded = load_model(converted_path, map_location="cpu", encoder_only=encoder_only)
+        assert np.allclose(loaded.get_activations(embeddings, show_progress=False), expected)
+    assert loaded.decoder is None
+
 def test_train_matryoshka_sae(test_data):
     """Test training a Matryoshka SAE (with multiple prefix lengths)."""
     matryoshka_prefix_lengths = [2, 4]
     sae = train_sae(embeddings=test_data["local_embeddings"], M=4, K=1, matryoshka_prefix_lengths=matryoshka_prefix_lengths, n_epochs=3)
     assert sae.prefix_lengths == matryoshka_prefix_lengths
 
+def _data_parallel_counters_worker(rank, work_dir, X_train, X_val):
+    import torch.distributed as dist
+    dist.init_process_group("gloo", init_method=f"file://{os.path.join(work_dir, 'rendezvous')}", rank=rank, world_size=2)
+    try:
+        torch.manual_seed(0)
+        sae = hypothesaes.SparseAutoencoder(X_train.shape[1], 16, 2, dead_neuron_threshold_steps=2)
+        sae.fit(X_train, X_val, batch_size=16, n_epochs=3, show_progress=False)
+        counters = [torch.zeros_like(sae.steps_since_activation) for _ in range(2)]
+        dist.all_gather(counters, sae.steps_since_activation)
+        assert torch.equal(counters[0], counters[1]), "dead-neuron counters diverged across ranks"
+    finally:
+        dist.destroy_process_group()
+
+def test_data_parallel_validation(test_data, tmp_path):
+    """Test that validation (split across 2 ranks) keeps the ranks' dead-neuron counters identical."""
+    embeddings = torch.tensor(test_data["local_embeddings"])
+    torch.multiprocessing.spawn(
+        _data_parallel_counters_worker, args=(str(tmp_path), embeddings[:32], embeddings[32:]), nprocs=2, join=True
+    )
+
+def test_data_parallel_too_few_rows(test_data):
+    """Test that data-parallel training refuses inputs that would give some rank no rows."""
+    embeddings = torch.tensor(test_data["local_embeddings"])
+    sae = hypothesaes.SparseAutoencoder(embeddings.shape[1], 4, 1)
+    with pytest.raises(ValueError):
+        hypothesaes.fit_data_parallel(sae, embeddings[:1], n_processes=2, n_epochs=1)
+    with pytest.raises(ValueError):
+        hypothesaes.fit_data_parallel(sae, embeddings, n_processes=2, n_epochs=1, batch_size=1)
+
+def test_sparse_decode_gradcheck():
+    """Test the gather-based decoder against the dense product, and its backward with gradcheck."""
+    generator = torch.Generator().manual_seed(0)
+    dec_weight = torch.randn(6, 32, dtype=torch.float64, generator=generator, requires_grad=True)
+    values = torch.randn(5, 3, dtype=torch.float64, generator=generator, requires_grad=True)
+    indices = torch.stack([torch.randperm(32, generator=generator)[:3] for _ in range(5)])
+    dense = torch.zeros(5, 32, dtype=torch.float64).scatter(1, indices, values)
+    assert torch.allclose(sparse_decode(indices, values, dec_weight), dense @ dec_weight.t())
+    assert torch.autograd.gradcheck(lambda v, w: sparse_decode(indices, v, w), (values, dec_weight))
+
+    # Under autocast only the gathered columns are cast; gradients stay in the weight's dtype
+    dec_weight32 = dec_weight.detach().float().requires_grad_()
+    with torch.autocast(device_type="cpu", dtype=torch.bfloat16):
+        out = sparse_decode(indices, values.detach().float(), dec_weight32)
+    assert out.dtype == torch.bfloat16
+    assert torch.allclose(out.float(), (dense @ dec_weight.t()).float(), atol=5e-2)
+    out.float().sum().backward()
+    assert dec_weight32.grad.dtype == torch.float32
+    assert torch.allclose(dec_weight32.grad, torch.ones(6, 5) @ dense.float(), atol=1e-5)
+
+def test_fast_training(capsys):
+    """Test that bf16 autocast (with the sparse decoder) and torch.compile train to the fp32 eager losses."""
+    X = torch.randn(256, 32, generator=torch.Generator().manual_seed(0))
+    def fit(**kwargs):
+        torch.manual_seed(0)
+        sae = hypothesaes.SparseAutoencoder(32, 64, 4, sparse_decode=True)
+        return sae.fit(X, X_val=X[:64], n_epochs=2, batch_size=64, show_progress=False, **kwargs)
+    eager = fit()
+    mixed = fit(mixed_precision=True)
+    assert np.allclose(mixed["train_loss"], eager["train_loss"], rtol=5e-2)
+    assert np.allclose(mixed["val_loss"], eager["val_loss"], rtol=5e-2)
+    compiled = fit(compile=True)
+    assert "compiled training step failed" not in capsys.readouterr().out
+    assert np.allclose(compiled["train_loss"], eager["train_loss"], rtol=1e-4)
+
+def test_encode_matches_forward(test_data):
+    """Test that get_activations matches forward()'s top-K and leaves the dead-neuron counters untouched."""
+    embeddings = torch.tensor(test_data["local_embeddings"])
+    torch.manual_seed(0)
+    sae = hypothesaes.SparseAutoencoder(embeddings.shape[1], 16, 3)
+    sae.steps_since_activation.copy_(torch.arange(16))
+    counters = sae.steps_since_activation.clone()
+
+    topk_indices, topk_values = sae.get_activations(embeddings, show_progress=False, output_format="topk")
+    assert torch.equal(sae.steps_since_activation, counters)
+    sae.eval()
+    with torch.no_grad():
+        _, info = sae(embeddings)
+    assert np.array_equal(topk_indices, info["topk_indices"].numpy())
+    assert np.allclose(topk_values, info["topk_values"].numpy(), atol=1e-6)
+
+def test_dead_neuron_aux_topk():
+    """Test the dead-subset aux top-K against a masked full-width top-K, and that no aux term is added without dead neurons."""
+    torch.manual_seed(0)
+    sae = hypothesaes.SparseAutoencoder(16, 64, 2, aux_k=8, dead_neuron_threshold_steps=10)
+    x = torch.randn(32, 16)
+    pre_act = sae.encoder(x - sae.input_bias) + sae.neuron_bias
+    for n_dead in (20, 5):  # more and fewer dead neurons than aux_k
+        dead = torch.randperm(64)[:n_dead]
+        sae.steps_since_activation.zero_()
+        sae.steps_since_activation[dead] = 11
+        aux_idx, aux_vals = sae._dead_topk(pre_act)
+        masked = pre_act.masked_fill(sae.steps_since_activation <= 10, float("-inf"))
+        ref_vals, ref_idx = torch.topk(masked, min(8, n_dead), dim=-1)
+        assert torch.equal(aux_idx, ref_idx) and torch.equal(aux_vals, F.relu(ref_vals))
+
+    # The aux term is added only in training mode with dead neurons
+    for training, n_dead in ((True, 20), (True, 0), (False, 20)):
+        sae.train(training)
+        sae.steps_since_activation.zero_()
+        sae.steps_since_activation[:n_dead] = 11
+        recon, info = sae(x)
+        has_aux = not torch.equal(sae.compute_loss(x, recon, info, aux_coef=1.0, multi_coef=0.0),
+                                  sae.compute_loss(x, recon, info, aux_coef=0.0, multi_coef=0.0))
+        assert has_aux == (training and n_dead > 0) == (info["aux_indices"] is not None)
+
+def test_matryoshka_prefix_reconstructions():
+    """Test incremental prefix reconstructions (and their gradients) against decoding each prefix from scratch."""
+    x = torch.randn(32, 16, generator=torch.Generator().manual_seed(0))
+    for use_sparse_decode in (False, True):
+        torch.manual_seed(0)
+        sae = hypothesaes.SparseAutoencoder(16, 64, 8, prefix_lengths=[4, 16, 64], sparse_decode=use_sparse_decode)
+        recon, info = sae(x)
+        topk_vals = info["topk_values"]
+        z = torch.zeros(32, 64).scatter(1, info["topk_indices"], topk_vals)
+        weight = sae.decoder.weight
+        for m, prefix_recon in zip([4, 16, 64], sae._prefix_reconstructions(info, recon)):
+            expected = z[:, :m] @ weight[:, :m].t() + sae.input_bias
+            assert torch.allclose(prefix_recon, expected, atol=1e-5)
+            probe = torch.randn(32, 16, generator=torch.Generator().manual_seed(m))
+            grads = torch.autograd.grad((prefix_recon * probe).sum(), (weight, topk_vals, sae.input_bias), retain_graph=True)
+            expected_grads = torch.autograd.grad((expected * probe).sum(), (weight, topk_vals, sae.input_bias), retain_graph=True)
+            for grad, expected_grad in zip(grads, expected_grads):
+                assert torch.allclose(grad, expected_grad, atol=1e-5)
+
+def test_sparse_activation_formats(test_data):
+    """Test that sparse activation formats match the dense activations."""
+    embeddings = test_data["local_embeddings"]
+    sae_small = train_sae(embeddings=embeddings, M=2, K=1, n_epochs=3)
+    sae_large = train_sae(embeddings=embeddings, M=4, K=2, n_epochs=3)
+
+    dense = get_multiple_sae_activations([sae_small, sae_large], embeddings, show_progress=False)
+    for output_format in ["csr", "csc"]:
+        sparse = get_multiple_sae_activations([sae_small, sae_large], embeddings, show_progress=False, output_format=output_format)
+        assert np.allclose(sparse.toarray(), dense)
+
+    topk = get_multiple_sae_activations([sae_small, sae_large], embeddings, show_progress=False, output_format="topk")
+    topk_indices, topk_values = topk
+    assert topk_indices.shape == topk_values.shape == (len(ALL_SENTENCES), 3)
+    topk_dense = np.zeros_like(dense)
+    np.put_along_axis(topk_dense, topk_indices, topk_values, axis=1)
+    assert np.allclose(topk_dense, dense)
+
+    # The width travels with the top-K tuple, even if the last neurons never fire
+    never_fire = (topk_indices, np.where(topk_indices == 5, 0, topk_values).astype(np.float32))
+    never_fire_values = never_fire[1].copy()
+    masked = np.where(np.arange(6) == 5, 0, dense)
+    assert get_num_neurons(topk) == 6 and to_neuron_major(topk).shape == (len(ALL_SENTENCES), 6)
+    with pytest.raises(ValueError):
+        get_num_neurons(never_fire)
+    assert np.allclose(to_neuron_major(never_fire, n_neurons=6).toarray(), masked)
+    assert np.allclose(to_neuron_major(TopKActivations(*never_fire, 6)).toarray(), masked)
+    assert np.array_equal(never_fire[1], never_fire_values)  # converting leaves the input untouched
+    indices, _ = hypothesaes.select_neurons(topk, np.array(test_data["labels"]), n_select=6, method="correlation")
+    assert sorted(indices) == list(range(6))
+
+def test_select_neurons_sparse_inputs(test_data):
+    """Test that LASSO selection picks the same neurons and signs from dense and top-K activations."""
+    embeddings = test_data["local_embeddings"]
+    torch.manual_seed(0)
+    sae = train_sae(embeddings=embeddings, M=16, K=8, n_epochs=5)
+    dense = sae.get_activations(embeddings, show_progress=False)
+    topk = sae.get_activations(embeddings, show_progress=False, output_format="topk")
+    labels = np.array(test_data["labels"])
+    for classification in (False, True):
+        selections = [
+            hypothesaes.select_neurons(activations, labels, n_select=5, method="lasso", classification=classification)
+            for activations in (dense, topk)
+        ]
+        (dense_indices, dense_coefs), (topk_indices, topk_coefs) = selections
+        assert dense_indices == topk_indices
+        assert np.array_equal(np.sign(dense_coefs), np.sign(topk_coefs))
+        assert np.allclose(dense_coefs, topk_coefs, atol=1e-3)
+
+def test_activation_cache(test_data, tmp_path, monkeypatch):
+    """Test that cached activations match recomputed ones and are keyed by the SAE weights."""
+    embeddings = test_data["local_embeddings"]
+    sae = train_sae(embeddings=embeddings, M=4, K=2, n_epochs=3)
+    cache = ActivationCache(str(tmp_path))
+
+    expected = get_multiple_sae_activations(sae, embeddings, show_progress=False)
+    first, _ = get_cached_sae_activations(sae, embeddings, cache=cache, show_progress=False)
+    cached, neuron_source_sae_info = get_cached_sae_activations(sae, embeddings, cache=cache, show_progress=False)
+    assert np.array_equal(first, expected) and np.array_equal(cached, expected)
+    assert neuron_source_sae_info == [(4, 2)] * 4
+    assert len(os.listdir(tmp_path)) == 1
+
+    with torch.no_grad():
+        sae.neuron_bias += 1.0
+    _ = get_cached_sae_activations(sae, embeddings, cache=cache, show_progress=False)
+    assert len(os.listdir(tmp_path)) == 2
+
+    # The quickstart functions cache only when asked to, and then store top-K entries
+    monkeypatch.setattr(hypothesaes.activation_cache, "ACTIVATION_CACHE_DIR", str(tmp_path / "quickstart"))
+    _get_activations(sae, embeddings, cache_activations=False)
+    assert not os.path.exists(tmp_path / "quickstart")
+    activations, _ = _get_activations(sae, embeddings, cache_activations=True)
+    assert np.allclose(activations.toarray(), get_multiple_sae_activations(sae, embeddings, show_progress=False))
+    (entry,) = os.listdir(tmp_path / "quickstart")
+    assert sorted(os.listdir(tmp_path / "quickstart" / entry)) == ["meta.json", "topk_indices.npy", "topk_values.npy"]
+
 def test_interpret_sae(test_data):
     """Test interpreting neurons from trained SAEs."""
     sentences = test_data["sentences"]